@@ -0,0 +1,116 @@
+# Compares wall clock time of batch job with random and prefix order of finite sampler. Dataset has groups of rows
+# sharing long system prompt and few rows with long output. Mock server keeps only few prefixes in its simulated prefix
+# cache like real server with limited kv cache, so random order keeps evicting them and long outputs sampled late
+# stretch end of batch
+#
+#   python -m benchmarks.batch_order --groups 32 --rows_per_group 32
+import sys
+import json
+import random
+import argparse
+import tempfile
+import subprocess
+
+from pathlib import Path
+from benchmarks.harness_overhead import wait_for_port
+
+
+def build_dataset(path: Path, arguments: argparse.Namespace) -> None:
+    rng = random.Random(arguments.seed)
+    rows = []
+    for group in range(arguments.groups):
+        system_prompt = f"group {group} " + " ".join(rng.choices(["policy", "example", "answer", "context", "rule"], k=arguments.prefix_words))
+        for index in range(arguments.rows_per_group):
+            long_output = rng.random() < arguments.long_fraction
+            rows.append({
+                "custom_id": len(rows),
+                "body": {
+                    "messages": [
+                        {"role": "system", "content": system_prompt},
+                        {"role": "user", "content": f"question {index}"}
+                    ],
+                    "max_tokens": arguments.long_tokens if long_output else arguments.short_tokens
+                }
+            })
+    # input in order of arrival, groups are interleaved
+    rng.shuffle(rows)
+    with open(path, "w", encoding="utf-8") as file:
+        for row in rows:
+            file.write(json.dumps(row) + "\n")
+
+
+def run(order: str, dataset: Path, summary_path: Path, arguments: argparse.Namespace) -> dict:
+    subprocess.run([
+        sys.executable, "-m", "strawberry",
+        "--run_name_prefix", f"batch_order_{order}",
+        "--prometheus_port", str(arguments.prometheus_port),
+        "--openai_base_url", f"http://127.0.0.1:{arguments.port}/v1",
+        "--model_name", "mock",
+        "--requester", "openai_raw",
+        "--mode", "batch",
+        "--max_users", str(arguments.concurrency),
+        "--batch_initial_users", str(arguments.concurrency),
+        "--batch_min_users", str(arguments.concurrency),
+        "--run_time", "3600",
+        "--input", "local",
+        "--input_local_path", str(dataset),
+        "--sampler", "finite",
+        "--order", order,
+        "--summary_path", str(summary_path),
+    ], check=True, stdout=subprocess.DEVNULL)
+    with open(summary_path, "r", encoding="utf-8") as file:
+        return json.load(file)
+
+
+def main(arguments: argparse.Namespace) -> None:
+    with tempfile.TemporaryDirectory() as directory:
+        dataset = Path(directory) / "dataset.jsonl"
+        build_dataset(dataset, arguments)
+        print(f"{'order':>8}{'wall clock s':>14}{'TTFT p50 s':>12}{'TTFT p99 s':>12}{'requests/s':>12}", flush=True)
+        durations = {}
+        for order in ("random", "prefix"):
+            # fresh server so both orders start with empty prefix cache
+            server = subprocess.Popen([
+                sys.executable, "-m", "strawberry.mock_server",
+                "--host", "127.0.0.1",
+                "--port", str(arguments.port),
+                "--prefill_delay", str(arguments.prefill_delay),
+                "--prefill_delay_per_token", str(arguments.prefill_delay_per_token),
+                "--token_delay", str(arguments.token_delay),
+                "--output_tokens", str(arguments.long_tokens),
+                "--prefix_cache_entries", str(arguments.prefix_cache_entries),
+            ], stderr=subprocess.DEVNULL)
+            try:
+                wait_for_port(arguments.port)
+                summary = run(order, dataset, Path(directory) / f"summary_{order}.json", arguments)
+            finally:
+                server.terminate()
+                server.wait()
+            ttft = summary["latency_seconds"]["time_to_first_token"]
+            durations[order] = summary["duration_seconds"]
+            print(
+                f"{order:>8}{summary['duration_seconds']:>14.2f}{ttft['p50']:>12.3f}{ttft['p99']:>12.3f}"
+                f"{summary['throughput']['requests_per_second']:>12.1f}",
+                flush=True
+            )
+        print(f"prefix order takes {durations['prefix'] / durations['random']:.0%} of wall clock time of random order")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--groups", type=int, required=False, default=32)
+    parser.add_argument("--rows_per_group", type=int, required=False, default=32)
+    parser.add_argument("--prefix_words", type=int, required=False, default=2000)
+    parser.add_argument("--long_fraction", type=float, required=False, default=0.02)
+    parser.add_argument("--short_tokens", type=int, required=False, default=16)
+    parser.add_argument("--long_tokens", type=int, required=False, default=1024)
+    parser.add_argument("--concurrency", type=int, required=False, default=16)
+    parser.add_argument("--prefill_delay", type=float, required=False, default=0.01)
+    parser.add_argument("--prefill_delay_per_token", type=float, required=False, default=0.0001)
+    parser.add_argument("--token_delay", type=float, required=False, default=0.005)
+    parser.add_argument("--prefix_cache_entries", type=int, required=False, default=4)
+    parser.add_argument("--seed", type=int, required=False, default=0)
+    parser.add_argument("--port", type=int, required=False, default=18766)
+    parser.add_argument("--prometheus_port", type=int, required=False, default=18767)
+    arguments = parser.parse_args()
+    main(arguments)
@@ -0,0 +1,115 @@
+# Measures how much of reported TTFT and TPOT is added by strawberry itself. Requesters are driven at increasing
+# concurrency against local mock server with known prefill and per token delays, everything above them is client
+# overhead together with loopback network. Client cpu time gives chunks per second one core can sustain
+#
+#   python -m benchmarks.harness_overhead --concurrency 1 8 32 128 512
+import sys
+import time
+import socket
+import asyncio
+import argparse
+import subprocess
+
+from strawberry.recorder import percentile
+from strawberry.prometheus import Prometheus
+from strawberry.requester import Requester, RawRequester, SglangRequester
+
+
+def wait_for_port(port: int, timeout: float = 10.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.1).close()
+            return
+        except OSError:
+            time.sleep(0.05)
+    raise RuntimeError(f"Mock server did not start on port {port}")
+
+
+def build_requester(name: str, prometheus: Prometheus, port: int, concurrency: int):
+    options = dict(max_connections=concurrency, max_keepalive_connections=concurrency)
+    if name == "openai":
+        return Requester(prometheus=prometheus, base_url=f"http://127.0.0.1:{port}/v1", api_key="token", model_name="mock")
+    elif name == "openai_raw":
+        return RawRequester(prometheus=prometheus, base_url=f"http://127.0.0.1:{port}/v1", api_key="token", model_name="mock", **options)
+    elif name == "sglang":
+        return SglangRequester(prometheus=prometheus, base_url=f"http://127.0.0.1:{port}", api_key="token", model_name="mock", **options)
+    raise ValueError("Unknown requester, openai, openai_raw, sglang are supported")
+
+
+def build_request(name: str, custom_id: int, output_tokens: int) -> dict:
+    if name == "sglang":
+        return {"custom_id": custom_id, "body": {"text": "benchmark prompt", "sampling_params": {"max_new_tokens": output_tokens}}}
+    return {"custom_id": custom_id, "body": {"messages": [{"role": "user", "content": "benchmark prompt"}], "max_tokens": output_tokens}}
+
+
+async def measure(name: str, concurrency: int, arguments: argparse.Namespace, prometheus: Prometheus) -> None:
+    requester = build_requester(name, prometheus, arguments.port, concurrency)
+    remaining = iter(range(arguments.requests_per_user * concurrency))
+
+    async def user() -> None:
+        for custom_id in remaining:
+            response = await requester.request(build_request(name, custom_id, arguments.output_tokens))
+            assert response["status_code"] == 200, response
+
+    # warmup opens connections
+    await asyncio.gather(*(requester.request(build_request(name, -1, 1)) for _ in range(concurrency)))
+    prometheus.set_run(f"{name}_{concurrency}")
+    recorder = prometheus.recorder
+
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+    await asyncio.gather(*(user() for _ in range(concurrency)))
+    wall = time.perf_counter() - wall_start
+    cpu = time.process_time() - cpu_start
+    await requester.close()
+
+    ttft = sorted(value - arguments.prefill_delay for value in recorder.samples("time_to_first_token"))
+    tpot = sorted(value - arguments.token_delay for value in recorder.samples("inter_chunk_latency"))
+    chunks = len(ttft) + len(tpot)
+    print(
+        f"{name:>12}{concurrency:>8}{percentile(ttft, 50) * 1e3:>12.2f}{percentile(ttft, 99) * 1e3:>12.2f}"
+        f"{percentile(tpot, 50) * 1e3:>12.2f}{percentile(tpot, 99) * 1e3:>12.2f}"
+        f"{chunks / wall:>14.0f}{chunks / cpu:>14.0f}{cpu / wall:>8.0%}",
+        flush=True
+    )
+
+
+async def main(arguments: argparse.Namespace) -> None:
+    prometheus = Prometheus(run="harness_overhead", prometheus_port=None)
+    print(
+        f"{'requester':>12}{'users':>8}{'TTFT p50':>12}{'TTFT p99':>12}{'TPOT p50':>12}{'TPOT p99':>12}"
+        f"{'chunks/s':>14}{'chunks/cpu s':>14}{'cpu':>8}"
+    )
+    print(f"{'':>20}{'overhead in milliseconds':^48}")
+    for name in arguments.requesters:
+        for concurrency in arguments.concurrency:
+            await measure(name, concurrency, arguments, prometheus)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requesters", type=str, nargs="+", required=False, default=["openai", "openai_raw", "sglang"])
+    parser.add_argument("--concurrency", type=int, nargs="+", required=False, default=[1, 8, 32, 128])
+    parser.add_argument("--requests_per_user", type=int, required=False, default=16)
+    parser.add_argument("--output_tokens", type=int, required=False, default=64)
+    parser.add_argument("--prefill_delay", type=float, required=False, default=0.05)
+    parser.add_argument("--token_delay", type=float, required=False, default=0.005)
+    parser.add_argument("--port", type=int, required=False, default=18765)
+    arguments = parser.parse_args()
+
+    # server runs in separate process so its work is not counted as client overhead
+    server = subprocess.Popen([
+        sys.executable, "-m", "strawberry.mock_server",
+        "--host", "127.0.0.1",
+        "--port", str(arguments.port),
+        "--prefill_delay", str(arguments.prefill_delay),
+        "--token_delay", str(arguments.token_delay),
+        "--output_tokens", str(arguments.output_tokens),
+    ])
+    try:
+        wait_for_port(arguments.port)
+        asyncio.run(main(arguments))
+    finally:
+        server.terminate()
+        server.wait()
@@ -0,0 +1,91 @@
+# Compares client side cost per streamed chunk of openai sdk Requester and RawRequester.
+# Both requesters read same canned server sent events from in memory transport so only parsing and metrics are measured
+#
+#   python -m benchmarks.requester_overhead --chunks 512 --requests 200
+import time
+import json
+import httpx
+import asyncio
+import argparse
+
+from strawberry.prometheus import Prometheus
+from strawberry.requester import Requester, RawRequester
+
+
+def build_stream(chunks: int) -> bytes:
+    events = []
+    for i in range(chunks):
+        delta = {"role": "assistant", "content": "token"} if i == 0 else {"content": " token"}
+        events.append({
+            "id": "chatcmpl-benchmark",
+            "object": "chat.completion.chunk",
+            "created": 0,
+            "model": "benchmark",
+            "choices": [{"index": 0, "delta": delta, "logprobs": None, "finish_reason": None}]
+        })
+    events.append({
+        "id": "chatcmpl-benchmark",
+        "object": "chat.completion.chunk",
+        "created": 0,
+        "model": "benchmark",
+        "choices": [],
+        "usage": {"prompt_tokens": 16, "completion_tokens": chunks, "total_tokens": 16 + chunks}
+    })
+    body = "".join(f"data: {json.dumps(event)}\n\n" for event in events) + "data: [DONE]\n\n"
+    return body.encode("utf-8")
+
+
+async def measure(name: str, requester, requests: int, chunks: int) -> None:
+    request = {"custom_id": 0, "body": {"messages": [{"role": "user", "content": "benchmark"}]}}
+    # warmup
+    await requester.request(request)
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+    for _ in range(requests):
+        response = await requester.request(request)
+        assert response["status_code"] == 200, response
+    wall = time.perf_counter() - wall_start
+    cpu = time.process_time() - cpu_start
+    total_chunks = requests * chunks
+    print(
+        f"{name:>12} | {wall / total_chunks * 1e6:8.2f} us/chunk wall | {cpu / total_chunks * 1e6:8.2f} us/chunk cpu | "
+        f"{total_chunks / cpu:12.0f} chunks/s per core"
+    )
+    await requester.close()
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chunks", type=int, required=False, default=512)
+    parser.add_argument("--requests", type=int, required=False, default=200)
+    arguments = parser.parse_args()
+
+    stream = build_stream(arguments.chunks)
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(200, headers={"content-type": "text/event-stream"}, content=stream)
+
+    prometheus = Prometheus(run="requester_overhead", prometheus_port=None)
+    base_url = "http://benchmark/v1"
+
+    sdk = Requester(
+        prometheus=prometheus,
+        base_url=base_url,
+        api_key="token",
+        model_name="benchmark",
+        http_client=httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    )
+    raw = RawRequester(
+        prometheus=prometheus,
+        base_url=base_url,
+        api_key="token",
+        model_name="benchmark",
+        http_client=httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    )
+
+    await measure("openai", sdk, arguments.requests, arguments.chunks)
+    await measure("openai_raw", raw, arguments.requests, arguments.chunks)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,231 @@
+import argparse
+
+from pathlib import Path
+
+
+def parse_arguments(argv: list[str] | None = None) -> argparse.Namespace:
+    # argv is None for command line, distributed agents parse argv sent by coordinator
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument("--run_name_prefix", type=str, required=True)
+
+    parser.add_argument("--max_users", type=int, required=False, default=8)
+    parser.add_argument("--wait_start", type=int, required=False, default=1)
+    parser.add_argument("--wait_end", type=int, required=False, default=4)
+    parser.add_argument("--spawn_rate", type=float, required=False, default=1) # rate to spawn, users per second. 0.1 means 0.1 user per second, 1 user once in 10 seconds
+    parser.add_argument("--run_time", type=int, required=False, default=128)
+    parser.add_argument("--prometheus_port", type=int, required=True)
+    # metrics are also pushed to pushgateway this often and once more when run finishes, so short runs are not lost
+    # between scrapes
+    parser.add_argument("--push_gateway", type=str, required=False, help="Pushgateway address for example pushgateway:9091")
+    parser.add_argument("--push_interval", type=float, required=False, default=0.5) # seconds
+
+    # closed mode keeps max_users users each waiting for response, open mode sends requests on arrival schedule
+    # and trace mode on timestamps of trace, both with at most max_users requests in flight
+    parser.add_argument("--mode", type=str, required=False, default="closed")
+    parser.add_argument("--arrival", type=str, required=False, default="poisson")
+    parser.add_argument("--arrival_rate", type=float, required=False) # requests per second
+    parser.add_argument(
+        "--arrival_curve_path",
+        type=Path,
+        required=False,
+        help="JSON list of [seconds, requests per second] points, rate is interpolated between them"
+    )
+    parser.add_argument("--arrival_curve_poisson", action="store_true", required=False, default=False)
+
+    # trace mode replays rows of trace sampler at their original offsets, rows must be sorted by timestamp field which
+    # holds unix seconds or iso 8601 time. Speedup of 2 replays hour of trace in 30 minutes
+    parser.add_argument("--trace_timestamp_field", type=str, required=False, default="timestamp")
+    parser.add_argument("--trace_speedup", type=float, required=False, default=1.0)
+
+    # batch mode processes finite dataset, limit of requests in flight starts at --batch_initial_users and moves
+    # between --batch_min_users and --batch_max_users. It is cut by --batch_decrease factor when server answers with
+    # 429, 502, 503, 504 or TTFT p90 is above --batch_ttft_target, otherwise it grows by one every control interval
+    parser.add_argument("--batch_initial_users", type=int, required=False, default=8)
+    parser.add_argument("--batch_min_users", type=int, required=False, default=1)
+    parser.add_argument("--batch_max_users", type=int, required=False, default=1024)
+    parser.add_argument("--batch_decrease", type=float, required=False, default=0.5)
+    parser.add_argument("--batch_ttft_target", type=float, required=False) # seconds
+    parser.add_argument("--batch_control_interval", type=float, required=False, default=1.0) # seconds
+    # requests failed with those codes are sent again after exponential backoff
+    parser.add_argument("--max_retries", type=int, required=False, default=8)
+    parser.add_argument("--retry_backoff", type=float, required=False, default=1.0) # seconds, doubled on every attempt
+
+    parser.add_argument(
+        "--openai_base_url",
+        type=str,
+        required=True,
+        help="OpenAI base url for example http://localhost:8000/v1"
+    )
+
+    parser.add_argument(
+        "--token",
+        type=str,
+        required=False,
+        default="token",
+        help="Token if not set will be set to token"
+    )
+    
+    parser.add_argument(
+        "--model_name",
+        type=str,
+        required=True,
+        help="Model name to be used while sending requests"
+    )
+
+    # every sampled row starts conversation of this many turns, history with replies of model is sent on every turn.
+    # Next user messages come from "turns" list of row or --session_follow_up. Users think between turns
+    parser.add_argument("--session_turns", type=int, required=False, default=1)
+    parser.add_argument("--think_time_start", type=float, required=False, default=1.0)
+    parser.add_argument("--think_time_end", type=float, required=False, default=4.0)
+    parser.add_argument("--session_follow_up", type=str, required=False, default="Continue")
+
+    parser.add_argument("--requester", type=str, required=False, default="openai", help="openai, openai_raw or sglang")
+
+    # json list of serving targets like [{"name": "vllm", "openai_base_url": "http://vllm:8000/v1"}, ...], every endpoint
+    # overrides any of openai_base_url, model_name, token, requester and http arguments and has weight, 1 by default.
+    # --routing spreads requests between endpoints, mirror sends every request to all of them for A/B comparison and
+    # split sends every request to one endpoint chosen by hash of custom_id. Metrics are labelled with endpoint name
+    parser.add_argument("--endpoints", type=Path, required=False)
+    parser.add_argument(
+        "--routing",
+        type=str,
+        required=False,
+        default="round_robin",
+        help="round_robin, least_outstanding, weighted, mirror or split"
+    )
+
+    # connection pool of openai_raw and sglang requesters
+    parser.add_argument("--http_max_connections", type=int, required=False, default=1024)
+    parser.add_argument("--http_max_keepalive_connections", type=int, required=False, default=256)
+    parser.add_argument("--http_keepalive_expiry", type=float, required=False, default=60.0)
+    parser.add_argument("--http2", action="store_true", required=False, default=False)
+    parser.add_argument(
+        "--measure_connection_time",
+        action="store_true",
+        required=False,
+        default=False,
+        help="Report connection setup time as connection_time_seconds and exclude it from prefill time"
+    )
+
+    parser.add_argument("--input", type=str, required=True)
+
+    parser.add_argument("--input_local_path", type=Path, required=False)
+    parser.add_argument(
+        "--input_index_path",
+        type=Path,
+        required=False,
+        help="Where local_mmap input caches line offsets, defaults to input path with .idx suffix"
+    )
+
+    # s3 input is streamed, path is single object or prefix of several objects, .gz and .zst objects are decompressed
+    parser.add_argument("--input_s3_path", type=str, required=False)
+    parser.add_argument("--input_s3_bucket", type=str, required=False)
+    parser.add_argument("--input_s3_aws_access_key_id", type=str, required=False)
+    parser.add_argument("--input_s3_aws_secret_access_key", type=str, required=False)
+    parser.add_argument("--input_s3_endpoint_url", type=str, required=False)
+    parser.add_argument("--input_s3_region_name", type=str, required=False)
+    parser.add_argument("--input_s3_chunk_size_mb", type=int, required=False, default=8)
+    parser.add_argument("--input_s3_prefetch", type=int, required=False, default=4)
+
+    parser.add_argument("--output", type=str, required=False)
+
+    parser.add_argument("--output_local_path", type=Path, required=False)
+
+    # local_sharded and s3_sharded outputs write responses to jsonl shards of this size
+    # local_sharded fsyncs shards and index of processed ids this often
+    parser.add_argument("--output_shard_size_mb", type=int, required=False, default=256)
+    parser.add_argument("--output_fsync_interval", type=float, required=False, default=5.0)
+
+    parser.add_argument("--output_s3_path", type=str, required=False)
+    parser.add_argument("--output_s3_bucket", type=str, required=False)
+    parser.add_argument("--output_s3_aws_access_key_id", type=str, required=False)
+    parser.add_argument("--output_s3_aws_secret_access_key", type=str, required=False)
+    parser.add_argument("--output_s3_endpoint_url", type=str, required=False)
+    parser.add_argument("--output_s3_region_name", type=str, required=False)
+
+    # s3_sharded output uploads shard once it reaches --output_shard_size_mb or is open this many seconds
+    parser.add_argument("--output_shard_interval", type=float, required=False, default=60.0)
+    parser.add_argument("--output_upload_concurrency", type=int, required=False, default=4)
+    # failed shard uploads are retried this many times with exponential backoff, run fails once shard can not be stored
+    parser.add_argument("--output_upload_retries", type=int, required=False, default=5)
+    parser.add_argument("--output_codec", type=str, required=False, help="gzip or zstd to compress s3_sharded shards")
+
+    parser.add_argument("--sampler", type=str, required=False)
+    # requests with temperature 0 and same model and body are sent once, their responses are stored in sqlite file and
+    # reused for other custom ids. Least recently used responses are evicted above size limit
+    parser.add_argument("--response_cache_path", type=Path, required=False)
+    parser.add_argument("--response_cache_size_mb", type=int, required=False, default=1024)
+    # json list of workloads mixed in one run like [{"name": "chat", "weight": 0.7, "input_local_path": "chat.jsonl"}, ...],
+    # every workload overrides any of input, sampler, wait and arrival arguments. Weight is share of users in closed mode
+    # and share of --arrival_rate in open mode. Metrics of requests are labelled with workload name
+    parser.add_argument("--workloads", type=Path, required=False)
+    parser.add_argument("--overwrite", action="store_true", required=False, default=False)
+    parser.add_argument(
+        "--shuffle_buffer_size",
+        type=int,
+        required=False,
+        default=1024,
+        help="Finite sampler draws streamed input randomly from buffer of this many rows"
+    )
+    # order of finite sampler, random for load tests. Prefix order is for batch jobs, rows with same system prompt or
+    # few shot prefix are sent together so server reuses its prefix cache and rows with long expected output go first.
+    # Streamed input is ordered within --shuffle_buffer_size window
+    parser.add_argument("--order", type=str, required=False, default="random")
+
+    # number of processes to send requests from, users and dataset rows are split between them
+    parser.add_argument("--workers", type=int, required=False, default=1)
+
+    # comma separated host:port of agents started with python -m strawberry.distributed on other machines, when set
+    # this process only coordinates, every agent sends its share of load and their latencies are merged into one summary
+    parser.add_argument("--agents", type=str, required=False)
+    parser.add_argument(
+        "--agents_start_delay",
+        type=float,
+        required=False,
+        default=2.0,
+        help="Seconds between all agents being ready and common start time, covers network delay and clock skew"
+    )
+
+    parser.add_argument("--summary_path", type=Path, required=False, help="Where to write summary of run as JSON")
+
+    # only requests started in steady state are measured. Warmup lasts --warmup_time seconds and until --warmup_requests
+    # requests completed, steady state ends --cooldown_time seconds before end of run or after --steady_requests requests
+    parser.add_argument("--warmup_time", type=float, required=False, default=0.0)
+    parser.add_argument("--warmup_requests", type=int, required=False, default=0)
+    parser.add_argument("--cooldown_time", type=float, required=False, default=0.0)
+    parser.add_argument("--steady_requests", type=int, required=False)
+    parser.add_argument(
+        "--lag_threshold",
+        type=float,
+        required=False,
+        default=0.05,
+        help="Event loop lag in seconds above which client is saturated and run is marked as not trustworthy"
+    )
+
+    # sweep repeats run at growing max_users in closed mode or arrival_rate in open mode, every step lasts --run_time,
+    # step mode walks from start to stop, bisect mode searches between them with step as resolution. Sweep stops on slo breach
+    parser.add_argument("--sweep", type=str, required=False, help="step or bisect")
+    parser.add_argument("--sweep_start", type=float, required=False)
+    parser.add_argument("--sweep_stop", type=float, required=False)
+    parser.add_argument("--sweep_step", type=float, required=False)
+    parser.add_argument("--sweep_path", type=Path, required=False, help="Where to write throughput latency curve of sweep as JSON")
+    parser.add_argument("--slo_ttft_p99", type=float, required=False) # seconds
+    parser.add_argument("--slo_tpot_p99", type=float, required=False) # seconds
+    parser.add_argument("--slo_error_rate", type=float, required=False) # fraction, 0.01 means 1%
+
+    # goodput counts successful requests whose ttft and tpot are within these targets, not set target is not checked
+    parser.add_argument("--goodput_ttft", type=float, required=False) # seconds
+    parser.add_argument("--goodput_tpot", type=float, required=False) # seconds
+
+    # row per request with timestamps, tokens and status code, parquet when pyarrow is installed otherwise csv
+    parser.add_argument("--timeline_path", type=Path, required=False)
+    parser.add_argument(
+        "--timeline_gaps",
+        action="store_true",
+        required=False,
+        default=False,
+        help="Also keep gaps between all chunks of every request in timeline"
+    )
+
+    return parser.parse_args(argv)
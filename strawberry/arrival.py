@@ -0,0 +1,100 @@
+import json
+import math
+import random
+
+from pathlib import Path
+from abc import ABC, abstractmethod
+
+
+class Arrival(ABC):
+    @abstractmethod
+    def next_time(self, previous_time: float) -> float:
+        # returns offset in seconds from run start for the next request given offset of previous one
+        ...
+
+
+class ConstantArrival(Arrival):
+    def __init__(self, rate: float) -> None:
+        if rate <= 0:
+            raise ValueError("Arrival rate must be positive")
+        self._interval = 1.0 / rate
+
+    def next_time(self, previous_time: float) -> float:
+        return previous_time + self._interval
+
+
+class PoissonArrival(Arrival):
+    def __init__(self, rate: float) -> None:
+        if rate <= 0:
+            raise ValueError("Arrival rate must be positive")
+        self._rate = rate
+
+    def next_time(self, previous_time: float) -> float:
+        return previous_time + random.expovariate(self._rate)
+
+
+class CurveArrival(Arrival):
+    # rate curve is list of [seconds, requests per second] points, rate is linearly interpolated between points
+    # and stays at last value after last point
+    def __init__(self, points: list[tuple[float, float]], poisson: bool, scale: float = 1.0) -> None:
+        if len(points) == 0:
+            raise ValueError("Arrival curve must contain at least one point")
+        self._points = sorted((float(t), float(r) * scale) for t, r in points)
+        if any(rate < 0 for _, rate in self._points):
+            raise ValueError("Arrival curve rates must be non negative")
+        self._max_rate = max(rate for _, rate in self._points)
+        if self._max_rate <= 0:
+            raise ValueError("Arrival curve must have at least one positive rate")
+        self._poisson = poisson
+
+    @classmethod
+    def from_file(cls, path: Path, poisson: bool, scale: float = 1.0) -> "CurveArrival":
+        with open(path, "r", encoding="utf-8") as file:
+            return cls(points=json.load(file), poisson=poisson, scale=scale)
+
+    def rate(self, time: float) -> float:
+        if time <= self._points[0][0]:
+            return self._points[0][1]
+        for (left_time, left_rate), (right_time, right_rate) in zip(self._points, self._points[1:]):
+            if time < right_time:
+                fraction = (time - left_time) / (right_time - left_time)
+                return left_rate + fraction * (right_rate - left_rate)
+        return self._points[-1][1]
+
+    def next_time(self, previous_time: float) -> float:
+        if self._poisson:
+            # thinning of homogeneous poisson process with max rate gives non homogeneous one
+            time = previous_time
+            while True:
+                # curve that stays at zero has no more arrivals, thinning would never accept candidate
+                if self._max_rate_after(time) <= 0:
+                    return float("inf")
+                time += random.expovariate(self._max_rate)
+                if random.random() * self._max_rate <= self.rate(time):
+                    return time
+
+        # next request is sent when integral of rate since previous one reaches 1, integral of linear segment is
+        # quadratic so it is solved in closed form segment by segment
+        time = previous_time
+        remaining = 1.0
+        for end in [t for t, _ in self._points if t > time] + [math.inf]:
+            start_rate = self.rate(time)
+            if end == math.inf or time < self._points[0][0]:
+                slope = 0.0
+            else:
+                slope = (self.rate(end) - start_rate) / (end - time)
+            if end == math.inf:
+                if start_rate <= 0:
+                    return float("inf")
+                return time + remaining / start_rate
+            length = end - time
+            area = start_rate * length + slope * length * length / 2
+            if area >= remaining:
+                # root of slope / 2 * x^2 + start_rate * x = remaining written without cancellation
+                return time + 2 * remaining / (start_rate + math.sqrt(max(0.0, start_rate * start_rate + 2 * slope * remaining)))
+            remaining -= area
+            time = end
+        return float("inf")
+
+    def _max_rate_after(self, time: float) -> float:
+        return max([self.rate(time)] + [rate for t, rate in self._points if t > time])
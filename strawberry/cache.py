@@ -0,0 +1,147 @@
+import json
+import time
+import sqlite3
+import asyncio
+import hashlib
+import concurrent.futures
+
+from pathlib import Path
+from loguru import logger
+from strawberry.prometheus import Prometheus
+from strawberry.requester import RequestMetrics
+
+
+def is_deterministic(body: dict) -> bool:
+    # greedy decoding gives same response to same request, only such requests are cached
+    sampling_params = body.get("sampling_params") or {}
+    return body.get("temperature", sampling_params.get("temperature")) == 0
+
+
+class ResponseCache:
+    # responses on disk keyed by hash of model name and canonical request body, least recently used responses are
+    # evicted when total size is above max_size bytes. Sqlite is used from one background thread so requests are not
+    # blocked by disk and operations run in order they were submitted
+    def __init__(self, path: Path, max_size: int) -> None:
+        self._path = path
+        self._max_size = max_size
+        self._size = 0
+        self._connection = None
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="strawberry-cache")
+        self._executor.submit(self._open).add_done_callback(self._on_done)
+
+    @staticmethod
+    def key(model_name: str, body: dict) -> str:
+        canonical = json.dumps({"model": model_name, "body": body}, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+        return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+    async def get(self, key: str) -> dict | None:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, self._get, key)
+
+    def put(self, key: str, response: dict) -> None:
+        self._executor.submit(self._put, key, json.dumps(response).encode("utf-8")).add_done_callback(self._on_done)
+
+    async def close(self) -> None:
+        self._executor.submit(self._close).add_done_callback(self._on_done)
+        await asyncio.to_thread(self._executor.shutdown, wait=True)
+
+    def _on_done(self, future: concurrent.futures.Future) -> None:
+        if future.exception() is not None:
+            logger.error(f"Response cache {self._path} failed: {future.exception()}")
+
+    def _open(self) -> None:
+        # several worker processes can share one cache file, wal lets them read while one of them writes
+        self._connection = sqlite3.connect(self._path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, value BLOB, size INTEGER, last_access REAL)")
+        self._connection.execute("CREATE INDEX IF NOT EXISTS responses_last_access ON responses (last_access)")
+        count, size = self._connection.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        self._size = size
+        logger.info(f"Response cache {self._path} has {count} responses of {size / 1024 / 1024:.1f} MB")
+
+    def _get(self, key: str) -> dict | None:
+        row = self._connection.execute("SELECT value FROM responses WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        self._connection.execute("UPDATE responses SET last_access = ? WHERE key = ?", (time.time(), key))
+        return json.loads(row[0])
+
+    def _put(self, key: str, value: bytes) -> None:
+        previous = self._connection.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+        self._connection.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?)", (key, value, len(value), time.time()))
+        self._size += len(value) - (previous[0] if previous is not None else 0)
+        if self._size > self._max_size:
+            self._evict()
+
+    def _evict(self) -> None:
+        # removes least recently used responses until cache takes 90% of max size so eviction does not run on every put
+        evicted = 0
+        for key, size in self._connection.execute("SELECT key, size FROM responses ORDER BY last_access").fetchall():
+            if self._size <= self._max_size * 0.9:
+                break
+            self._connection.execute("DELETE FROM responses WHERE key = ?", (key,))
+            self._size -= size
+            evicted += 1
+        logger.debug(f"Evicted {evicted} responses from cache")
+
+    def _close(self) -> None:
+        if self._connection is not None:
+            self._connection.close()
+
+
+class CachingRequester:
+    # answers deterministic requests with same model and body from cache. Request whose key is already in flight
+    # waits for that request instead of sending same one again, only successful responses are shared and cached.
+    # Wraps requester of single endpoint so key has model that is sent and hits get endpoint label. Hits go through
+    # request metrics like server responses, they are counted in totals and tagged as cached
+    def __init__(self, requester, cache: ResponseCache, model_name: str, prometheus: Prometheus) -> None:
+        self._requester = requester
+        self._cache = cache
+        self._model_name = model_name
+        self._prometheus = prometheus
+        self._in_flight: dict[str, asyncio.Future] = {}
+
+    async def close(self) -> None:
+        # cache is shared by requesters of all endpoints, run closes it
+        await self._requester.close()
+
+    async def request(self, request: dict, start_time: float | None = None, user_id: int | None = None, workload: str | None = None) -> dict:
+        if not is_deterministic(request["body"]):
+            return await self._requester.request(request, start_time=start_time, user_id=user_id, workload=workload)
+        key = ResponseCache.key(self._model_name, request["body"])
+
+        # when request in flight fails its waiters try again, one of them sends it
+        while key in self._in_flight:
+            response = await asyncio.shield(self._in_flight[key])
+            if response is not None:
+                return self._hit(request, response, start_time=start_time, user_id=user_id, workload=workload)
+
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight[key] = future
+        shared = None
+        try:
+            response = await self._cache.get(key)
+            if response is not None:
+                shared = response
+                return self._hit(request, response, start_time=start_time, user_id=user_id, workload=workload)
+            self._miss(workload)
+            response = await self._requester.request(request, start_time=start_time, user_id=user_id, workload=workload)
+            if response["status_code"] == 200:
+                shared = {name: value for name, value in response.items() if name != "custom_id"}
+                self._cache.put(key, shared)
+            return response
+        finally:
+            del self._in_flight[key]
+            future.set_result(shared)
+
+    def _hit(self, request: dict, response: dict, start_time: float | None, user_id: int | None, workload: str | None) -> dict:
+        metrics = RequestMetrics(self._prometheus, start_time=start_time, custom_id=request["custom_id"], user_id=user_id, workload=workload, cached=True)
+        metrics.status_code(response["status_code"])
+        return {"custom_id": request["custom_id"], **response}
+
+    def _miss(self, workload: str | None) -> None:
+        # counted in same phase as hits so hit rate of summary is rate of steady state
+        prometheus = self._prometheus.workload(workload) if workload is not None else self._prometheus
+        if prometheus.window is not None:
+            prometheus = prometheus.phase(prometheus.window.phase())
+        prometheus.response_cache_miss()
@@ -0,0 +1,73 @@
+import random
+
+from strawberry.recorder import percentile
+
+
+# codes of overloaded or temporarily unavailable server, requests that got them are retried
+RETRYABLE_CODES = (429, 502, 503, 504)
+
+
+class AimdController:
+    # keeps limit of requests in flight like tcp congestion window. Every interval limit grows by increase if it was
+    # reached, so server had to process that many requests at once, and is multiplied by decrease if server answered
+    # with retryable error or ttft percentile went above target. Signals are fed by every request whatever phase of
+    # measurement window it belongs to, so control does not stop while summary is not recorded
+    def __init__(
+        self,
+        min_limit: int,
+        max_limit: int,
+        initial_limit: int,
+        increase: float = 1.0,
+        decrease: float = 0.5,
+        ttft_target: float | None = None,
+        ttft_percentile: float = 90
+    ) -> None:
+        if min_limit < 1 or max_limit < min_limit:
+            raise ValueError("Concurrency limits must satisfy 1 <= min <= max")
+        if not 0 < decrease < 1:
+            raise ValueError("Decrease factor must be between 0 and 1")
+        self._min_limit = min_limit
+        self._max_limit = max_limit
+        self._limit = float(min(max(initial_limit, min_limit), max_limit))
+        self._increase = increase
+        self._decrease = decrease
+        self._ttft_target = ttft_target
+        self._ttft_percentile = ttft_percentile
+        # signals since previous update
+        self._ttft = []
+        self._errors = 0
+
+    @property
+    def limit(self) -> int:
+        return int(self._limit)
+
+    def time_to_first_token(self, latency: float) -> None:
+        self._ttft.append(latency)
+
+    def response_code(self, code: int) -> None:
+        if code in RETRYABLE_CODES:
+            self._errors += 1
+
+    def update(self, saturated: bool) -> str | None:
+        # looks at signals since previous update, returns reason when limit was decreased
+        window = sorted(self._ttft)
+        new_errors = self._errors
+        self._ttft = []
+        self._errors = 0
+
+        reason = None
+        if new_errors > 0:
+            reason = f"{int(new_errors)} retryable errors"
+        elif self._ttft_target is not None and window and percentile(window, self._ttft_percentile) > self._ttft_target:
+            reason = f"p{self._ttft_percentile:g} TTFT {percentile(window, self._ttft_percentile):.3f} s above target {self._ttft_target} s"
+
+        if reason is not None:
+            self._limit = max(self._min_limit, self._limit * self._decrease)
+        elif saturated:
+            self._limit = min(self._max_limit, self._limit + self._increase)
+        return reason
+
+
+def backoff(attempt: int, base: float, cap: float = 60.0) -> float:
+    # exponential backoff with full jitter so retried requests do not come back at once
+    return random.uniform(0, min(cap, base * 2 ** attempt))
@@ -1,14 +1,29 @@
 import os
+import gzip
 import json
+import mmap
+import zlib
+import time
+import heapq
+import datetime
+import array
 import random
+import struct
 import asyncio
+import typing
 import aioboto3
 
 from pathlib import Path
 from loguru import logger
 from abc import ABC, abstractmethod
 from aiofiles import open as aio_open
+from botocore.exceptions import ClientError
+from strawberry.controller import backoff
 
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
 
 
 class InputDataset(ABC):
@@ -17,6 +32,31 @@ class InputDataset(ABC):
         ...
 
 
+class IndexedInputDataset(InputDataset):
+    # dataset with random access to rows by position, samplers keep positions instead of parsed rows
+    @abstractmethod
+    async def build_index(self) -> int:
+        # returns number of rows
+        ...
+
+    @abstractmethod
+    def read_row(self, index: int) -> dict:
+        ...
+
+    async def read_all_data(self) -> list[dict]:
+        return [self.read_row(i) for i in range(await self.build_index())]
+
+
+class StreamingInputDataset(InputDataset):
+    # dataset that yields rows while it is still being downloaded so sampler can start before whole dataset is read
+    @abstractmethod
+    def stream(self) -> typing.AsyncIterator[dict]:
+        ...
+
+    async def read_all_data(self) -> list[dict]:
+        return [data async for data in self.stream()]
+
+
 class OutputDataset(ABC):
     @abstractmethod
     async def get_processed_ids(self) -> list[int]:
@@ -26,6 +66,14 @@ class OutputDataset(ABC):
     async def write_single_response(self, dict) -> None:
         ...
 
+    async def close(self) -> None:
+        # flushes buffered responses, called once run is finished
+        ...
+
+    def backlog(self) -> int:
+        # responses accepted but not yet persisted
+        return 0
+
 
 class LocalInputDataset(InputDataset):
     def __init__(self, path):
@@ -37,6 +85,212 @@ class LocalInputDataset(InputDataset):
             return dataset
 
 
+class LocalStreamingInputDataset(StreamingInputDataset):
+    # reads jsonl file line by line so memory does not depend on size of file, used for long traces
+    def __init__(self, path: Path) -> None:
+        self._path = path
+
+    async def stream(self) -> typing.AsyncIterator[dict]:
+        async with aio_open(self._path, "r", encoding="utf-8") as file:
+            async for line in file:
+                if line.strip():
+                    yield json.loads(line)
+
+
+class MmapInputDataset(IndexedInputDataset):
+    # memory maps jsonl file and keeps only array of line offsets, rows are parsed when sampler draws them.
+    # Offsets are cached next to dataset and rebuilt when file size or modification time changes
+    _INDEX_MAGIC = b"STRWIDX1"
+    _INDEX_HEADER = struct.Struct("<8sQQQ") # magic, file size, file mtime ns, number of rows
+
+    def __init__(self, path: Path, index_path: Path | None = None) -> None:
+        self._path = Path(path)
+        self._index_path = Path(index_path) if index_path is not None else self._path.with_name(self._path.name + ".idx")
+        self._mmap = None
+        self._offsets = None
+
+    async def build_index(self) -> int:
+        if self._offsets is None:
+            await asyncio.to_thread(self._build_index)
+        return len(self._offsets)
+
+    def read_row(self, index: int) -> dict:
+        start = self._offsets[index]
+        end = self._mmap.find(b"\n", start)
+        if end == -1:
+            end = len(self._mmap)
+        return json.loads(self._mmap[start:end])
+
+    def _build_index(self) -> None:
+        stat = os.stat(self._path)
+        with open(self._path, "rb") as file:
+            # empty file can not be memory mapped
+            self._mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) if stat.st_size > 0 else b""
+        self._offsets = self._load_cached_index(stat)
+        if self._offsets is not None:
+            logger.info(f"Loaded index of {len(self._offsets)} rows from {self._index_path}")
+            return
+
+        logger.info(f"Build index of {self._path}")
+        offsets = array.array("Q")
+        position = 0
+        size = len(self._mmap)
+        while position < size:
+            end = self._mmap.find(b"\n", position)
+            if end == -1:
+                end = size
+            # skip blank lines same as LocalInputDataset
+            if end > position and (self._mmap[position] not in b" \t\r" or self._mmap[position:end].strip()):
+                offsets.append(position)
+            position = end + 1
+        self._offsets = offsets
+        logger.info(f"Built index of {len(offsets)} rows")
+        self._save_index(stat)
+
+    def _load_cached_index(self, stat: os.stat_result) -> array.array | None:
+        try:
+            with open(self._index_path, "rb") as file:
+                magic, size, mtime_ns, rows = self._INDEX_HEADER.unpack(file.read(self._INDEX_HEADER.size))
+                if magic != self._INDEX_MAGIC or size != stat.st_size or mtime_ns != stat.st_mtime_ns:
+                    return None
+                offsets = array.array("Q")
+                offsets.fromfile(file, rows)
+                return offsets
+        except (OSError, EOFError, struct.error):
+            return None
+
+    def _save_index(self, stat: os.stat_result) -> None:
+        # written to temporary file and renamed so concurrent workers never read half written index
+        temporary_path = self._index_path.with_name(f"{self._index_path.name}.{os.getpid()}.tmp")
+        try:
+            with open(temporary_path, "wb") as file:
+                file.write(self._INDEX_HEADER.pack(self._INDEX_MAGIC, stat.st_size, stat.st_mtime_ns, len(self._offsets)))
+                self._offsets.tofile(file)
+            os.replace(temporary_path, self._index_path)
+        except OSError as e:
+            logger.warning(f"Could not cache index to {self._index_path}: {e}")
+
+
+class S3InputDataset(StreamingInputDataset):
+    # streams jsonl from single object or from every object under prefix in key order. Each object is read with range
+    # requests and several next ranges are downloaded ahead while rows of current one are parsed. Objects ending with
+    # .gz or .zst are decompressed on the fly
+    def __init__(
+        self,
+        aws_access_key: str,
+        aws_secret_key: str,
+        bucket: str,
+        address: str,
+        path: str,
+        input_s3_region_name: str,
+        chunk_size: int = 8 * 1024 * 1024,
+        prefetch: int = 4
+    ) -> None:
+        self._aws_access_key = aws_access_key
+        self._aws_secret_key = aws_secret_key
+        self._bucket = bucket
+        self._address = address
+        self._path = path
+        self._input_s3_region_name = input_s3_region_name
+        self._chunk_size = chunk_size
+        self._prefetch = prefetch
+        self._session = aioboto3.Session()
+
+    async def stream(self) -> typing.AsyncIterator[dict]:
+        async with self._session.client(
+            service_name="s3",
+            aws_access_key_id=self._aws_access_key,
+            aws_secret_access_key=self._aws_secret_key,
+            endpoint_url=self._address,
+            region_name=self._input_s3_region_name
+        ) as s3_client:
+            for key, size in await self._list_objects(s3_client):
+                logger.info(f"Start to read s3://{self._bucket}/{key}")
+                decompressor = self._decompressor(key)
+                remainder = b""
+                async for chunk in self._read_chunks(s3_client, key, size):
+                    if decompressor is not None:
+                        chunk = decompressor.decompress(chunk)
+                    lines = (remainder + chunk).split(b"\n")
+                    remainder = lines.pop()
+                    for line in lines:
+                        if line.strip():
+                            yield json.loads(line)
+                if decompressor is not None:
+                    remainder += decompressor.flush()
+                if remainder.strip():
+                    yield json.loads(remainder)
+
+    async def _list_objects(self, s3_client) -> list[tuple[str, int]]:
+        if not self._path.endswith("/"):
+            try:
+                head = await s3_client.head_object(Bucket=self._bucket, Key=self._path)
+                return [(self._path, head["ContentLength"])]
+            except s3_client.exceptions.ClientError:
+                pass
+        objects = []
+        paginator = s3_client.get_paginator("list_objects_v2")
+        async for page in paginator.paginate(Bucket=self._bucket, Prefix=self._path):
+            for obj in page.get("Contents", []):
+                if obj["Size"] > 0:
+                    objects.append((obj["Key"], obj["Size"]))
+        if len(objects) == 0:
+            raise ValueError(f"No objects found at s3://{self._bucket}/{self._path}")
+        return sorted(objects)
+
+    def _decompressor(self, key: str):
+        if key.endswith(".gz"):
+            return _GzipDecompressor()
+        elif key.endswith(".zst") or key.endswith(".zstd"):
+            if zstandard is None:
+                raise ValueError("Reading zstd compressed input requires zstandard package")
+            return zstandard.ZstdDecompressor().decompressobj()
+        return None
+
+    async def _read_chunks(self, s3_client, key: str, size: int) -> typing.AsyncIterator[bytes]:
+        async def fetch(start: int) -> bytes:
+            end = min(start + self._chunk_size, size) - 1
+            obj = await s3_client.get_object(Bucket=self._bucket, Key=key, Range=f"bytes={start}-{end}")
+            async with obj["Body"] as body:
+                return await body.read()
+
+        starts = iter(range(0, size, self._chunk_size))
+        pending = []
+        try:
+            for start in starts:
+                pending.append(asyncio.create_task(fetch(start)))
+                if len(pending) >= self._prefetch:
+                    break
+            while pending:
+                chunk = await pending.pop(0)
+                start = next(starts, None)
+                if start is not None:
+                    pending.append(asyncio.create_task(fetch(start)))
+                yield chunk
+        finally:
+            for task in pending:
+                task.cancel()
+
+
+class _GzipDecompressor:
+    # gzip files may consist of several concatenated members, zlib decompressobj stops after first one
+    def __init__(self) -> None:
+        self._decompressor = zlib.decompressobj(wbits=zlib.MAX_WBITS | 16)
+
+    def decompress(self, data: bytes) -> bytes:
+        output = []
+        while data:
+            output.append(self._decompressor.decompress(data))
+            if not self._decompressor.eof:
+                break
+            data = self._decompressor.unused_data
+            self._decompressor = zlib.decompressobj(wbits=zlib.MAX_WBITS | 16)
+        return b"".join(output)
+
+    def flush(self) -> bytes:
+        return self._decompressor.flush()
+
+
 class DummyOutputDataset(OutputDataset):
     async def get_processed_ids(self) -> list[int]:
         return set()
@@ -67,6 +321,151 @@ class LocalOutputDataset(OutputDataset):
             await file.write(content)
 
 
+class ShardedLocalOutputDataset(OutputDataset):
+    # appends compact responses to rotating jsonl shards from background writer instead of file per response.
+    # custom ids are appended to sidecar index only after their shard is fsynced so index never points to lost data
+    # and resume reads few index files instead of listing every response. Responses written by LocalOutputDataset
+    # into same directory are still counted as processed
+    def __init__(
+        self,
+        save_path: Path,
+        shard_size: int = 256 * 1024 * 1024,
+        flush_interval: float = 1.0,
+        flush_size: int = 1024 * 1024,
+        fsync_interval: float = 5.0
+    ) -> None:
+        self._save_path = save_path
+        if not self._save_path.exists():
+            self._save_path.mkdir(parents=True, exist_ok=True)
+        self._shard_size = shard_size
+        self._flush_interval = flush_interval
+        self._flush_size = flush_size
+        self._fsync_interval = fsync_interval # 0 means fsync on every flush
+        # unique per process so several workers and resumed runs never append to same shard
+        self._writer_id = f"{int(time.time())}-{os.getpid()}-{random.getrandbits(32):08x}"
+        self._shard_index = 0
+        self._shard_file = None
+        self._index_file = None
+        self._last_fsync_time = time.time()
+        self._buffer = []
+        self._buffer_ids = []
+        self._buffer_size = 0
+        self._unsynced_ids = []
+        self._writer_task = None
+        self._flush_event = None
+        self._closing = False
+
+    def backlog(self) -> int:
+        return len(self._buffer)
+
+    async def get_processed_ids(self) -> set:
+        return await asyncio.to_thread(self._read_processed_ids)
+
+    def _read_processed_ids(self) -> set:
+        processed = set()
+        for entry in os.scandir(self._save_path):
+            name, ext = os.path.splitext(entry.name)
+            if ext == ".index":
+                with open(entry.path, "r", encoding="utf-8") as file:
+                    for line in file:
+                        line = line.strip()
+                        if line:
+                            processed.add(json.loads(line))
+            elif ext == ".json":
+                # file per response layout of LocalOutputDataset
+                try:
+                    processed.add(int(name))
+                except ValueError:
+                    pass
+        return processed
+
+    def read_responses(self):
+        # yields all stored responses, both from shards and from file per response layout
+        for entry in sorted(os.scandir(self._save_path), key=lambda entry: entry.name):
+            if entry.name.endswith(".jsonl"):
+                with open(entry.path, "r", encoding="utf-8") as file:
+                    for line in file:
+                        if line.strip():
+                            yield json.loads(line)
+            elif entry.name.endswith(".json"):
+                with open(entry.path, "r", encoding="utf-8") as file:
+                    yield json.load(file)
+
+    async def write_single_response(self, response: dict) -> None:
+        if self._writer_task is None:
+            self._closing = False
+            self._flush_event = asyncio.Event()
+            self._writer_task = asyncio.create_task(self._writer())
+        line = json.dumps(response, ensure_ascii=False, separators=(",", ":")) + "\n"
+        self._buffer.append(line)
+        self._buffer_ids.append(response.get("custom_id"))
+        self._buffer_size += len(line)
+        if self._buffer_size >= self._flush_size:
+            self._flush_event.set()
+
+    async def close(self) -> None:
+        if self._writer_task is None:
+            return
+        self._closing = True
+        self._flush_event.set()
+        await self._writer_task
+        self._writer_task = None
+        await self._flush(force_fsync=True)
+        await asyncio.to_thread(self._close_files)
+
+    async def _writer(self) -> None:
+        while not self._closing:
+            try:
+                await asyncio.wait_for(self._flush_event.wait(), timeout=self._flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._flush_event.clear()
+            await self._flush(force_fsync=False)
+
+    async def _flush(self, force_fsync: bool) -> None:
+        lines, ids = self._buffer, self._buffer_ids
+        self._buffer, self._buffer_ids, self._buffer_size = [], [], 0
+        await asyncio.to_thread(self._write, lines, ids, force_fsync)
+
+    def _write(self, lines: list[str], ids: list, force_fsync: bool) -> None:
+        if lines:
+            if self._shard_file is None or self._shard_file.tell() >= self._shard_size:
+                self._rotate()
+            self._shard_file.write("".join(lines).encode("utf-8"))
+            self._unsynced_ids.extend(ids)
+        if self._unsynced_ids and (force_fsync or time.time() - self._last_fsync_time >= self._fsync_interval):
+            self._sync()
+
+    def _sync(self) -> None:
+        self._shard_file.flush()
+        os.fsync(self._shard_file.fileno())
+        self._index_file.write("".join(json.dumps(custom_id) + "\n" for custom_id in self._unsynced_ids).encode("utf-8"))
+        self._index_file.flush()
+        os.fsync(self._index_file.fileno())
+        self._unsynced_ids = []
+        self._last_fsync_time = time.time()
+
+    def _rotate(self) -> None:
+        if self._shard_file is not None:
+            # ids of shard being closed must reach index before switching to new shard
+            if self._unsynced_ids:
+                self._sync()
+            self._shard_file.close()
+        if self._index_file is None:
+            self._index_file = open(self._save_path / f"shard-{self._writer_id}.index", "ab")
+        shard_path = self._save_path / f"shard-{self._writer_id}-{self._shard_index:05d}.jsonl"
+        self._shard_file = open(shard_path, "ab")
+        self._shard_index += 1
+        logger.info(f"Write responses to {shard_path}")
+
+    def _close_files(self) -> None:
+        for file in (self._shard_file, self._index_file):
+            if file is not None:
+                file.close()
+        self._shard_file = None
+        self._index_file = None
+
+
 class S3OutputDataset(OutputDataset):
     def __init__(self, aws_access_key: str, aws_secret_key: str, bucket: str, address: str, base_path: str, output_s3_region_name: str) -> None:
         self._aws_access_key = aws_access_key
@@ -120,6 +519,295 @@ class S3OutputDataset(OutputDataset):
             )
 
 
+class ShardedS3OutputDataset(OutputDataset):
+    # keeps one s3 client for whole run and buffers responses into jsonl shards bounded by size or time. Shards are
+    # uploaded with concurrent multipart uploads and optionally compressed. After shard is uploaded small manifest object
+    # with its custom ids is written so resume lists one manifest per shard instead of one object per response.
+    # At most upload_concurrency shards are uploaded at once, writers wait for free slot so memory stays bounded when
+    # s3 is slower than responses arrive. Failed uploads are retried with backoff, shard that could not be stored fails
+    # next write so run stops instead of generating responses that are never saved
+    def __init__(
+        self,
+        aws_access_key: str,
+        aws_secret_key: str,
+        bucket: str,
+        address: str,
+        base_path: str,
+        output_s3_region_name: str,
+        shard_size: int = 64 * 1024 * 1024,
+        shard_interval: float = 60.0,
+        part_size: int = 8 * 1024 * 1024,
+        upload_concurrency: int = 4,
+        upload_retries: int = 5,
+        upload_backoff: float = 0.5,
+        codec: str | None = None
+    ) -> None:
+        if codec not in (None, "gzip", "zstd"):
+            raise ValueError("Unknown codec, gzip, zstd are supported")
+        if codec == "zstd" and zstandard is None:
+            raise ValueError("zstd codec requires zstandard package")
+        if part_size < 5 * 1024 * 1024:
+            raise ValueError("S3 multipart part size must be at least 5 MB")
+        self._aws_access_key = aws_access_key
+        self._aws_secret_key = aws_secret_key
+        self._bucket = bucket
+        self._address = address
+        self._base_path = base_path.rstrip('/')
+        self._output_s3_region_name = output_s3_region_name
+        self._session = aioboto3.Session()
+        self._shard_size = shard_size
+        self._shard_interval = shard_interval
+        self._part_size = part_size
+        self._upload_semaphore = asyncio.Semaphore(upload_concurrency)
+        self._shard_slots = asyncio.Semaphore(upload_concurrency)
+        self._upload_retries = upload_retries
+        self._upload_backoff = upload_backoff
+        self._upload_error = None
+        self._codec = codec
+        self._writer_id = f"{int(time.time())}-{os.getpid()}-{random.getrandbits(32):08x}"
+        self._shard_index = 0
+        self._client_context = None
+        self._client = None
+        self._buffer = []
+        self._buffer_ids = []
+        self._buffer_size = 0
+        self._buffer_start_time = None
+        self._uploads = set()
+        self._sealer_task = None
+
+    def backlog(self) -> int:
+        return len(self._buffer) + len(self._uploads)
+
+    async def _get_client(self):
+        if self._client is None:
+            self._client_context = self._session.client(
+                service_name="s3",
+                aws_access_key_id=self._aws_access_key,
+                aws_secret_access_key=self._aws_secret_key,
+                endpoint_url=self._address,
+                region_name=self._output_s3_region_name
+            )
+            self._client = await self._client_context.__aenter__()
+        return self._client
+
+    async def get_processed_ids(self) -> set:
+        s3_client = await self._get_client()
+        manifest_keys = []
+        paginator = s3_client.get_paginator("list_objects_v2")
+        async for page in paginator.paginate(Bucket=self._bucket, Prefix=f"{self._base_path}/manifest/"):
+            for obj in page.get("Contents", []):
+                manifest_keys.append(obj["Key"])
+
+        async def read_manifest(key: str) -> list:
+            async with self._upload_semaphore:
+                obj = await s3_client.get_object(Bucket=self._bucket, Key=key)
+                async with obj["Body"] as body:
+                    return json.loads(await body.read())
+
+        processed = set()
+        for ids in await asyncio.gather(*(read_manifest(key) for key in manifest_keys)):
+            processed.update(ids)
+        return processed
+
+    async def write_single_response(self, response: dict) -> None:
+        self._raise_upload_error()
+        if self._sealer_task is None:
+            self._sealer_task = asyncio.create_task(self._sealer())
+        line = json.dumps(response, ensure_ascii=False, separators=(",", ":")) + "\n"
+        if not self._buffer:
+            self._buffer_start_time = time.time()
+        self._buffer.append(line)
+        self._buffer_ids.append(response.get("custom_id"))
+        self._buffer_size += len(line)
+        if self._buffer_size >= self._shard_size:
+            await self._seal()
+
+    async def close(self) -> None:
+        if self._sealer_task is not None:
+            self._sealer_task.cancel()
+            self._sealer_task = None
+        if self._upload_error is None:
+            await self._seal()
+        await asyncio.gather(*self._uploads, return_exceptions=True)
+        if self._client is not None:
+            await self._client_context.__aexit__(None, None, None)
+            self._client = None
+            self._client_context = None
+        self._raise_upload_error()
+
+    def _raise_upload_error(self) -> None:
+        # ids of failed shard are not in manifest so they will be processed again on resume
+        if self._upload_error is not None:
+            raise RuntimeError(f"Failed to upload shard to s3, {self._upload_error}") from self._upload_error
+
+    async def _sealer(self) -> None:
+        # seals shard that was open for too long so slow runs still upload responses regularly
+        while True:
+            await asyncio.sleep(min(self._shard_interval, 1.0))
+            if self._buffer and time.time() - self._buffer_start_time >= self._shard_interval:
+                await self._seal()
+
+    async def _seal(self) -> None:
+        if not self._buffer:
+            return
+        lines, ids = self._buffer, self._buffer_ids
+        self._buffer, self._buffer_ids, self._buffer_size = [], [], 0
+        name = f"{self._writer_id}-{self._shard_index:05d}"
+        self._shard_index += 1
+        # shard is taken out of buffer before waiting so other writers start next shard meanwhile
+        try:
+            await self._shard_slots.acquire()
+        except asyncio.CancelledError:
+            # writer or sealer is cancelled at end of run, shard goes back to buffer and is sealed by close
+            if not self._buffer:
+                self._buffer_start_time = time.time()
+            self._buffer.extend(lines)
+            self._buffer_ids.extend(ids)
+            self._buffer_size += sum(len(line) for line in lines)
+            raise
+        task = asyncio.create_task(self._upload_shard(name, lines, ids))
+        self._uploads.add(task)
+        task.add_done_callback(self._upload_done)
+
+    def _upload_done(self, task: asyncio.Task) -> None:
+        self._uploads.discard(task)
+        self._shard_slots.release()
+        if not task.cancelled() and task.exception() is not None and self._upload_error is None:
+            self._upload_error = task.exception()
+            logger.error(f"Failed to upload shard {self._upload_error}")
+
+    def _encode(self, lines: list[str]) -> bytes:
+        content = "".join(lines).encode("utf-8")
+        if self._codec == "gzip":
+            return gzip.compress(content)
+        elif self._codec == "zstd":
+            return zstandard.ZstdCompressor().compress(content)
+        return content
+
+    async def _upload_shard(self, name: str, lines: list[str], ids: list) -> None:
+        s3_client = await self._get_client()
+        content = await asyncio.to_thread(self._encode, lines)
+        extension = {None: ".jsonl", "gzip": ".jsonl.gz", "zstd": ".jsonl.zst"}[self._codec]
+        key = f"{self._base_path}/shards/{name}{extension}"
+        if len(content) <= self._part_size:
+            async def put_shard() -> None:
+                async with self._upload_semaphore:
+                    await s3_client.put_object(Bucket=self._bucket, Key=key, Body=content)
+            await self._retry(put_shard, key)
+        else:
+            await self._retry(lambda: self._multipart_upload(s3_client, key, content), key)
+        # manifest is written only after shard is stored so listed ids are always readable
+        await self._retry(lambda: s3_client.put_object(
+            Bucket=self._bucket,
+            Key=f"{self._base_path}/manifest/{name}.json",
+            Body=json.dumps(ids).encode("utf-8")
+        ), key)
+        logger.info(f"Uploaded shard {key} with {len(ids)} responses")
+
+    async def _retry(self, upload: typing.Callable, key: str) -> None:
+        for attempt in range(self._upload_retries + 1):
+            try:
+                return await upload()
+            except Exception as e:
+                if _is_permanent_s3_error(e) or attempt == self._upload_retries:
+                    raise
+                delay = backoff(attempt, self._upload_backoff)
+                logger.warning(f"Failed to upload {key}, retrying in {delay:.1f} seconds, {e}")
+                await asyncio.sleep(delay)
+
+    async def _multipart_upload(self, s3_client, key: str, content: bytes) -> None:
+        upload = await s3_client.create_multipart_upload(Bucket=self._bucket, Key=key)
+        upload_id = upload["UploadId"]
+
+        async def upload_part(number: int, offset: int) -> dict:
+            async with self._upload_semaphore:
+                part = await s3_client.upload_part(
+                    Bucket=self._bucket,
+                    Key=key,
+                    UploadId=upload_id,
+                    PartNumber=number,
+                    Body=content[offset:offset + self._part_size]
+                )
+                return {"PartNumber": number, "ETag": part["ETag"]}
+
+        try:
+            parts = await asyncio.gather(*(
+                upload_part(number, offset)
+                for number, offset in enumerate(range(0, len(content), self._part_size), start=1)
+            ))
+            await s3_client.complete_multipart_upload(
+                Bucket=self._bucket,
+                Key=key,
+                UploadId=upload_id,
+                MultipartUpload={"Parts": parts}
+            )
+        except Exception:
+            await s3_client.abort_multipart_upload(Bucket=self._bucket, Key=key, UploadId=upload_id)
+            raise
+
+
+def _is_permanent_s3_error(error: Exception) -> bool:
+    # client errors like missing bucket or denied access do not go away on retry, throttling and timeouts do
+    if not isinstance(error, ClientError):
+        return False
+    status = error.response.get("ResponseMetadata", {}).get("HTTPStatusCode") or 0
+    code = error.response.get("Error", {}).get("Code", "")
+    return 400 <= status < 500 and status not in (408, 429) and code not in ("RequestTimeout", "SlowDown", "Throttling")
+
+
+def order_key(data: dict, prefix_chars: int = 256) -> tuple[int, int]:
+    # hash of shared prefix and expected number of output tokens of row. Prefix is every message except last one,
+    # system prompt with few shot examples, or first prefix_chars characters of prompt. Expected output is
+    # "expected_output_tokens" hint of row or max tokens of request
+    body = data.get("body") or {}
+    messages = body.get("messages")
+    if messages:
+        prefix = json.dumps(messages[:-1], sort_keys=True) if len(messages) > 1 else str(messages[0].get("content", ""))[:prefix_chars]
+    else:
+        text = body.get("text", body.get("prompt", ""))
+        prefix = (text[0] if isinstance(text, list) and text else str(text))[:prefix_chars]
+    sampling_params = body.get("sampling_params") or {}
+    expected = data.get("expected_output_tokens") or body.get("max_tokens") or body.get("max_completion_tokens") or sampling_params.get("max_new_tokens") or 0
+    return zlib.crc32(prefix.encode("utf-8")), max(0, int(expected))
+
+
+def prefix_order(groups: array.array, expected: array.array) -> array.array:
+    # positions of rows grouped by prefix so server reuses cached prefix, groups with longest expected output go
+    # first and inside group longer outputs go first so long generations do not stretch end of batch. Keys are kept in
+    # parallel arrays and every row is sorted as one packed integer of group, expected output and position, so huge
+    # inputs cost few dozen bytes per row instead of python tuples
+    rows = len(groups)
+    if rows == 0:
+        return array.array("Q")
+    position_bits = max(1, (rows - 1).bit_length())
+    expected_bits = max(1, max(expected).bit_length())
+    expected_limit = (1 << expected_bits) - 1
+    packed = [
+        (groups[i] << (expected_bits + position_bits)) | ((expected_limit - expected[i]) << position_bits) | i
+        for i in range(rows)
+    ]
+    packed.sort()
+    position_mask = (1 << position_bits) - 1
+    by_group = array.array("Q", (key & position_mask for key in packed))
+    del packed
+
+    # rows of every group are now adjacent with longest output first, groups are ordered by their longest output
+    starts = array.array("Q", (i for i in range(rows) if i == 0 or groups[by_group[i]] != groups[by_group[i - 1]]))
+    group_bits = max(1, (len(starts) - 1).bit_length())
+    group_keys = [
+        (((expected_limit - expected[by_group[start]]) << 32 | groups[by_group[start]]) << group_bits) | number
+        for number, start in enumerate(starts)
+    ]
+    group_keys.sort()
+    order = array.array("Q")
+    group_mask = (1 << group_bits) - 1
+    for key in group_keys:
+        number = key & group_mask
+        end = starts[number + 1] if number + 1 < len(starts) else rows
+        order.extend(by_group[starts[number]:end])
+    return order
+
+
 class Sampler(ABC):
     def __aiter__(self):
         return self
@@ -128,53 +816,288 @@ class Sampler(ABC):
     async def __anext__(self):
         ...
 
+    def queue_depth(self) -> int:
+        # rows that can be sampled without waiting for input
+        return 0
+
+    async def _load_rows(self, input_dataset: InputDataset) -> tuple[int, typing.Callable[[int], dict]]:
+        # returns number of rows and function reading row by position so samplers work with positions only
+        if isinstance(input_dataset, IndexedInputDataset):
+            return await input_dataset.build_index(), input_dataset.read_row
+        rows = await input_dataset.read_all_data()
+        return len(rows), rows.__getitem__
+
+
+class RetryingSampler(Sampler):
+    # sampler that takes back rows failed with retryable error, batch mode needs it to send them again
+    @abstractmethod
+    def requeue(self, data: dict, delay: float) -> None:
+        # returns row so it is sampled again after delay seconds
+        ...
+
+    @property
+    @abstractmethod
+    def retries(self) -> int:
+        # rows returned with requeue that were not sampled yet
+        ...
+
 
-class FiniteSampler(Sampler):
-    def __init__(self, input_dataset: InputDataset, output_dataset: OutputDataset, overwrite: bool) -> None:
+class FiniteSampler(RetryingSampler):
+    def __init__(
+        self,
+        input_dataset: InputDataset,
+        output_dataset: OutputDataset,
+        overwrite: bool,
+        partition: tuple[int, int] = (0, 1),
+        shuffle_buffer_size: int = 1024,
+        order: str = "random"
+    ) -> None:
+        if order not in ("random", "prefix"):
+            raise ValueError("Unknown order, random and prefix are supported")
         self._input_dataset = input_dataset
         self._output_dataset = output_dataset
         self._overwrite = overwrite
+        # (index, count) only rows with position % count == index are used, lets several workers split one dataset
+        self._partition = partition
+        # streaming datasets can not be shuffled as whole, rows are drawn randomly from buffer of this size instead
+        self._shuffle_buffer_size = shuffle_buffer_size
+        # random order for load tests, prefix order for batch jobs, see prefix_order
+        self._order_mode = order
+        self._lock = asyncio.Lock()
+        # heap of (ready time, sequence, row) of rows returned with requeue
+        self._retries = []
+        self._retries_sequence = 0
     
     async def prepare_data(self) -> None:
-        processed_ids = set()
+        self._processed_ids = set()
         if not self._overwrite:
-            processed_ids = await self._output_dataset.get_processed_ids()
-            logger.info(f"Found {len(processed_ids)} processed examples")
-        new_data = []
-        for data in await self._input_dataset.read_all_data():
-            if data["custom_id"] not in processed_ids:
-                new_data.append(data)
-        logger.info(f"Sampler will use {len(new_data)} examples")
-        random.shuffle(new_data)
-        self._queue: asyncio.Queue[typing.Any] = asyncio.Queue()
-        for i, req in enumerate(new_data):
-            is_last = bool(i == len(new_data) - 1)
-            self._queue.put_nowait((req, is_last))
+            self._processed_ids = await self._output_dataset.get_processed_ids()
+            logger.info(f"Found {len(self._processed_ids)} processed examples")
+        if isinstance(self._input_dataset, StreamingInputDataset):
+            self._stream = aiter(self._input_dataset.stream())
+            self._stream_position = 0
+            self._stream_exhausted = False
+            self._buffer = []
+            logger.info("Sampler will use streamed examples except processed ones")
+        else:
+            self._stream = None
+            rows, self._read_row = await self._load_rows(self._input_dataset)
+            index, count = self._partition
+            self._order = array.array("Q", range(index, rows, count))
+            if self._order_mode == "prefix":
+                logger.info("Order examples by prefix and expected output length")
+                self._order = await asyncio.to_thread(self._prefix_order)
+            else:
+                random.shuffle(self._order)
+            self._position = 0
+            logger.info(f"Sampler will use {len(self._order)} examples except processed ones")
+        # one row is read ahead to know whether returned row is last
+        self._next = await self._draw()
+
+    def _prefix_order(self) -> array.array:
+        # rows are read once to compute their keys, only keys and positions are kept
+        groups, expected = array.array("Q"), array.array("Q")
+        for position in self._order:
+            group, tokens = order_key(self._read_row(position))
+            groups.append(group)
+            expected.append(tokens)
+        order = prefix_order(groups, expected)
+        del groups, expected
+        for i, row in enumerate(order):
+            order[i] = self._order[row]
+        return order
+
+    async def _draw(self) -> dict | None:
+        if self._stream is not None:
+            return await self._draw_streamed()
+        while self._position < len(self._order):
+            data = self._read_row(self._order[self._position])
+            self._position += 1
+            if data["custom_id"] not in self._processed_ids:
+                return data
+        return None
+
+    async def _draw_streamed(self) -> dict | None:
+        index, count = self._partition
+        if self._order_mode == "prefix" and self._buffer:
+            # buffer is ordered once it is filled and then drained, streamed input is ordered window by window
+            return self._buffer.pop()
+        while not self._stream_exhausted and len(self._buffer) < self._shuffle_buffer_size:
+            try:
+                data = await anext(self._stream)
+            except StopAsyncIteration:
+                self._stream_exhausted = True
+                break
+            position = self._stream_position
+            self._stream_position += 1
+            if position % count == index and data["custom_id"] not in self._processed_ids:
+                self._buffer.append(data)
+        if not self._buffer:
+            return None
+        if self._order_mode == "prefix":
+            keys = [order_key(data) for data in self._buffer]
+            order = prefix_order(array.array("Q", (group for group, _ in keys)), array.array("Q", (tokens for _, tokens in keys)))
+            self._buffer = [self._buffer[i] for i in reversed(order)]
+            return self._buffer.pop()
+        i = random.randrange(len(self._buffer))
+        self._buffer[i], self._buffer[-1] = self._buffer[-1], self._buffer[i]
+        return self._buffer.pop()
     
+    @property
+    def retries(self) -> int:
+        return len(self._retries)
+
+    def queue_depth(self) -> int:
+        if self._stream is not None:
+            return len(self._buffer) + len(self._retries)
+        return len(self._order) - self._position + len(self._retries)
+
+    def requeue(self, data: dict, delay: float) -> None:
+        heapq.heappush(self._retries, (time.monotonic() + delay, self._retries_sequence, data))
+        self._retries_sequence += 1
+
     async def __anext__(self):
-        if self._queue.empty():
-            raise StopAsyncIteration
-        item = await self._queue.get()
-        self._queue.task_done()
-        return item
+        # users draw concurrently and streamed draw awaits download
+        async with self._lock:
+            # retried rows go first once their delay passed, after dataset is exhausted sampler waits for them
+            if self._retries and (self._next is None or self._retries[0][0] <= time.monotonic()):
+                await asyncio.sleep(max(0.0, self._retries[0][0] - time.monotonic()))
+                data = heapq.heappop(self._retries)[2]
+                return data, self._next is None and not self._retries
+            data = self._next
+            if data is None:
+                raise StopAsyncIteration
+            self._next = await self._draw()
+            return data, self._next is None and not self._retries
 
 
 class InfiniteSampler(Sampler):
-    def __init__(self, input_dataset: InputDataset, output_dataset: OutputDataset, overwrite: bool) -> None:
+    def __init__(self, input_dataset: InputDataset, output_dataset: OutputDataset, overwrite: bool, partition: tuple[int, int] = (0, 1)) -> None:
         self._input_dataset = input_dataset
         self._output_dataset = output_dataset
         self._overwrite = overwrite
+        # (index, count) only rows with position % count == index are used, lets several workers split one dataset
+        self._partition = partition
     
     async def prepare_data(self) -> None:
-        processed_ids = set()
+        self._processed_ids = set()
         if not self._overwrite:
-            processed_ids = await self._output_dataset.get_processed_ids()
-            logger.info(f"Found {len(processed_ids)} processed examples")
-        self._new_data = []
-        for data in await self._input_dataset.read_all_data():
-            if data["custom_id"] not in processed_ids:
-                self._new_data.append(data)
-        logger.info(f"Sampler will use {len(self._new_data)} examples")
+            self._processed_ids = await self._output_dataset.get_processed_ids()
+            logger.info(f"Found {len(self._processed_ids)} processed examples")
+        if isinstance(self._input_dataset, StreamingInputDataset):
+            # rows are sampled from already downloaded part while rest of dataset is downloaded in background
+            self._rows = []
+            self._rows_ready = asyncio.Event()
+            self._loader = asyncio.create_task(self._load_streamed())
+            logger.info("Sampler will use streamed examples except processed ones")
+        else:
+            self._rows = None
+            rows, self._read_row = await self._load_rows(self._input_dataset)
+            index, count = self._partition
+            self._positions = range(index, rows, count)
+            logger.info(f"Sampler will use {len(self._positions)} examples except processed ones")
+
+    def queue_depth(self) -> int:
+        return len(self._rows) if self._rows is not None else len(self._positions)
+
+    async def _load_streamed(self) -> None:
+        index, count = self._partition
+        try:
+            position = 0
+            async for data in self._input_dataset.stream():
+                if position % count == index and data["custom_id"] not in self._processed_ids:
+                    self._rows.append(data)
+                    self._rows_ready.set()
+                position += 1
+            logger.info(f"Sampler downloaded {len(self._rows)} examples")
+        finally:
+            self._rows_ready.set()
     
     async def __anext__(self):
-        return (random.choice(self._new_data), False) # neve last since infinite loop
+        if self._rows is not None:
+            await self._rows_ready.wait()
+            if not self._rows:
+                raise StopAsyncIteration
+            return (random.choice(self._rows), False)
+        # bounded number of attempts so dataset with every row processed does not hang
+        for _ in range(max(len(self._positions), 1)):
+            data = self._read_row(random.choice(self._positions))
+            if data["custom_id"] not in self._processed_ids:
+                return (data, False) # neve last since infinite loop
+        raise StopAsyncIteration
+
+
+class TraceSampler(Sampler):
+    # yields rows of timestamped trace in file order, trace must be sorted by timestamp. Offset of row is seconds
+    # since first row of whole trace, so every partition keeps original timing of its rows
+    def __init__(
+        self,
+        input_dataset: InputDataset,
+        output_dataset: OutputDataset,
+        overwrite: bool,
+        partition: tuple[int, int] = (0, 1),
+        timestamp_field: str = "timestamp"
+    ) -> None:
+        self._input_dataset = input_dataset
+        self._output_dataset = output_dataset
+        self._overwrite = overwrite
+        self._partition = partition
+        self._timestamp_field = timestamp_field
+        self._first_timestamp = None
+
+    async def prepare_data(self) -> None:
+        self._processed_ids = set()
+        if not self._overwrite:
+            self._processed_ids = await self._output_dataset.get_processed_ids()
+            logger.info(f"Found {len(self._processed_ids)} processed examples")
+        self._rows = aiter(self._read())
+        # one row is read ahead to know whether returned row is last
+        self._next = await anext(self._rows, None)
+
+    async def _read(self) -> typing.AsyncIterator[dict]:
+        if isinstance(self._input_dataset, StreamingInputDataset):
+            rows = self._input_dataset.stream()
+        elif isinstance(self._input_dataset, IndexedInputDataset):
+            rows = (self._input_dataset.read_row(i) for i in range(await self._input_dataset.build_index()))
+        else:
+            logger.warning("Trace is loaded in memory, use local_stream, local_mmap or s3 input to stream it")
+            rows = await self._input_dataset.read_all_data()
+        index, count = self._partition
+        position = 0
+        async for data in self._iterate(rows):
+            if self._first_timestamp is None:
+                self._first_timestamp = self._timestamp(data)
+                logger.info(f"Trace starts at {self._first_timestamp}")
+            if position % count == index and data["custom_id"] not in self._processed_ids:
+                yield data
+            position += 1
+
+    @staticmethod
+    async def _iterate(rows) -> typing.AsyncIterator[dict]:
+        if hasattr(rows, "__aiter__"):
+            async for data in rows:
+                yield data
+        else:
+            for data in rows:
+                yield data
+
+    def _timestamp(self, data: dict) -> float:
+        # unix seconds or iso 8601 string
+        value = data[self._timestamp_field]
+        if isinstance(value, str):
+            try:
+                return float(value)
+            except ValueError:
+                return datetime.datetime.fromisoformat(value).timestamp()
+        return float(value)
+
+    def offset(self, data: dict) -> float:
+        # seconds between first row of trace and this row
+        return self._timestamp(data) - self._first_timestamp
+
+    async def __anext__(self):
+        data = self._next
+        if data is None:
+            raise StopAsyncIteration
+        self._next = await anext(self._rows, None)
+        return data, self._next is None
@@ -0,0 +1,158 @@
+import json
+import time
+import asyncio
+import argparse
+
+from loguru import logger
+from strawberry.recorder import Recorder
+from strawberry.prometheus import Prometheus
+from strawberry.arguments import parse_arguments
+from strawberry.factory import local_input_output_factory, run_factory, timeline_factory, pusher_factory
+
+
+# coordinator and agents exchange json messages one per line over plain tcp, result of agent carries all its
+# observations in one line so limit of line is raised
+MESSAGE_LIMIT = 1 << 30
+
+
+async def _send(writer: asyncio.StreamWriter, message: dict) -> None:
+    writer.write(json.dumps(message).encode("utf-8") + b"\n")
+    await writer.drain()
+
+
+async def _receive(reader: asyncio.StreamReader) -> dict:
+    line = await reader.readline()
+    if not line:
+        raise ConnectionError("Connection is closed")
+    return json.loads(line)
+
+
+class Agent:
+    # sends share of load from this machine when coordinator asks, one run at a time. Metrics are served on
+    # prometheus port of agent under run name of coordinator so all agents are one run in Grafana
+    def __init__(self, host: str, port: int, prometheus_port: int) -> None:
+        self._host = host
+        self._port = port
+        self._prometheus_port = prometheus_port
+        # metrics are registered once per process so same Prometheus is reused by following runs
+        self._prometheus = None
+        self._busy = False
+
+    async def serve(self) -> None:
+        server = await asyncio.start_server(self._handle, self._host, self._port, limit=MESSAGE_LIMIT)
+        logger.info(f"Agent listens on {self._host}:{self._port}")
+        async with server:
+            await server.serve_forever()
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            message = await _receive(reader)
+            if self._busy:
+                await _send(writer, {"type": "error", "message": "agent is busy with another run"})
+                return
+            self._busy = True
+            try:
+                recorder = await self._run(message, reader, writer)
+                await _send(writer, {"type": "result", "recorder": recorder.to_dict()})
+            except Exception as e:
+                logger.error(f"Run failed with {type(e).__name__}: {e}")
+                await _send(writer, {"type": "error", "message": f"{type(e).__name__}: {e}"})
+            finally:
+                self._busy = False
+        except (ConnectionError, json.JSONDecodeError) as e:
+            logger.error(f"Lost coordinator: {e}")
+        finally:
+            writer.close()
+
+    async def _run(self, message: dict, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> Recorder:
+        arguments = parse_arguments(message["argv"])
+        run_name = message["run_name"]
+        partition = tuple(message["partition"])
+        logger.info(f"Start run {run_name} as agent {partition[0]} / {partition[1]}")
+
+        if self._prometheus is None:
+            self._prometheus = Prometheus(run=run_name, prometheus_port=self._prometheus_port)
+        self._prometheus.set_run(run_name)
+        timeline = timeline_factory(arguments, partition=partition)
+        self._prometheus.set_timeline(timeline)
+
+        async def start_barrier() -> None:
+            await _send(writer, {"type": "ready"})
+            message = await _receive(reader)
+            # start time is wall clock of coordinator, clocks of machines are expected to be synchronized
+            delay = message["start_time"] - time.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+        input_dataset, output_dataset, sampler = local_input_output_factory(arguments, partition=partition)
+        run = run_factory(arguments, self._prometheus, sampler, output_dataset, partition=partition, start_barrier=start_barrier)
+        pusher = pusher_factory(arguments)
+        try:
+            await run.start()
+        finally:
+            if pusher is not None:
+                await asyncio.to_thread(pusher.stop)
+        if timeline is not None:
+            await timeline.close()
+        logger.info(f"Run {run_name} finished")
+        return self._prometheus.recorder
+
+
+class Coordinator:
+    # starts same run on all agents, every agent gets its partition of dataset, users, spawn rate and arrival rate.
+    # Agents prepare their datasets, then start at common moment and send back recorders merged into one summary
+    def __init__(self, agents: list[str], argv: list[str], run_name: str, start_delay: float) -> None:
+        self._agents = agents
+        self._argv = argv
+        self._run_name = run_name
+        self._start_delay = start_delay
+
+    async def start(self) -> Recorder:
+        connections = []
+        try:
+            for agent in self._agents:
+                host, port = agent.rsplit(":", 1)
+                connections.append(await asyncio.open_connection(host, int(port), limit=MESSAGE_LIMIT))
+            for index, (reader, writer) in enumerate(connections):
+                await _send(writer, {"type": "start", "argv": self._argv, "run_name": self._run_name, "partition": [index, len(connections)]})
+            logger.info(f"Sent run to {len(connections)} agents, wait for them to prepare datasets")
+
+            for agent, (reader, writer) in zip(self._agents, connections):
+                message = await _receive(reader)
+                if message["type"] != "ready":
+                    raise RuntimeError(f"Agent {agent} failed: {message.get('message')}")
+            start_time = time.time() + self._start_delay
+            for reader, writer in connections:
+                await _send(writer, {"type": "go", "start_time": start_time})
+            logger.info(f"All agents are ready, they start in {self._start_delay} seconds")
+
+            recorder = Recorder()
+            results = await asyncio.gather(*(self._result(agent, reader) for agent, (reader, writer) in zip(self._agents, connections)))
+            for result in results:
+                if result is not None:
+                    recorder.merge(result)
+            logger.info(f"Received results of {sum(result is not None for result in results)} / {len(connections)} agents")
+            return recorder
+        finally:
+            for reader, writer in connections:
+                writer.close()
+
+    async def _result(self, agent: str, reader: asyncio.StreamReader) -> Recorder | None:
+        try:
+            message = await _receive(reader)
+        except ConnectionError as e:
+            logger.error(f"Lost agent {agent}: {e}")
+            return None
+        if message["type"] != "result":
+            logger.error(f"Agent {agent} failed: {message.get('message')}")
+            return None
+        return Recorder.from_dict(message["recorder"])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", type=str, required=False, default="0.0.0.0")
+    parser.add_argument("--port", type=int, required=False, default=7000)
+    parser.add_argument("--prometheus_port", type=int, required=True)
+    agent_arguments = parser.parse_args()
+    asyncio.run(Agent(host=agent_arguments.host, port=agent_arguments.port, prometheus_port=agent_arguments.prometheus_port).serve())
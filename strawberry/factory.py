@@ -0,0 +1,387 @@
+import json
+import random
+import argparse
+import prometheus_client
+
+from strawberry.run import Run, OpenLoopRun, TraceRun, BatchRun
+from strawberry.monitor import Monitor
+from strawberry.workload import Workload
+from strawberry.cache import ResponseCache
+from strawberry.controller import AimdController
+from strawberry.prometheus import Prometheus, MetricsPusher
+from strawberry.timeline import TimelineWriter
+from strawberry.window import MeasurementWindow
+from strawberry.router import Endpoint
+from strawberry.arrival import ConstantArrival, PoissonArrival, CurveArrival
+from strawberry.dataset import LocalInputDataset, LocalStreamingInputDataset, MmapInputDataset, S3InputDataset, LocalOutputDataset, ShardedLocalOutputDataset, S3OutputDataset, ShardedS3OutputDataset, DummyOutputDataset, FiniteSampler, InfiniteSampler, TraceSampler, RetryingSampler
+
+
+def local_input_output_factory(arguments, partition: tuple[int, int] = (0, 1)):
+    output_dataset = output_factory(arguments)
+    if arguments.workloads is not None:
+        # every workload of mix has its own input and sampler, they are made by run_factory
+        return None, output_dataset, None
+    input_dataset = input_factory(arguments)
+    sampler = sampler_factory(arguments, input_dataset, output_dataset, partition)
+    return input_dataset, output_dataset, sampler
+
+
+def input_factory(arguments):
+    input_dataset = None
+
+    if arguments.input == "local":
+        if arguments.input_local_path is not None:
+            input_dataset = LocalInputDataset(arguments.input_local_path)
+        else:
+            raise ValueError("If using local input, --input_local_path must be specified")
+    elif arguments.input == "local_stream":
+        if arguments.input_local_path is not None:
+            input_dataset = LocalStreamingInputDataset(arguments.input_local_path)
+        else:
+            raise ValueError("If using local_stream input, --input_local_path must be specified")
+    elif arguments.input == "local_mmap":
+        if arguments.input_local_path is not None:
+            input_dataset = MmapInputDataset(arguments.input_local_path, index_path=arguments.input_index_path)
+        else:
+            raise ValueError("If using local_mmap input, --input_local_path must be specified")
+    elif arguments.input == "s3":
+        if arguments.input_s3_path is None:
+            raise ValueError("input_s3_path must be specified if using s3 input")
+        if arguments.input_s3_bucket is None:
+            raise ValueError("input_s3_bucket must be specified if using s3 input")
+        if arguments.input_s3_aws_access_key_id is None:
+            raise ValueError("input_s3_aws_access_key_id must be specified if using s3 input")
+        if arguments.input_s3_aws_secret_access_key is None:
+            raise ValueError("input_s3_aws_secret_access_key must be specified if using s3 input")
+        if arguments.input_s3_endpoint_url is None:
+            raise ValueError("input_s3_endpoint_url must be specified if using s3 input")
+        if arguments.input_s3_region_name is None:
+            raise ValueError("input_s3_region_name must be specified if using s3 input")
+        input_dataset = S3InputDataset(
+            aws_access_key=arguments.input_s3_aws_access_key_id,
+            aws_secret_key=arguments.input_s3_aws_secret_access_key,
+            bucket=arguments.input_s3_bucket,
+            address=arguments.input_s3_endpoint_url,
+            path=arguments.input_s3_path,
+            input_s3_region_name=arguments.input_s3_region_name,
+            chunk_size=arguments.input_s3_chunk_size_mb * 1024 * 1024,
+            prefetch=arguments.input_s3_prefetch
+        )
+    else:
+        raise ValueError("Unknown type for input, support local, local_stream, local_mmap, s3")
+    return input_dataset
+
+
+def output_factory(arguments):
+    output_dataset = None
+
+    if arguments.output is None:
+        output_dataset = DummyOutputDataset()
+    elif arguments.output == "local":
+        if arguments.output_local_path is not None:
+            output_dataset = LocalOutputDataset(arguments.output_local_path)
+        else:
+            raise ValueError("If using local output, --output_local_path must be specified")
+    elif arguments.output == "local_sharded":
+        if arguments.output_local_path is not None:
+            output_dataset = ShardedLocalOutputDataset(
+                arguments.output_local_path,
+                shard_size=arguments.output_shard_size_mb * 1024 * 1024,
+                fsync_interval=arguments.output_fsync_interval
+            )
+        else:
+            raise ValueError("If using local_sharded output, --output_local_path must be specified")
+    elif arguments.output in ("s3", "s3_sharded"):
+        if arguments.output_s3_path is None:
+            raise ValueError("output_s3_path must be specified if using s3")
+        if arguments.output_s3_bucket is None:
+            raise ValueError("output_s3_bucket if use s3")
+        if arguments.output_s3_aws_access_key_id is None:
+            raise ValueError("output_s3_aws_access_key_id if use s3")
+        if arguments.output_s3_aws_secret_access_key is None:
+            raise ValueError("output_s3_aws_secret_access_key if use s3")
+        if arguments.output_s3_endpoint_url is None:
+            raise ValueError("output_s3_endpoint_url if use s3")
+        if arguments.output_s3_region_name is None:
+            raise ValueError("output_s3_region_name is use s3")
+
+        s3_arguments = dict(
+            aws_access_key=arguments.output_s3_aws_access_key_id,
+            aws_secret_key=arguments.output_s3_aws_secret_access_key,
+            bucket=arguments.output_s3_bucket,
+            address=arguments.output_s3_endpoint_url,
+            base_path=arguments.output_s3_path,
+            output_s3_region_name=arguments.output_s3_region_name
+        )
+        if arguments.output == "s3":
+            output_dataset = S3OutputDataset(**s3_arguments)
+        else:
+            output_dataset = ShardedS3OutputDataset(
+                shard_size=arguments.output_shard_size_mb * 1024 * 1024,
+                shard_interval=arguments.output_shard_interval,
+                upload_concurrency=arguments.output_upload_concurrency,
+                upload_retries=arguments.output_upload_retries,
+                codec=arguments.output_codec,
+                **s3_arguments
+            )
+    else:
+        raise ValueError("Unknown type for output, local, local_sharded, s3, s3_sharded are supported")
+    return output_dataset
+
+
+def sampler_factory(arguments, input_dataset, output_dataset, partition: tuple[int, int] = (0, 1)):
+    sampler = None
+
+    if arguments.sampler == "finite":
+        sampler = FiniteSampler(
+            input_dataset=input_dataset,
+            output_dataset=output_dataset,
+            overwrite=arguments.overwrite,
+            partition=partition,
+            shuffle_buffer_size=arguments.shuffle_buffer_size,
+            order=arguments.order
+        )
+    elif arguments.sampler == "infinite":
+        sampler = InfiniteSampler(input_dataset=input_dataset, output_dataset=output_dataset, overwrite=arguments.overwrite, partition=partition)
+    elif arguments.sampler == "trace":
+        sampler = TraceSampler(
+            input_dataset=input_dataset,
+            output_dataset=output_dataset,
+            overwrite=arguments.overwrite,
+            partition=partition,
+            timestamp_field=arguments.trace_timestamp_field
+        )
+    else:
+        raise ValueError("sampler finite, infinite, trace")
+        
+    return sampler
+
+
+def workloads_factory(arguments, output_dataset, partition: tuple[int, int] = (0, 1)) -> list[Workload]:
+    # json list of workloads, every workload has name, weight and any arguments of its own for example
+    # input_local_path, sampler, wait_start, wait_end, arrival, arrival_rate. Other arguments are taken from command line
+    with open(arguments.workloads, "r", encoding="utf-8") as file:
+        entries = json.load(file)
+    if len(entries) == 0:
+        raise ValueError("Workloads file must contain at least one workload")
+    if arguments.mode not in ("closed", "open"):
+        raise ValueError("Mix of workloads is supported in closed and open modes")
+    index, count = partition
+    total_weight = sum(entry.get("weight", 1.0) for entry in entries)
+
+    workloads = []
+    for entry in entries:
+        overrides = {name: value for name, value in entry.items() if name not in ("name", "weight")}
+        if "name" not in entry:
+            raise ValueError("Every workload must have name")
+        unknown = sorted(set(overrides) - set(vars(arguments)))
+        if unknown:
+            raise ValueError(f"Unknown arguments {unknown} of workload {entry['name']}")
+        workload_arguments = argparse.Namespace(**{**vars(arguments), **overrides})
+        input_dataset = input_factory(workload_arguments)
+        sampler = sampler_factory(workload_arguments, input_dataset, output_dataset, partition)
+        weight = entry.get("weight", 1.0)
+        arrival = None
+        if arguments.mode == "open":
+            # arrival rate of command line is split by weight unless workload has its own schedule
+            share = 1.0 if "arrival_rate" in overrides or "arrival_curve_path" in overrides else weight / total_weight
+            arrival = arrival_factory(workload_arguments, scale=share / count)
+        workloads.append(Workload(
+            name=str(entry["name"]),
+            weight=weight,
+            dataset=sampler,
+            wait=lambda wait_start=workload_arguments.wait_start, wait_end=workload_arguments.wait_end: random.uniform(wait_start, wait_end),
+            arrival=arrival
+        ))
+    return workloads
+
+
+ENDPOINT_ARGUMENTS = {
+    "openai_base_url",
+    "model_name",
+    "token",
+    "requester",
+    "http_max_connections",
+    "http_max_keepalive_connections",
+    "http_keepalive_expiry",
+    "http2",
+    "measure_connection_time",
+}
+
+
+def endpoints_factory(arguments) -> list[Endpoint]:
+    # json list of endpoints, every endpoint has name, weight and any of openai_base_url, model_name, token, requester
+    # and http arguments of its own. Other arguments are taken from command line
+    with open(arguments.endpoints, "r", encoding="utf-8") as file:
+        entries = json.load(file)
+    if len(entries) == 0:
+        raise ValueError("Endpoints file must contain at least one endpoint")
+    if arguments.routing in ("mirror", "split") and len(entries) < 2:
+        raise ValueError("A/B routing needs at least two endpoints")
+
+    endpoints = []
+    for entry in entries:
+        overrides = {name: value for name, value in entry.items() if name not in ("name", "weight")}
+        if "name" not in entry:
+            raise ValueError("Every endpoint must have name")
+        unknown = sorted(set(overrides) - ENDPOINT_ARGUMENTS)
+        if unknown:
+            raise ValueError(f"Unknown arguments {unknown} of endpoint {entry['name']}")
+        endpoint_arguments = argparse.Namespace(**{**vars(arguments), **overrides})
+        endpoints.append(Endpoint(
+            name=str(entry["name"]),
+            weight=entry.get("weight", 1.0),
+            base_url=endpoint_arguments.openai_base_url,
+            api_key=endpoint_arguments.token,
+            model_name=endpoint_arguments.model_name,
+            requester_name=endpoint_arguments.requester,
+            requester_options=requester_options_factory(endpoint_arguments)
+        ))
+    if len({endpoint.name for endpoint in endpoints}) != len(endpoints):
+        raise ValueError("Endpoint names must be unique")
+    return endpoints
+
+
+def requester_options_factory(arguments) -> dict:
+    return dict(
+        max_connections=arguments.http_max_connections,
+        max_keepalive_connections=arguments.http_max_keepalive_connections,
+        keepalive_expiry=arguments.http_keepalive_expiry,
+        http2=arguments.http2,
+        measure_connection_time=arguments.measure_connection_time
+    )
+
+
+def timeline_factory(arguments, partition: tuple[int, int] = (0, 1)):
+    if arguments.timeline_path is None:
+        return None
+    index, count = partition
+    path = arguments.timeline_path
+    if count > 1:
+        # every worker writes its own file
+        path = path.with_name(f"{path.stem}-{index}{path.suffix}")
+    return TimelineWriter(path, include_gaps=arguments.timeline_gaps)
+
+
+def pusher_factory(arguments, registry: prometheus_client.CollectorRegistry = prometheus_client.REGISTRY):
+    # returns started pusher or None when metrics are only scraped
+    if arguments.push_gateway is None:
+        return None
+    pusher = MetricsPusher(arguments.push_gateway, interval=arguments.push_interval, registry=registry)
+    pusher.start()
+    return pusher
+
+
+def response_cache_factory(arguments):
+    if arguments.response_cache_path is None:
+        return None
+    return ResponseCache(arguments.response_cache_path, max_size=arguments.response_cache_size_mb * 1024 * 1024)
+
+
+def window_factory(arguments, partition: tuple[int, int] = (0, 1)):
+    # request counts are split between workers like users, every worker moves through phases on its own
+    index, count = partition
+    if arguments.warmup_time <= 0 and arguments.warmup_requests <= 0 and arguments.cooldown_time <= 0 and arguments.steady_requests is None:
+        return None
+    return MeasurementWindow(
+        warmup_time=arguments.warmup_time,
+        warmup_requests=arguments.warmup_requests // count,
+        cooldown_time=arguments.cooldown_time,
+        steady_requests=max(1, arguments.steady_requests // count) if arguments.steady_requests is not None else None
+    )
+
+
+def arrival_factory(arguments, scale: float = 1.0):
+    if arguments.arrival == "constant":
+        if arguments.arrival_rate is None:
+            raise ValueError("If using constant arrival, --arrival_rate must be specified")
+        return ConstantArrival(rate=arguments.arrival_rate * scale)
+    elif arguments.arrival == "poisson":
+        if arguments.arrival_rate is None:
+            raise ValueError("If using poisson arrival, --arrival_rate must be specified")
+        return PoissonArrival(rate=arguments.arrival_rate * scale)
+    elif arguments.arrival == "curve":
+        if arguments.arrival_curve_path is None:
+            raise ValueError("If using curve arrival, --arrival_curve_path must be specified")
+        return CurveArrival.from_file(arguments.arrival_curve_path, poisson=arguments.arrival_curve_poisson, scale=scale)
+    else:
+        raise ValueError("Unknown type for arrival, constant, poisson, curve are supported")
+
+
+def run_factory(arguments, prometheus: Prometheus, sampler, output_dataset, partition: tuple[int, int] = (0, 1), start_barrier=None):
+    # partition is (worker index, workers count), users, spawn rate and arrival rate are split between workers
+    index, count = partition
+    max_users = arguments.max_users // count + (1 if index < arguments.max_users % count else 0)
+    workloads = workloads_factory(arguments, output_dataset, partition=partition) if arguments.workloads is not None else None
+    samplers = [workload.dataset for workload in workloads] if workloads is not None else [sampler]
+    prometheus.set_goodput_targets(ttft=arguments.goodput_ttft, tpot=arguments.goodput_tpot)
+    prometheus.set_window(window_factory(arguments, partition=partition))
+    prometheus.set_controller(None)
+    endpoints = endpoints_factory(arguments) if arguments.endpoints is not None else None
+
+    run_arguments = dict(
+        prometheus=prometheus, 
+        max_users=max_users, 
+        wait=lambda: random.uniform(arguments.wait_start, arguments.wait_end), 
+        spawn_rate=arguments.spawn_rate / count, 
+        run_time=arguments.run_time,
+        dataset=sampler,
+        base_url=arguments.openai_base_url,
+        api_key=arguments.token,
+        model_name=arguments.model_name,
+        output_dataset=output_dataset,
+        requester_name=arguments.requester,
+        requester_options=requester_options_factory(arguments),
+        start_barrier=start_barrier,
+        monitor=Monitor(prometheus, samplers, output_dataset, lag_threshold=arguments.lag_threshold),
+        workloads=workloads,
+        response_cache=response_cache_factory(arguments),
+        endpoints=endpoints,
+        routing=arguments.routing
+    )
+
+    if arguments.session_turns > 1:
+        if arguments.mode != "closed":
+            raise ValueError("Multi turn sessions are held by users of closed mode")
+        requester_names = [endpoint.requester_name for endpoint in endpoints] if endpoints is not None else [arguments.requester]
+        if any(name not in ("openai", "openai_raw") for name in requester_names):
+            raise ValueError("Multi turn sessions need chat completions, use openai or openai_raw requester")
+        run_arguments["session_options"] = dict(
+            turns=arguments.session_turns,
+            think_time=lambda: random.uniform(arguments.think_time_start, arguments.think_time_end),
+            follow_up=arguments.session_follow_up
+        )
+
+    if arguments.mode == "closed":
+        return Run(**run_arguments)
+    elif arguments.mode == "open":
+        # workloads of mix have arrival schedules of their own
+        arrival = arrival_factory(arguments, scale=1.0 / count) if workloads is None else None
+        return OpenLoopRun(arrival=arrival, **run_arguments)
+    elif arguments.mode == "trace":
+        if arguments.sampler != "trace":
+            raise ValueError("Trace mode needs trace sampler")
+        return TraceRun(speedup=arguments.trace_speedup, **run_arguments)
+    elif arguments.mode == "batch":
+        if arguments.sampler != "finite" or not isinstance(sampler, RetryingSampler):
+            raise ValueError("Batch mode needs finite sampler, it sends rows failed with retryable code again")
+        # ceiling of adaptive limit is split between workers like max_users of other modes
+        max_limit = max(1, arguments.batch_max_users // count + (1 if index < arguments.batch_max_users % count else 0))
+        controller = AimdController(
+            min_limit=min(arguments.batch_min_users, max_limit),
+            max_limit=max_limit,
+            initial_limit=max(1, arguments.batch_initial_users // count),
+            decrease=arguments.batch_decrease,
+            ttft_target=arguments.batch_ttft_target
+        )
+        # requesters made by run report to controller
+        prometheus.set_controller(controller)
+        return BatchRun(
+            controller=controller,
+            control_interval=arguments.batch_control_interval,
+            max_retries=arguments.max_retries,
+            retry_backoff=arguments.retry_backoff,
+            **run_arguments
+        )
+    else:
+        raise ValueError("Unknown mode, closed, open, trace, batch are supported")
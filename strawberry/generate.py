@@ -0,0 +1,230 @@
+import csv
+import json
+import math
+import time
+import random
+import argparse
+import collections
+
+from pathlib import Path
+from loguru import logger
+
+try:
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+try:
+    import orjson
+    _json_loads = orjson.loads
+    _json_dumps = orjson.dumps
+except ImportError:
+    _json_loads = json.loads
+    _json_dumps = lambda obj: json.dumps(obj).encode("utf-8")
+
+
+# short common words, each of them is single token in popular tokenizers so prompt of n words is about n tokens
+WORDS = (
+    "the of and to in is it that for on was with as be at by this from or an are not but have all can one more will up "
+    "out so what about which when there their time new some could them other than then now only its over also after use "
+    "two how our work first well way even want because any these give day most us"
+).split()
+
+
+def _lengths(row: dict) -> tuple[int, int] | None:
+    # request log line, timeline row or output of openai batch api
+    for usage in (row, row.get("usage"), ((row.get("response") or {}).get("body") or {}).get("usage")):
+        # csv timeline has empty strings for missing values
+        if isinstance(usage, dict) and usage.get("prompt_tokens") not in (None, "") and usage.get("completion_tokens") not in (None, ""):
+            return int(usage["prompt_tokens"]), int(usage["completion_tokens"])
+    return None
+
+
+class LengthHistogram:
+    # joint histogram of prompt and completion lengths, pairs are drawn together so correlation between long prompts
+    # and long answers of logs is kept
+    def __init__(self, counts: dict[tuple[int, int], int]) -> None:
+        if not counts:
+            raise ValueError("Histogram of lengths is empty")
+        self._pairs = list(counts)
+        self.max_prompt_tokens = max(prompt_tokens for prompt_tokens, completion_tokens in self._pairs)
+        self._cum_weights = []
+        total = 0
+        for pair in self._pairs:
+            total += counts[pair]
+            self._cum_weights.append(total)
+
+    @classmethod
+    def from_path(cls, path: Path) -> "LengthHistogram":
+        # jsonl logs with prompt_tokens and completion_tokens of every request, or timeline of past run
+        path = Path(path)
+        counts = collections.Counter()
+        if path.suffix == ".parquet":
+            if pyarrow is None:
+                raise ValueError("Reading parquet needs pyarrow")
+            table = pyarrow.parquet.read_table(path, columns=["status_code", "prompt_tokens", "completion_tokens"])
+            rows = table.to_pylist()
+        elif path.suffix == ".csv":
+            file = open(path, "r", encoding="utf-8", newline="")
+            rows = csv.DictReader(file)
+        else:
+            file = open(path, "rb")
+            rows = (_json_loads(line) for line in file if line.strip())
+        for row in rows:
+            # failed requests of timeline have no lengths
+            if row.get("status_code") not in (None, "", 200, "200"):
+                continue
+            lengths = _lengths(row)
+            if lengths is not None and lengths[0] > 0 and lengths[1] > 0:
+                counts[lengths] += 1
+        logger.info(f"Fitted {sum(counts.values())} requests of {path}, {len(counts)} distinct pairs of lengths")
+        return cls(counts)
+
+    def sample(self, rng: random.Random, k: int) -> list[tuple[int, int]]:
+        return rng.choices(self._pairs, cum_weights=self._cum_weights, k=k)
+
+
+class QuantileHistogram:
+    # rebuilds distributions of prompt and completion lengths from percentiles of prefill_tokens and decode_tokens
+    # in summary of past run. Lengths are interpolated linearly between percentiles and drawn independently
+    def __init__(self, prompt_quantiles: list[tuple[float, float]], completion_quantiles: list[tuple[float, float]]) -> None:
+        self._prompt_quantiles = prompt_quantiles
+        self._completion_quantiles = completion_quantiles
+        self.max_prompt_tokens = max(1, round(prompt_quantiles[-1][1]))
+
+    @classmethod
+    def from_summary(cls, path: Path) -> "QuantileHistogram":
+        with open(path, "r", encoding="utf-8") as file:
+            tokens = json.load(file)["tokens"]
+
+        def quantiles(stats: dict) -> list[tuple[float, float]]:
+            points = [(0.0, stats.get("min", 1.0))]
+            points += sorted((float(name[1:]) / 100, value) for name, value in stats.items() if name.startswith("p"))
+            points.append((1.0, stats["max"]))
+            return points
+
+        if "prefill_tokens" not in tokens or "decode_tokens" not in tokens:
+            raise ValueError(f"Summary {path} has no prefill_tokens and decode_tokens, run must report usage")
+        logger.info(f"Fitted percentiles of {tokens['prefill_tokens']['count']} requests of {path}")
+        return cls(quantiles(tokens["prefill_tokens"]), quantiles(tokens["decode_tokens"]))
+
+    @staticmethod
+    def _draw(quantiles: list[tuple[float, float]], u: float) -> int:
+        for (low_q, low), (high_q, high) in zip(quantiles, quantiles[1:]):
+            if u <= high_q:
+                fraction = (u - low_q) / (high_q - low_q) if high_q > low_q else 1.0
+                return max(1, round(low + (high - low) * fraction))
+        return max(1, round(quantiles[-1][1]))
+
+    def sample(self, rng: random.Random, k: int) -> list[tuple[int, int]]:
+        return [(self._draw(self._prompt_quantiles, rng.random()), self._draw(self._completion_quantiles, rng.random())) for _ in range(k)]
+
+
+class Generator:
+    # writes requests in format of LocalInputDataset. Prompts are slices of one random text so building them is
+    # cheap, every prompt starts with its id so prompts never share prefix by accident. Shared prefixes are
+    # system prompts, every request starts with one of them and it takes shared_prefix_ratio of its prompt
+    def __init__(
+        self,
+        histogram: LengthHistogram | QuantileHistogram,
+        request_format: str = "openai",
+        shared_prefix_ratio: float = 0.0,
+        shared_prefixes: int = 1,
+        ignore_eos: bool = False,
+        seed: int = 0
+    ) -> None:
+        if request_format not in ("openai", "sglang"):
+            raise ValueError("Unknown format, openai and sglang are supported")
+        if not 0 <= shared_prefix_ratio < 1:
+            raise ValueError("Shared prefix ratio must be in [0, 1)")
+        self._histogram = histogram
+        self._request_format = request_format
+        self._shared_prefix_ratio = shared_prefix_ratio
+        self._ignore_eos = ignore_eos
+        self._rng = random.Random(seed)
+        self._text, self._offsets = self._random_text(max(1 << 16, 2 * histogram.max_prompt_tokens))
+        prefix_words = math.floor(histogram.max_prompt_tokens * shared_prefix_ratio)
+        self._prefixes = [self._random_text(prefix_words) for _ in range(shared_prefixes)] if prefix_words > 0 else []
+
+    def _random_text(self, words: int) -> tuple[str, list[int]]:
+        # text and character offset of every word
+        chosen = self._rng.choices(WORDS, k=words)
+        offsets = [0]
+        for word in chosen:
+            offsets.append(offsets[-1] + len(word) + 1)
+        return " ".join(chosen) + " ", offsets
+
+    def _request(self, custom_id: int, prompt_tokens: int, completion_tokens: int) -> dict:
+        prefix_tokens = math.floor(prompt_tokens * self._shared_prefix_ratio)
+        words = max(0, prompt_tokens - prefix_tokens - 1)
+        start = self._rng.randrange(len(self._offsets) - words)
+        prompt = f"{custom_id} " + self._text[self._offsets[start]:self._offsets[start + words] - 1]
+        prefix = None
+        if prefix_tokens > 0:
+            text, offsets = self._prefixes[self._rng.randrange(len(self._prefixes))]
+            prefix = text[:offsets[prefix_tokens] - 1]
+
+        if self._request_format == "openai":
+            messages = [{"role": "user", "content": prompt}]
+            if prefix is not None:
+                messages.insert(0, {"role": "system", "content": prefix})
+            body = {"messages": messages, "max_tokens": completion_tokens}
+            if self._ignore_eos:
+                body["ignore_eos"] = True
+        else:
+            sampling_params = {"max_new_tokens": completion_tokens}
+            if self._ignore_eos:
+                sampling_params["ignore_eos"] = True
+            body = {"text": prompt if prefix is None else prefix + " " + prompt, "sampling_params": sampling_params}
+        return {"custom_id": custom_id, "body": body}
+
+    def write(self, path: Path, rows: int, batch_size: int = 8192) -> None:
+        # rows are built and written in batches so memory does not grow with size of dataset
+        start_time = time.perf_counter()
+        last_report = start_time
+        with open(path, "wb", buffering=1 << 20) as file:
+            for batch_start in range(0, rows, batch_size):
+                lengths = self._histogram.sample(self._rng, min(batch_size, rows - batch_start))
+                file.write(b"".join(
+                    _json_dumps(self._request(batch_start + index, prompt_tokens, completion_tokens)) + b"\n"
+                    for index, (prompt_tokens, completion_tokens) in enumerate(lengths)
+                ))
+                if time.perf_counter() - last_report > 10:
+                    last_report = time.perf_counter()
+                    done = batch_start + len(lengths)
+                    logger.info(f"Generated {done} / {rows} rows, {done / (last_report - start_time):.0f} rows/s")
+        logger.info(f"Generated {rows} rows to {path} in {time.perf_counter() - start_time:.1f} s")
+
+
+def parse_arguments(argv: list[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--output_path", type=Path, required=True)
+    parser.add_argument("--rows", type=int, required=True)
+    # jsonl logs with prompt_tokens and completion_tokens (top level, in usage or in response.body.usage) or timeline
+    parser.add_argument("--lengths_path", type=Path, required=False, default=None)
+    # summary of past run, its prefill_tokens and decode_tokens percentiles
+    parser.add_argument("--lengths_summary_path", type=Path, required=False, default=None)
+    parser.add_argument("--format", type=str, required=False, default="openai", help="openai or sglang")
+    parser.add_argument("--shared_prefix_ratio", type=float, required=False, default=0.0) # fraction of prompt taken by shared system prompt
+    parser.add_argument("--shared_prefixes", type=int, required=False, default=1) # number of distinct shared system prompts
+    parser.add_argument("--ignore_eos", action="store_true") # ask server to generate exactly max_tokens
+    parser.add_argument("--seed", type=int, required=False, default=0)
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    arguments = parse_arguments()
+    if (arguments.lengths_path is None) == (arguments.lengths_summary_path is None):
+        raise ValueError("Pass exactly one of --lengths_path and --lengths_summary_path")
+    if arguments.lengths_path is not None:
+        histogram = LengthHistogram.from_path(arguments.lengths_path)
+    else:
+        histogram = QuantileHistogram.from_summary(arguments.lengths_summary_path)
+    Generator(
+        histogram=histogram,
+        request_format=arguments.format,
+        shared_prefix_ratio=arguments.shared_prefix_ratio,
+        shared_prefixes=arguments.shared_prefixes,
+        ignore_eos=arguments.ignore_eos,
+        seed=arguments.seed
+    ).write(arguments.output_path, arguments.rows)
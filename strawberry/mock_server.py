@@ -0,0 +1,170 @@
+import json
+import time
+import collections
+import random
+import asyncio
+import argparse
+
+from aiohttp import web
+from loguru import logger
+
+
+class MockServer:
+    # fake inference server with known timings, latencies strawberry reports above them are overhead of client.
+    # Serves openai /v1/chat/completions and sglang /generate streams
+    def __init__(
+        self,
+        prefill_delay: float = 0.05,
+        prefill_delay_per_token: float = 0.0,
+        token_delay: float = 0.01,
+        tokens_per_chunk: int = 1,
+        output_tokens: int = 128,
+        output_tokens_distribution: str = "fixed",
+        error_rate: float = 0.0,
+        error_code: int = 503,
+        disconnect_rate: float = 0.0,
+        prefix_cache_entries: int = 0
+    ) -> None:
+        if output_tokens_distribution not in ("fixed", "uniform", "exponential"):
+            raise ValueError("Unknown output tokens distribution, fixed, uniform, exponential are supported")
+        self._prefill_delay = prefill_delay
+        self._prefill_delay_per_token = prefill_delay_per_token
+        self._token_delay = token_delay
+        self._tokens_per_chunk = tokens_per_chunk
+        self._output_tokens = output_tokens
+        self._output_tokens_distribution = output_tokens_distribution
+        self._error_rate = error_rate
+        self._error_code = error_code
+        self._disconnect_rate = disconnect_rate
+        # lru of shared chat prefixes, every message except last one, prefill of cached prefix costs nothing
+        self._prefix_cache_entries = prefix_cache_entries
+        self._prefix_cache = collections.OrderedDict()
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post("/v1/chat/completions", self._chat_completions)
+        app.router.add_post("/generate", self._generate)
+        return app
+
+    def _completion_tokens(self, max_tokens: int | None) -> int:
+        if self._output_tokens_distribution == "fixed":
+            tokens = self._output_tokens
+        elif self._output_tokens_distribution == "uniform":
+            tokens = random.randint(1, 2 * self._output_tokens - 1)
+        else:
+            tokens = max(1, round(random.expovariate(1.0 / self._output_tokens)))
+        return min(tokens, max_tokens) if max_tokens is not None else tokens
+
+    def _cached_tokens(self, messages: list) -> int:
+        if self._prefix_cache_entries <= 0 or len(messages) < 2:
+            return 0
+        key = json.dumps(messages[:-1], sort_keys=True)
+        if key in self._prefix_cache:
+            self._prefix_cache.move_to_end(key)
+            return sum(len(str(message.get("content", "")).split()) for message in messages[:-1])
+        self._prefix_cache[key] = True
+        if len(self._prefix_cache) > self._prefix_cache_entries:
+            self._prefix_cache.popitem(last=False)
+        return 0
+
+    async def _stream(self, request: web.Request, prompt_tokens: int, completion_tokens: int, event) -> web.StreamResponse:
+        # event(index, tokens) returns server sent event for chunk of tokens ending at index
+        if random.random() < self._error_rate:
+            return web.json_response({"error": {"message": "injected error"}}, status=self._error_code)
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream", "Cache-Control": "no-cache"})
+        await response.prepare(request)
+        # sleep to absolute deadlines so time spent on writing does not add up over long streams
+        deadline = time.perf_counter() + self._prefill_delay + self._prefill_delay_per_token * prompt_tokens
+        disconnect_at = random.randint(1, completion_tokens) if random.random() < self._disconnect_rate else None
+        sent = 0
+        while sent < completion_tokens:
+            await asyncio.sleep(max(0.0, deadline - time.perf_counter()))
+            tokens = min(self._tokens_per_chunk, completion_tokens - sent)
+            sent += tokens
+            if disconnect_at is not None and sent >= disconnect_at:
+                request.transport.close()
+                return response
+            await response.write(f"data: {json.dumps(event(sent, tokens))}\n\n".encode("utf-8"))
+            deadline += self._token_delay * tokens
+        return response
+
+    async def _chat_completions(self, request: web.Request) -> web.StreamResponse:
+        body = await request.json()
+        prompt_tokens = sum(len(str(message.get("content", "")).split()) for message in body.get("messages", []))
+        completion_tokens = self._completion_tokens(body.get("max_tokens") or body.get("max_completion_tokens"))
+        model = body.get("model", "mock")
+        cached_tokens = self._cached_tokens(body.get("messages", []))
+
+        def event(index: int, tokens: int) -> dict:
+            delta = {"content": " token" * tokens}
+            if index == tokens:
+                delta["role"] = "assistant"
+            return {
+                "id": "chatcmpl-mock",
+                "object": "chat.completion.chunk",
+                "created": 0,
+                "model": model,
+                "choices": [{"index": 0, "delta": delta, "logprobs": None, "finish_reason": "length" if index == completion_tokens else None}]
+            }
+
+        response = await self._stream(request, prompt_tokens - cached_tokens, completion_tokens, event)
+        if not response.prepared or request.transport is None or request.transport.is_closing():
+            return response
+        if (body.get("stream_options") or {}).get("include_usage"):
+            usage = {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens, "total_tokens": prompt_tokens + completion_tokens}
+            await response.write(f"data: {json.dumps({'id': 'chatcmpl-mock', 'object': 'chat.completion.chunk', 'created': 0, 'model': model, 'choices': [], 'usage': usage})}\n\n".encode("utf-8"))
+        await response.write(b"data: [DONE]\n\n")
+        return response
+
+    async def _generate(self, request: web.Request) -> web.StreamResponse:
+        body = await request.json()
+        prompt_tokens = len(str(body.get("text", "")).split())
+        sampling_params = body.get("sampling_params") or {}
+        completion_tokens = self._completion_tokens(sampling_params.get("max_new_tokens"))
+
+        def event(index: int, tokens: int) -> dict:
+            # sglang sends whole text generated so far together with running token counts
+            return {
+                "text": " token" * index,
+                "meta_info": {"prompt_tokens": prompt_tokens, "completion_tokens": index}
+            }
+
+        response = await self._stream(request, prompt_tokens, completion_tokens, event)
+        if response.prepared and request.transport is not None and not request.transport.is_closing():
+            await response.write(b"data: [DONE]\n\n")
+        return response
+
+
+def parse_arguments(argv: list[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", type=str, required=False, default="0.0.0.0")
+    parser.add_argument("--port", type=int, required=False, default=8000)
+    parser.add_argument("--prefill_delay", type=float, required=False, default=0.05) # seconds before first chunk
+    parser.add_argument("--prefill_delay_per_token", type=float, required=False, default=0.0) # added per prompt word
+    parser.add_argument("--token_delay", type=float, required=False, default=0.01) # seconds per output token
+    parser.add_argument("--tokens_per_chunk", type=int, required=False, default=1)
+    parser.add_argument("--output_tokens", type=int, required=False, default=128) # mean, capped by max_tokens of request
+    parser.add_argument("--output_tokens_distribution", type=str, required=False, default="fixed", help="fixed, uniform or exponential")
+    parser.add_argument("--error_rate", type=float, required=False, default=0.0) # fraction of requests answered with --error_code
+    parser.add_argument("--error_code", type=int, required=False, default=503)
+    parser.add_argument("--disconnect_rate", type=float, required=False, default=0.0) # fraction of streams cut in the middle
+    parser.add_argument("--prefix_cache_entries", type=int, required=False, default=0) # chat prefixes kept in simulated prefix cache
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    arguments = parse_arguments()
+    server = MockServer(
+        prefill_delay=arguments.prefill_delay,
+        prefill_delay_per_token=arguments.prefill_delay_per_token,
+        token_delay=arguments.token_delay,
+        tokens_per_chunk=arguments.tokens_per_chunk,
+        output_tokens=arguments.output_tokens,
+        output_tokens_distribution=arguments.output_tokens_distribution,
+        error_rate=arguments.error_rate,
+        error_code=arguments.error_code,
+        disconnect_rate=arguments.disconnect_rate,
+        prefix_cache_entries=arguments.prefix_cache_entries
+    )
+    logger.info(f"Mock server listens on {arguments.host}:{arguments.port}")
+    web.run_app(server.app(), host=arguments.host, port=arguments.port, print=None, access_log=None)
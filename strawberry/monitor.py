@@ -0,0 +1,65 @@
+import time
+import asyncio
+
+from loguru import logger
+from strawberry.prometheus import Prometheus
+from strawberry.dataset import Sampler, OutputDataset
+
+
+class Monitor:
+    # watches client itself. Ticker task sleeps for interval and measures how late it wakes up, this lag is added to
+    # every latency measured in same event loop. When lag is above threshold run is marked as not trustworthy
+    def __init__(
+        self,
+        prometheus: Prometheus,
+        samplers: list[Sampler],
+        output_dataset: OutputDataset,
+        interval: float = 0.1,
+        lag_threshold: float = 0.05
+    ) -> None:
+        self._prometheus = prometheus
+        # samplers of all workloads, their queue depths are summed
+        self._samplers = samplers
+        self._output_dataset = output_dataset
+        self._interval = interval
+        self._lag_threshold = lag_threshold
+        self._task = None
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._tick())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _tick(self) -> None:
+        loop = asyncio.get_running_loop()
+        wall_time = time.perf_counter()
+        cpu_time = time.process_time()
+        last_warning = None
+        ticks = 0
+        while True:
+            expected = loop.time() + self._interval
+            await asyncio.sleep(self._interval)
+            lag = max(0.0, loop.time() - expected)
+            self._prometheus.event_loop_lag_metric(lag)
+            if lag > self._lag_threshold:
+                self._prometheus.event_loop_lag_breach()
+                if last_warning is None or loop.time() - last_warning > 5.0:
+                    last_warning = loop.time()
+                    logger.warning(
+                        f"Event loop lag {lag * 1000:.1f} ms is above {self._lag_threshold * 1000:.1f} ms, client is saturated "
+                        f"and measured latencies are inflated. Lower load per process or use more --workers"
+                    )
+
+            # slower gauges are updated about once per second
+            ticks += 1
+            if ticks * self._interval >= 1.0:
+                ticks = 0
+                now_wall, now_cpu = time.perf_counter(), time.process_time()
+                self._prometheus.process_cpu_utilization((now_cpu - cpu_time) / (now_wall - wall_time))
+                wall_time, cpu_time = now_wall, now_cpu
+                self._prometheus.sampler_queue_depth(sum(sampler.queue_depth() for sampler in self._samplers))
+                self._prometheus.output_backlog(self._output_dataset.backlog())
@@ -1,15 +1,97 @@
+import os
+import copy
 import math
+import socket
+import threading
 import prometheus_client
+import prometheus_client.multiprocess
+
+from loguru import logger
+from strawberry.recorder import Recorder, WorkloadRecorder, PhaseRecorder, EndpointRecorder
+from strawberry.timeline import TimelineWriter
+from strawberry.window import MeasurementWindow
+from strawberry.controller import AimdController
+
+
+def multiprocess_registry() -> prometheus_client.CollectorRegistry:
+    # collects metrics written by all worker processes to PROMETHEUS_MULTIPROC_DIR
+    registry = prometheus_client.CollectorRegistry()
+    prometheus_client.multiprocess.MultiProcessCollector(registry)
+    return registry
+
+
+class MetricsPusher:
+    # pushes snapshot of all metrics to pushgateway from background thread every interval and once more on stop, so
+    # observations of short runs reach storage even if process exits before next scrape. Every process pushes to its
+    # own group so workers and agents do not overwrite each other
+    def __init__(self, gateway: str, interval: float, registry: prometheus_client.CollectorRegistry = prometheus_client.REGISTRY) -> None:
+        self._gateway = gateway
+        self._interval = interval
+        self._registry = registry
+        self._grouping_key = {"instance": f"{socket.gethostname()}:{os.getpid()}"}
+        self._stopped = threading.Event()
+        self._thread = None
+        self._failing = False
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._loop, name="strawberry-pusher", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        # final flush after all observations are made
+        self._push()
+
+    def _loop(self) -> None:
+        while not self._stopped.wait(self._interval):
+            self._push()
+
+    def _push(self) -> None:
+        try:
+            prometheus_client.push_to_gateway(self._gateway, job="strawberry", registry=self._registry, grouping_key=self._grouping_key)
+            if self._failing:
+                logger.info(f"Metrics are pushed to {self._gateway} again")
+            self._failing = False
+        except Exception as e:
+            # failure is logged once until push succeeds again
+            if not self._failing:
+                logger.warning(f"Could not push metrics to {self._gateway}: {e}")
+            self._failing = True
 
 
 class Prometheus:
-    def __init__(self, run: str, prometheus_port: int) -> None:
+    def __init__(self, run: str, prometheus_port: int | None, timeline: TimelineWriter | None = None) -> None:
+        # prometheus_port is None for worker processes, their metrics are served by parent process
         self._run = run
-        prometheus_client.start_http_server(prometheus_port)
+        # class of traffic in mix of workloads, empty when run has one workload
+        self._workload = ""
+        self._workloads = {}
+        # phase of measurement window request started in, empty when run has no window
+        self._phase = ""
+        self._phases = {}
+        self._window = None
+        # whether completed requests move measurement window, mirrored requests are counted once by router
+        self._window_progress = True
+        # adaptive concurrency controller of batch mode, gets ttft and response codes of all requests
+        self._controller = None
+        # serving target when run has several endpoints, empty when run has one
+        self._endpoint = ""
+        # slo of goodput in seconds, None means target is not checked
+        self._goodput_ttft = None
+        self._goodput_tpot = None
+        # exact copy of observations for summary at the end of run
+        self._recorder = Recorder()
+        # optional row per request for analysis after run
+        self._timeline = timeline
+        if prometheus_port is not None:
+            prometheus_client.start_http_server(prometheus_port)
         self._request_latency_metric = prometheus_client.Histogram(
             name="request_total_latency_seconds",
             documentation="Total latency of request in seconds",
-            labelnames=["run"],
+            labelnames=["run", "workload", "phase", "endpoint"],
             buckets=[
                 0.005, 0.01, 0.025, 0.05, 0.075, 0.1,
                 0.25, 0.5, 0.75, 1.0, 2.5, 5.0, 7.5, 10.0,
@@ -20,7 +102,7 @@ class Prometheus:
         self._request_time_to_first_token_latency_metric = prometheus_client.Histogram(
             name="request_time_to_first_token_latency_seconds",
             documentation="Time to first token latency in seconds",
-            labelnames=["run"],
+            labelnames=["run", "workload", "phase", "endpoint"],
             buckets=[
                 0.005, 0.01, 0.025, 0.05, 0.075, 0.1,
                 0.25, 0.5, 0.75, 1.0, 2.5, 5.0, 7.5, 10.0,
@@ -28,10 +110,62 @@ class Prometheus:
                 320.0, 640.0, math.inf,
             ],
         )
+        # gap between stream chunks under its original name and buckets so existing dashboards keep their meaning,
+        # deprecated in favour of request_tpot_seconds and request_inter_chunk_latency_seconds
         self._request_time_per_output_token_latency_metric = prometheus_client.Histogram(
             name="request_time_per_output_token_latency_seconds",
-            documentation="Time per output token latency in seconds",
-            labelnames=["run"],
+            documentation="Deprecated, time between consecutive stream chunks in seconds, use request_tpot_seconds",
+            labelnames=["run", "workload", "phase", "endpoint"],
+            buckets=[
+                0.005, 0.01, 0.025, 0.05, 0.075, 0.1,
+                0.25, 0.5, 0.75, 1.0, 2.5, 5.0, 7.5, 10.0,
+                15.0, 20.0, 25.0, 30.0, 40.0, 80.0, 160.0,
+                320.0, 640.0, math.inf,
+            ],
+        )
+        self._request_tpot_metric = prometheus_client.Histogram(
+            name="request_tpot_seconds",
+            documentation="Time per output token of request in seconds, (total latency - ttft) / (completion tokens - 1)",
+            labelnames=["run", "workload", "phase", "endpoint"],
+            buckets=[
+                0.001, 0.0025, 0.005, 0.01, 0.015, 0.02, 0.025, 0.035, 0.05, 0.075, 0.1,
+                0.25, 0.5, 0.75, 1.0, 2.5, 5.0, 10.0, math.inf,
+            ],
+        )
+        self._request_inter_chunk_latency_metric = prometheus_client.Histogram(
+            name="request_inter_chunk_latency_seconds",
+            documentation="Time between consecutive stream chunks in seconds, chunk can carry several tokens",
+            labelnames=["run", "workload", "phase", "endpoint"],
+            buckets=[
+                0.001, 0.0025, 0.005, 0.01, 0.015, 0.02, 0.025, 0.035, 0.05, 0.075, 0.1,
+                0.25, 0.5, 0.75, 1.0, 2.5, 5.0, 10.0, math.inf,
+            ],
+        )
+        self._request_output_tokens_per_second_metric = prometheus_client.Histogram(
+            name="request_output_tokens_per_second",
+            documentation="Completion tokens of request per second of its total latency",
+            labelnames=["run", "workload", "phase", "endpoint"],
+            buckets=[
+                1, 2, 5, 10, 20, 30, 40, 50, 75, 100, 150, 200,
+                300, 500, 1000, 2000, 5000, math.inf,
+            ],
+        )
+        # requests and tokens of successful requests that met ttft and tpot targets, all successful requests meet
+        # targets that are not set
+        self._goodput_requests = prometheus_client.Counter(
+            name="goodput_requests",
+            documentation="Successful requests that met ttft and tpot targets",
+            labelnames=["run", "workload", "phase", "endpoint"]
+        )
+        self._goodput_tokens = prometheus_client.Counter(
+            name="goodput_tokens",
+            documentation="Completion tokens of successful requests that met ttft and tpot targets",
+            labelnames=["run", "workload", "phase", "endpoint"]
+        )
+        self._request_queue_delay_metric = prometheus_client.Histogram(
+            name="request_queue_delay_seconds",
+            documentation="Delay between intended and actual start of request in seconds",
+            labelnames=["run", "workload", "phase", "endpoint"],
             buckets=[
                 0.005, 0.01, 0.025, 0.05, 0.075, 0.1,
                 0.25, 0.5, 0.75, 1.0, 2.5, 5.0, 7.5, 10.0,
@@ -42,17 +176,24 @@ class Prometheus:
         self._requests_count_metric = prometheus_client.Counter(
             name="requests_count",
             documentation="Total number of requests that are coming to server",
-            labelnames=["run"]
+            labelnames=["run", "workload", "phase", "endpoint"]
         )
         self._users_count = prometheus_client.Gauge(
             name="users",
             documentation="Number of users sending requests",
-            labelnames=["run"]
+            labelnames=["run", "workload", "phase", "endpoint"],
+            multiprocess_mode="livesum"
+        )
+        self._users_limit = prometheus_client.Gauge(
+            name="users_limit",
+            documentation="Limit of requests in flight set by adaptive concurrency controller",
+            labelnames=["run", "workload", "phase", "endpoint"],
+            multiprocess_mode="livesum"
         )
         self._prefill_tokens = prometheus_client.Histogram(
             name="prefill_tokens",
             documentation="Number of prefill tokens processed",
-            labelnames=["run"],
+            labelnames=["run", "workload", "phase", "endpoint"],
             buckets=[
                 1, 2, 4, 8, 16, 32, 64, 128, 256, 512,
                 1024, 2048, 4096, 8192, 16384, 32768,
@@ -62,22 +203,27 @@ class Prometheus:
         self._decode_tokens = prometheus_client.Histogram(
             name="decode_tokens",
             documentation="Number of decode tokens processed",
-            labelnames=["run"],
+            labelnames=["run", "workload", "phase", "endpoint"],
             buckets=[
                 1, 2, 4, 8, 16, 32, 64, 128, 256, 512,
                 1024, 2048, 4096, 8192, 16384, 32768,
                 65536, 131072, 262144, 524288, 1048576, math.inf
             ]
         )
+        self._requests_cancelled = prometheus_client.Counter(
+            name="requests_cancelled",
+            documentation="Requests cancelled by client before response was received, at end of run",
+            labelnames=["run", "workload", "phase", "endpoint"]
+        )
         self._response_code_count_metric = prometheus_client.Counter(
             name="response_code",
             documentation="Total number of errors",
-            labelnames=["run", "code"]
+            labelnames=["run", "workload", "phase", "endpoint", "code"]
         )
         self._prefill_time_seconds = prometheus_client.Histogram(
             name="prefill_time_seconds",
             documentation="Time spent on prefill phase in seconds",
-            labelnames=["run"],
+            labelnames=["run", "workload", "phase", "endpoint"],
             buckets=[
                 0.005, 0.01, 0.025, 0.05, 0.075, 0.1,
                 0.25, 0.5, 0.75, 1.0, 2.5, 5.0, 7.5, 10.0,
@@ -88,7 +234,7 @@ class Prometheus:
         self._decode_time_seconds = prometheus_client.Histogram(
             name="decode_time_seconds",
             documentation="Time spent on decode phase in seconds",
-            labelnames=["run"],
+            labelnames=["run", "workload", "phase", "endpoint"],
             buckets=[
                 0.005, 0.01, 0.025, 0.05, 0.075, 0.1,
                 0.25, 0.5, 0.75, 1.0, 2.5, 5.0, 7.5, 10.0,
@@ -96,36 +242,314 @@ class Prometheus:
                 320.0, 640.0, math.inf,
             ]
         )
+        self._connection_time_seconds = prometheus_client.Histogram(
+            name="connection_time_seconds",
+            documentation="Time spent on opening connection to server in seconds, 0 when pooled connection is reused",
+            labelnames=["run", "workload", "phase", "endpoint"],
+            buckets=[
+                0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.075, 0.1,
+                0.25, 0.5, 0.75, 1.0, 2.5, 5.0, 7.5, 10.0, math.inf,
+            ]
+        )
+
+        # multi turn sessions, turn label is index of request in session so effect of prefix cache is seen per turn
+        self._turn_time_to_first_token_latency_metric = prometheus_client.Histogram(
+            name="turn_time_to_first_token_latency_seconds",
+            documentation="Time to first token latency of session turn in seconds",
+            labelnames=["run", "workload", "phase", "endpoint", "turn"],
+            buckets=[
+                0.005, 0.01, 0.025, 0.05, 0.075, 0.1,
+                0.25, 0.5, 0.75, 1.0, 2.5, 5.0, 7.5, 10.0,
+                15.0, 20.0, 25.0, 30.0, 40.0, 80.0, 160.0,
+                320.0, 640.0, math.inf,
+            ],
+        )
+        self._turn_prefill_tokens = prometheus_client.Histogram(
+            name="turn_prefill_tokens",
+            documentation="Number of prefill tokens of session turn",
+            labelnames=["run", "workload", "phase", "endpoint", "turn"],
+            buckets=[
+                1, 2, 4, 8, 16, 32, 64, 128, 256, 512,
+                1024, 2048, 4096, 8192, 16384, 32768,
+                65536, 131072, 262144, 524288, 1048576, math.inf
+            ]
+        )
+
+        # self metrics of client, when client is saturated all latencies above are inflated
+        self._event_loop_lag_seconds = prometheus_client.Histogram(
+            name="event_loop_lag_seconds",
+            documentation="Delay of event loop in running ready task in seconds",
+            labelnames=["run", "workload", "phase", "endpoint"],
+            buckets=[
+                0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.075, 0.1,
+                0.25, 0.5, 0.75, 1.0, 2.5, 5.0, 10.0, math.inf,
+            ]
+        )
+        self._requests_in_flight = prometheus_client.Gauge(
+            name="requests_in_flight",
+            documentation="Number of requests sent and not yet finished",
+            labelnames=["run", "workload", "phase", "endpoint"],
+            multiprocess_mode="livesum"
+        )
+        self._process_cpu_utilization = prometheus_client.Gauge(
+            name="process_cpu_utilization",
+            documentation="Cpu time of client process per second of wall time, 1 is one fully used core",
+            labelnames=["run", "workload", "phase", "endpoint"],
+            multiprocess_mode="livesum"
+        )
+        self._sampler_queue_depth = prometheus_client.Gauge(
+            name="sampler_queue_depth",
+            documentation="Number of rows sampler can return without waiting for input",
+            labelnames=["run", "workload", "phase", "endpoint"],
+            multiprocess_mode="livesum"
+        )
+        self._output_backlog = prometheus_client.Gauge(
+            name="output_backlog",
+            documentation="Number of responses accepted by output and not yet persisted",
+            labelnames=["run", "workload", "phase", "endpoint"],
+            multiprocess_mode="livesum"
+        )
+        self._output_write_latency_seconds = prometheus_client.Histogram(
+            name="output_write_latency_seconds",
+            documentation="Time spent on handing response to output in seconds",
+            labelnames=["run", "workload", "phase", "endpoint"],
+            buckets=[
+                0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.075, 0.1,
+                0.25, 0.5, 0.75, 1.0, 2.5, 5.0, 10.0, math.inf,
+            ]
+        )
+
+        self._dispatch_lag_seconds = prometheus_client.Histogram(
+            name="dispatch_lag_seconds",
+            documentation="Delay between scheduled and actual dispatch of request in open loop and trace modes in seconds",
+            labelnames=["run", "workload", "phase", "endpoint"],
+            buckets=[
+                0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.075, 0.1,
+                0.25, 0.5, 0.75, 1.0, 2.5, 5.0, 10.0, math.inf,
+            ]
+        )
+        self._response_cache_hits = prometheus_client.Counter(
+            name="response_cache_hits",
+            documentation="Requests answered from response cache or by identical request in flight",
+            labelnames=["run", "workload", "phase", "endpoint"]
+        )
+        self._response_cache_misses = prometheus_client.Counter(
+            name="response_cache_misses",
+            documentation="Deterministic requests that were sent to server because response was not cached",
+            labelnames=["run", "workload", "phase", "endpoint"]
+        )
+
+    @property
+    def recorder(self) -> Recorder:
+        return self._recorder
+
+    def set_run(self, run: str) -> None:
+        # following observations go to series of new run label and to new recorder, used by sweep for every step
+        self._run = run
+        self._recorder = Recorder()
+        self._workloads = {}
+        self._phases = {}
+
+    def set_timeline(self, timeline: TimelineWriter | None) -> None:
+        self._timeline = timeline
+        self._workloads = {}
+        self._phases = {}
+
+    def set_window(self, window: MeasurementWindow | None) -> None:
+        self._window = window
+        self._workloads = {}
+        self._phases = {}
+
+    def set_controller(self, controller: AimdController | None) -> None:
+        self._controller = controller
+        self._workloads = {}
+        self._phases = {}
+
+    def set_goodput_targets(self, ttft: float | None, tpot: float | None) -> None:
+        self._goodput_ttft = ttft
+        self._goodput_tpot = tpot
+        self._workloads = {}
+        self._phases = {}
+
+    def meets_goodput_targets(self, time_to_first_token: float, time_per_output_token: float | None) -> bool:
+        if self._goodput_ttft is not None and time_to_first_token > self._goodput_ttft:
+            return False
+        # request with single token has no tpot
+        if self._goodput_tpot is not None and time_per_output_token is not None and time_per_output_token > self._goodput_tpot:
+            return False
+        return True
+
+    def workload(self, workload: str) -> "Prometheus":
+        # same metrics with workload label, observations also go to recorder under names of that workload
+        view = self._workloads.get(workload)
+        if view is None:
+            view = copy.copy(self)
+            view._workload = workload
+            view._recorder = WorkloadRecorder(self._recorder, workload)
+            view._phases = {}
+            self._workloads[workload] = view
+        return view
+
+    def endpoint(self, endpoint: str, totals: bool = True, window_progress: bool = True) -> "Prometheus":
+        # same metrics with endpoint label, views are made by run for requester of every endpoint. In mirror mode only
+        # first endpoint records totals of summary and router moves window once per sampled request
+        view = copy.copy(self)
+        view._endpoint = endpoint
+        view._recorder = EndpointRecorder(self._recorder, endpoint, totals=totals)
+        view._window_progress = window_progress
+        view._workloads = {}
+        view._phases = {}
+        return view
+
+    @property
+    def endpoint_name(self) -> str | None:
+        return self._endpoint or None
+
+    def phase(self, phase: str) -> "Prometheus":
+        # same metrics with phase label, only observations of steady state go to recorder
+        view = self._phases.get(phase)
+        if view is None:
+            view = copy.copy(self)
+            view._phase = phase
+            view._phases = {}
+            if phase != "steady":
+                view._recorder = PhaseRecorder(self._recorder, phase)
+            self._phases[phase] = view
+        return view
+
+    @property
+    def window(self) -> MeasurementWindow | None:
+        return self._window
+
+    @property
+    def window_progress(self) -> bool:
+        return self._window_progress
+
+    @property
+    def timeline(self) -> TimelineWriter | None:
+        return self._timeline
 
     def request_latency_metric(self, latency: float) -> None:
-        self._request_latency_metric.labels(run=self._run).observe(latency)
+        self._request_latency_metric.labels(run=self._run, workload=self._workload, phase=self._phase, endpoint=self._endpoint).observe(latency)
+        self._recorder.observe("request_latency", latency)
 
     def request_time_to_first_token_latency_metric(self, latency: float) -> None:
-        self._request_time_to_first_token_latency_metric.labels(run=self._run).observe(latency)
+        self._request_time_to_first_token_latency_metric.labels(run=self._run, workload=self._workload, phase=self._phase, endpoint=self._endpoint).observe(latency)
+        self._recorder.observe("time_to_first_token", latency)
+        if self._controller is not None:
+            self._controller.time_to_first_token(latency)
+
+    def request_tpot_metric(self, latency: float) -> None:
+        self._request_tpot_metric.labels(run=self._run, workload=self._workload, phase=self._phase, endpoint=self._endpoint).observe(latency)
+        self._recorder.observe("time_per_output_token", latency)
+
+    def request_inter_chunk_latency_metric(self, latency: float) -> None:
+        self._request_inter_chunk_latency_metric.labels(run=self._run, workload=self._workload, phase=self._phase, endpoint=self._endpoint).observe(latency)
+        self._request_time_per_output_token_latency_metric.labels(run=self._run, workload=self._workload, phase=self._phase, endpoint=self._endpoint).observe(latency)
+        self._recorder.observe("inter_chunk_latency", latency)
+
+    def request_output_tokens_per_second_metric(self, rate: float) -> None:
+        self._request_output_tokens_per_second_metric.labels(run=self._run, workload=self._workload, phase=self._phase, endpoint=self._endpoint).observe(rate)
+        self._recorder.observe("output_tokens_per_second", rate)
 
-    def request_time_per_output_token_latency_metric(self, latency: float) -> None:
-        self._request_time_per_output_token_latency_metric.labels(run=self._run).observe(latency)
+    def goodput(self, tokens: int) -> None:
+        self._goodput_requests.labels(run=self._run, workload=self._workload, phase=self._phase, endpoint=self._endpoint).inc()
+        self._goodput_tokens.labels(run=self._run, workload=self._workload, phase=self._phase, endpoint=self._endpoint).inc(tokens)
+        self._recorder.count("goodput_requests")
+        self._recorder.count("goodput_tokens", tokens)
+
+    def request_queue_delay_metric(self, delay: float) -> None:
+        self._request_queue_delay_metric.labels(run=self._run, workload=self._workload, phase=self._phase, endpoint=self._endpoint).observe(delay)
+        self._recorder.observe("request_queue_delay", delay)
 
     def requests_count_metric(self) -> None:
-        self._requests_count_metric.labels(run=self._run).inc()
+        self._requests_count_metric.labels(run=self._run, workload=self._workload, phase=self._phase, endpoint=self._endpoint).inc()
 
     def increase_users_count(self) -> None:
-        self._users_count.labels(run=self._run).inc()
+        self._users_count.labels(run=self._run, workload=self._workload, phase=self._phase, endpoint=self._endpoint).inc()
 
     def decrease_users_count(self) -> None:
-        self._users_count.labels(run=self._run).dec()
+        self._users_count.labels(run=self._run, workload=self._workload, phase=self._phase, endpoint=self._endpoint).dec()
+
+    def users_limit(self, limit: int) -> None:
+        self._users_limit.labels(run=self._run, workload=self._workload, phase=self._phase, endpoint=self._endpoint).set(limit)
 
     def prefill_tokens(self, tokens: int) -> None:
-        self._prefill_tokens.labels(run=self._run).observe(tokens)
+        self._prefill_tokens.labels(run=self._run, workload=self._workload, phase=self._phase, endpoint=self._endpoint).observe(tokens)
+        self._recorder.observe("prefill_tokens", tokens)
 
     def decode_tokens(self, tokens: int) -> None:
-        self._decode_tokens.labels(run=self._run).observe(tokens)
+        self._decode_tokens.labels(run=self._run, workload=self._workload, phase=self._phase, endpoint=self._endpoint).observe(tokens)
+        self._recorder.observe("decode_tokens", tokens)
 
     def response_code_count_metric(self, code: str) -> None:
-        self._response_code_count_metric.labels(run=self._run, code=code).inc()
+        self._response_code_count_metric.labels(run=self._run, workload=self._workload, phase=self._phase, endpoint=self._endpoint, code=code).inc()
+        self._recorder.count(f"response_code_{code}")
+        if self._controller is not None:
+            self._controller.response_code(int(code))
+
+    def request_cancelled(self) -> None:
+        self._requests_cancelled.labels(run=self._run, workload=self._workload, phase=self._phase, endpoint=self._endpoint).inc()
+        self._recorder.count("requests_cancelled")
 
     def prefill_time_metric(self, duration: float) -> None:
-        self._prefill_time_seconds.labels(run=self._run).observe(duration)
+        self._prefill_time_seconds.labels(run=self._run, workload=self._workload, phase=self._phase, endpoint=self._endpoint).observe(duration)
+        self._recorder.observe("prefill_time", duration)
 
     def decode_time_metric(self, duration: float) -> None:
-        self._decode_time_seconds.labels(run=self._run).observe(duration)
+        self._decode_time_seconds.labels(run=self._run, workload=self._workload, phase=self._phase, endpoint=self._endpoint).observe(duration)
+        self._recorder.observe("decode_time", duration)
+
+    def connection_time_metric(self, duration: float) -> None:
+        self._connection_time_seconds.labels(run=self._run, workload=self._workload, phase=self._phase, endpoint=self._endpoint).observe(duration)
+        self._recorder.observe("connection_time", duration)
+
+    def turn_time_to_first_token_latency_metric(self, turn: int, latency: float) -> None:
+        self._turn_time_to_first_token_latency_metric.labels(run=self._run, workload=self._workload, phase=self._phase, endpoint=self._endpoint, turn=str(turn)).observe(latency)
+        self._recorder.observe(f"time_to_first_token_turn_{turn}", latency)
+
+    def turn_prefill_tokens(self, turn: int, tokens: int) -> None:
+        self._turn_prefill_tokens.labels(run=self._run, workload=self._workload, phase=self._phase, endpoint=self._endpoint, turn=str(turn)).observe(tokens)
+        self._recorder.observe(f"prefill_tokens_turn_{turn}", tokens)
+
+    def event_loop_lag_metric(self, lag: float) -> None:
+        self._event_loop_lag_seconds.labels(run=self._run, workload=self._workload, phase=self._phase, endpoint=self._endpoint).observe(lag)
+        self._recorder.observe("event_loop_lag", lag)
+
+    def request_in_flight_time(self, duration: float) -> None:
+        self._recorder.count("in_flight_seconds", duration)
+
+    def event_loop_lag_breach(self) -> None:
+        self._recorder.count("event_loop_lag_breaches")
+
+    def increase_requests_in_flight(self) -> None:
+        self._requests_in_flight.labels(run=self._run, workload=self._workload, phase=self._phase, endpoint=self._endpoint).inc()
+
+    def decrease_requests_in_flight(self) -> None:
+        self._requests_in_flight.labels(run=self._run, workload=self._workload, phase=self._phase, endpoint=self._endpoint).dec()
+
+    def process_cpu_utilization(self, utilization: float) -> None:
+        self._process_cpu_utilization.labels(run=self._run, workload=self._workload, phase=self._phase, endpoint=self._endpoint).set(utilization)
+        self._recorder.observe("process_cpu_utilization", utilization)
+
+    def sampler_queue_depth(self, depth: int) -> None:
+        self._sampler_queue_depth.labels(run=self._run, workload=self._workload, phase=self._phase, endpoint=self._endpoint).set(depth)
+
+    def output_backlog(self, backlog: int) -> None:
+        self._output_backlog.labels(run=self._run, workload=self._workload, phase=self._phase, endpoint=self._endpoint).set(backlog)
+
+    def output_write_latency_metric(self, latency: float) -> None:
+        self._output_write_latency_seconds.labels(run=self._run, workload=self._workload, phase=self._phase, endpoint=self._endpoint).observe(latency)
+        self._recorder.observe("output_write_latency", latency)
+
+    def response_cache_hit(self) -> None:
+        self._response_cache_hits.labels(run=self._run, workload=self._workload, phase=self._phase, endpoint=self._endpoint).inc()
+        self._recorder.count("response_cache_hits")
+
+    def response_cache_miss(self) -> None:
+        self._response_cache_misses.labels(run=self._run, workload=self._workload, phase=self._phase, endpoint=self._endpoint).inc()
+        self._recorder.count("response_cache_misses")
+
+    def dispatch_lag_metric(self, lag: float) -> None:
+        self._dispatch_lag_seconds.labels(run=self._run, workload=self._workload, phase=self._phase, endpoint=self._endpoint).observe(lag)
+        self._recorder.observe("dispatch_lag", lag)
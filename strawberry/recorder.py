@@ -0,0 +1,460 @@
+import json
+import math
+import time
+import array
+import base64
+
+from pathlib import Path
+
+
+LATENCY_METRICS = [
+    "request_latency",
+    "time_to_first_token",
+    "time_per_output_token",
+    "inter_chunk_latency",
+    "prefill_time",
+    "decode_time",
+    "request_queue_delay",
+    "connection_time",
+    "event_loop_lag",
+    "output_write_latency",
+    "dispatch_lag",
+]
+
+TOKEN_METRICS = [
+    "prefill_tokens",
+    "decode_tokens",
+]
+
+RATE_METRICS = [
+    "output_tokens_per_second",
+]
+
+# observed for every stream chunk or sampled by monitor every fraction of second, number of observations grows with
+# output length or run time so they are kept in histogram
+HISTOGRAM_METRICS = [
+    "inter_chunk_latency",
+    "event_loop_lag",
+    "process_cpu_utilization",
+]
+
+PERCENTILES = [50, 90, 99, 99.9]
+
+
+def percentile(values: list[float], q: float) -> float:
+    # values must be sorted, linear interpolation between closest ranks
+    if len(values) == 0:
+        return math.nan
+    rank = (len(values) - 1) * q / 100
+    low = math.floor(rank)
+    high = math.ceil(rank)
+    return values[low] + (values[high] - values[low]) * (rank - low)
+
+
+def statistics(values: list[float]) -> dict:
+    # values must be sorted and not empty
+    stats = {"count": len(values), "mean": sum(values) / len(values), "min": values[0]}
+    for q in PERCENTILES:
+        stats[f"p{q:g}"] = percentile(values, q)
+    stats["max"] = values[-1]
+    return stats
+
+
+class LogLinearHistogram:
+    # bounded replacement of exact samples. Every power of two is split into SUB_BUCKETS linear buckets so percentiles
+    # keep relative error below 1 / SUB_BUCKETS whatever the range of values, count, sum, min and max are exact
+    SUB_BUCKETS = 128
+
+    def __init__(self) -> None:
+        self._counts: dict[int, int] = {}
+        # zero and negative values do not have logarithm
+        self._zeros = 0
+        self.count = 0
+        self.sum = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def observe(self, value: float) -> None:
+        self.count += 1
+        self.sum += value
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+        if value <= 0:
+            self._zeros += 1
+            return
+        # value = mantissa * 2 ** exponent with 0.5 <= mantissa < 1
+        mantissa, exponent = math.frexp(value)
+        index = exponent * self.SUB_BUCKETS + int((mantissa * 2 - 1) * self.SUB_BUCKETS)
+        self._counts[index] = self._counts.get(index, 0) + 1
+
+    def merge(self, other: "LogLinearHistogram") -> None:
+        for index, count in other._counts.items():
+            self._counts[index] = self._counts.get(index, 0) + count
+        self._zeros += other._zeros
+        self.count += other.count
+        self.sum += other.sum
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    def percentile(self, q: float) -> float:
+        if self.count == 0:
+            return math.nan
+        rank = round((self.count - 1) * q / 100)
+        seen = self._zeros
+        if rank < seen:
+            return self.min
+        for index in sorted(self._counts):
+            seen += self._counts[index]
+            if rank < seen:
+                # middle of bucket, extreme buckets are bounded by exact min and max
+                exponent, sub = divmod(index, self.SUB_BUCKETS)
+                return min(max(math.ldexp((1 + (sub + 0.5) / self.SUB_BUCKETS) / 2, exponent), self.min), self.max)
+        return self.max
+
+    def statistics(self) -> dict:
+        # same fields as statistics of exact samples
+        stats = {"count": self.count, "mean": self.sum / self.count, "min": self.min}
+        for q in PERCENTILES:
+            stats[f"p{q:g}"] = self.percentile(q)
+        stats["max"] = self.max
+        return stats
+
+    def to_dict(self) -> dict:
+        return {"counts": list(self._counts.items()), "zeros": self._zeros, "count": self.count, "sum": self.sum, "min": self.min, "max": self.max}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "LogLinearHistogram":
+        histogram = cls()
+        histogram._counts = {int(index): count for index, count in data["counts"]}
+        histogram._zeros = data["zeros"]
+        histogram.count = data["count"]
+        histogram.sum = data["sum"]
+        histogram.min = data["min"]
+        histogram.max = data["max"]
+        return histogram
+
+
+def is_histogram_metric(name: str) -> bool:
+    # name may have suffix of workload, endpoint or turn
+    return any(name == metric or name.startswith(f"{metric}_") for metric in HISTOGRAM_METRICS)
+
+
+class Recorder:
+    # keeps every observation of per request series in compact arrays so percentiles are exact and do not depend on
+    # prometheus buckets or scrape interval. Per chunk series and periodic samples of client are kept in log linear
+    # histograms so memory does not grow with number of generated tokens or length of run
+    def __init__(self) -> None:
+        self._samples: dict[str, array.array] = {}
+        self._histograms: dict[str, LogLinearHistogram] = {}
+        self._counters: dict[str, float] = {}
+        self._start_time = None
+        self._end_time = None
+
+    def start(self, start_time: float | None = None) -> None:
+        self._start_time = start_time if start_time is not None else time.time()
+        self._end_time = None
+
+    def stop(self, end_time: float | None = None) -> None:
+        self._end_time = end_time if end_time is not None else time.time()
+
+    def observe(self, name: str, value: float) -> None:
+        if is_histogram_metric(name):
+            histogram = self._histograms.get(name)
+            if histogram is None:
+                histogram = self._histograms[name] = LogLinearHistogram()
+            histogram.observe(value)
+            return
+        samples = self._samples.get(name)
+        if samples is None:
+            samples = self._samples[name] = array.array("d")
+        samples.append(value)
+
+    def count(self, name: str, value: float = 1) -> None:
+        self._counters[name] = self._counters.get(name, 0) + value
+
+    def samples(self, name: str) -> array.array:
+        return self._samples.get(name, array.array("d"))
+
+    def counter(self, name: str) -> float:
+        return self._counters.get(name, 0)
+
+    def statistics(self, name: str) -> dict | None:
+        if name in self._histograms:
+            return self._histograms[name].statistics()
+        values = sorted(self._samples.get(name, []))
+        return statistics(values) if len(values) > 0 else None
+
+    def merge(self, other: "Recorder") -> None:
+        for name, samples in other._samples.items():
+            self._samples.setdefault(name, array.array("d")).extend(samples)
+        for name, histogram in other._histograms.items():
+            self._histograms.setdefault(name, LogLinearHistogram()).merge(histogram)
+        for name, value in other._counters.items():
+            self.count(name, value)
+        for attribute, choose in (("_start_time", min), ("_end_time", max)):
+            values = [v for v in (getattr(self, attribute), getattr(other, attribute)) if v is not None]
+            setattr(self, attribute, choose(values) if values else None)
+
+    def to_dict(self) -> dict:
+        # json serializable form to send recorder over network, samples are base64 of raw doubles
+        return {
+            "samples": {name: base64.b64encode(samples.tobytes()).decode("ascii") for name, samples in self._samples.items()},
+            "histograms": {name: histogram.to_dict() for name, histogram in self._histograms.items()},
+            "counters": self._counters,
+            "start_time": self._start_time,
+            "end_time": self._end_time,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "Recorder":
+        recorder = cls()
+        for name, encoded in data["samples"].items():
+            samples = recorder._samples[name] = array.array("d")
+            samples.frombytes(base64.b64decode(encoded))
+        for name, histogram in data.get("histograms", {}).items():
+            recorder._histograms[name] = LogLinearHistogram.from_dict(histogram)
+        recorder._counters = dict(data["counters"])
+        recorder._start_time = data["start_time"]
+        recorder._end_time = data["end_time"]
+        return recorder
+
+    def workloads(self) -> list[str]:
+        # observations of endpoint of workload have both suffixes, they are counted under each suffix separately
+        return sorted({
+            name.split("_workload_", 1)[1] for name in [*self._samples, *self._histograms, *self._counters]
+            if "_workload_" in name and "_endpoint_" not in name
+        })
+
+    def endpoints(self) -> list[str]:
+        return sorted({
+            name.split("_endpoint_", 1)[1] for name in [*self._samples, *self._histograms, *self._counters]
+            if "_endpoint_" in name and "_workload_" not in name
+        })
+
+    def duration(self) -> float:
+        if self._start_time is None:
+            return 0.0
+        end_time = self._end_time if self._end_time is not None else time.time()
+        return end_time - self._start_time
+
+    def summary(self) -> dict:
+        duration = self.duration()
+        summary = {"duration_seconds": duration, "latency_seconds": {}, "tokens": {}, "tokens_per_second": {}}
+        for group, names in (("latency_seconds", LATENCY_METRICS), ("tokens", TOKEN_METRICS), ("tokens_per_second", RATE_METRICS)):
+            for name in names:
+                stats = self.statistics(name)
+                if stats is not None:
+                    summary[group][name] = stats
+
+        # multi turn sessions, ttft and prefill tokens of every turn index
+        turns = sorted({int(name.rsplit("_", 1)[1]) for name in self._samples if name.startswith("time_to_first_token_turn_") and "_workload_" not in name and "_endpoint_" not in name})
+        summary["turns"] = {}
+        for turn in turns:
+            summary["turns"][str(turn)] = {
+                name: statistics(sorted(self._samples[f"{name}_turn_{turn}"]))
+                for name in ("time_to_first_token", "prefill_tokens")
+                if f"{name}_turn_{turn}" in self._samples
+            }
+
+        # mix of workloads and endpoints of run, latencies, tokens and throughput of every class of traffic and every
+        # serving target
+        summary["workloads"] = {workload: self._breakdown(f"_workload_{workload}", duration) for workload in self.workloads()}
+        summary["endpoints"] = {endpoint: self._breakdown(f"_endpoint_{endpoint}", duration) for endpoint in self.endpoints()}
+
+        response_codes = {name[len("response_code_"):]: int(value) for name, value in self._counters.items() if name.startswith("response_code_") and name[len("response_code_"):].isdigit()}
+        completed = sum(response_codes.values())
+        successful = response_codes.get("200", 0)
+        output_tokens = sum(self._samples.get("decode_tokens", []))
+        # goodput counts successful requests that met ttft and tpot targets
+        goodput_requests = int(self._counters.get("goodput_requests", 0))
+        goodput_tokens = int(self._counters.get("goodput_tokens", 0))
+        summary["requests"] = {
+            "completed": completed,
+            "successful": successful,
+            "error_rate": (completed - successful) / completed if completed else 0.0,
+            "slo_attainment": goodput_requests / completed if completed else 0.0,
+            "cancelled": int(self._counters.get("requests_cancelled", 0)),
+            "response_codes": response_codes,
+        }
+        summary["throughput"] = {
+            "requests_per_second": completed / duration if duration else 0.0,
+            "output_tokens_per_second": output_tokens / duration if duration else 0.0,
+            "goodput_requests_per_second": goodput_requests / duration if duration else 0.0,
+            "goodput_tokens_per_second": goodput_tokens / duration if duration else 0.0,
+        }
+        # little's law, time requests spent in flight per second of run is mean number of requests in flight
+        in_flight_seconds = self._counters.get("in_flight_seconds", 0)
+        summary["throughput"]["concurrency"] = in_flight_seconds / duration if duration else 0.0
+        # requests started outside steady state window are not measured, only counted
+        summary["window"] = {
+            "warmup_requests": int(self._counters.get("warmup_requests", 0)),
+            "cooldown_requests": int(self._counters.get("cooldown_requests", 0)),
+        }
+        summary["response_cache"] = {
+            "hits": int(self._counters.get("response_cache_hits", 0)),
+            "misses": int(self._counters.get("response_cache_misses", 0)),
+        }
+        # latencies are measured in event loop of client, when it lags they include time client was busy
+        lag_breaches = int(self._counters.get("event_loop_lag_breaches", 0))
+        cpu_utilization = self._histograms.get("process_cpu_utilization")
+        summary["client"] = {
+            "event_loop_lag_breaches": lag_breaches,
+            "max_cpu_utilization": cpu_utilization.max if cpu_utilization is not None else None,
+            "trustworthy": lag_breaches == 0,
+        }
+        return summary
+
+    def _breakdown(self, suffix: str, duration: float) -> dict:
+        stats = {"latency_seconds": {}, "tokens": {}}
+        for group, names in (("latency_seconds", LATENCY_METRICS), ("tokens", TOKEN_METRICS)):
+            for name in names:
+                metric = self.statistics(f"{name}{suffix}")
+                if metric is not None:
+                    stats[group][name] = metric
+        codes = {
+            name[len("response_code_"):-len(suffix)]: value for name, value in self._counters.items()
+            if name.startswith("response_code_") and name.endswith(suffix) and name[len("response_code_"):-len(suffix)].isdigit()
+        }
+        completed = int(sum(codes.values()))
+        successful = int(codes.get("200", 0))
+        goodput = int(self._counters.get(f"goodput_requests{suffix}", 0))
+        stats["requests"] = {
+            "completed": completed,
+            "successful": successful,
+            "error_rate": (completed - successful) / completed if completed else 0.0,
+            "slo_attainment": goodput / completed if completed else 0.0,
+        }
+        stats["throughput"] = {
+            "requests_per_second": completed / duration if duration else 0.0,
+            "output_tokens_per_second": sum(self._samples.get(f"decode_tokens{suffix}", [])) / duration if duration else 0.0,
+            "goodput_requests_per_second": goodput / duration if duration else 0.0,
+        }
+        return stats
+
+
+class WorkloadRecorder:
+    # records observations of one class of traffic to recorder of run both as they are and under names with suffix
+    # of workload, so summary has totals and breakdown by workload
+    def __init__(self, recorder: Recorder, workload: str) -> None:
+        self._recorder = recorder
+        self._workload = workload
+
+    def observe(self, name: str, value: float) -> None:
+        self._recorder.observe(name, value)
+        self._recorder.observe(f"{name}_workload_{self._workload}", value)
+
+    def count(self, name: str, value: float = 1) -> None:
+        self._recorder.count(name, value)
+        self._recorder.count(f"{name}_workload_{self._workload}", value)
+
+    def __getattr__(self, name: str):
+        return getattr(self._recorder, name)
+
+
+class EndpointRecorder:
+    # same as WorkloadRecorder for serving target of run with several endpoints. Without totals observations go only
+    # under names of endpoint, used for mirrored copies of requests so totals count every sampled request once
+    def __init__(self, recorder: Recorder, endpoint: str, totals: bool = True) -> None:
+        self._recorder = recorder
+        self._endpoint = endpoint
+        self._totals = totals
+
+    def observe(self, name: str, value: float) -> None:
+        if self._totals:
+            self._recorder.observe(name, value)
+        self._recorder.observe(f"{name}_endpoint_{self._endpoint}", value)
+
+    def count(self, name: str, value: float = 1) -> None:
+        if self._totals:
+            self._recorder.count(name, value)
+        self._recorder.count(f"{name}_endpoint_{self._endpoint}", value)
+
+    def __getattr__(self, name: str):
+        return getattr(self._recorder, name)
+
+
+class PhaseRecorder:
+    # keeps observations of requests outside steady state window out of summary, only number of such requests is counted
+    def __init__(self, recorder: Recorder | WorkloadRecorder, phase: str) -> None:
+        self._recorder = recorder
+        self._phase = phase
+
+    def observe(self, name: str, value: float) -> None:
+        pass
+
+    def count(self, name: str, value: float = 1) -> None:
+        if name.startswith("response_code_") or name == "requests_cancelled":
+            self._recorder.count(f"{self._phase}_requests")
+
+    def __getattr__(self, name: str):
+        return getattr(self._recorder, name)
+
+
+def format_summary(summary: dict) -> str:
+    header = f"{'metric':<28}{'count':>10}{'mean':>12}" + "".join(f"{'p' + format(q, 'g'):>12}" for q in PERCENTILES) + f"{'max':>12}"
+
+    def row(name: str, stats: dict) -> str:
+        return (
+            f"{name:<28}{stats['count']:>10}{stats['mean']:>12.4f}"
+            + "".join(f"{stats['p' + format(q, 'g')]:>12.4f}" for q in PERCENTILES)
+            + f"{stats['max']:>12.4f}"
+        )
+
+    lines = [header, "-" * len(header)]
+    for group, unit in (("latency_seconds", " (s)"), ("tokens", ""), ("tokens_per_second", "")):
+        for name, stats in summary[group].items():
+            lines.append(row(name + unit, stats))
+    for turn, stats in summary["turns"].items():
+        if "time_to_first_token" in stats:
+            lines.append(row(f"turn {turn} ttft (s)", stats["time_to_first_token"]))
+        if "prefill_tokens" in stats:
+            lines.append(row(f"turn {turn} prefill_tokens", stats["prefill_tokens"]))
+    breakdowns = [*summary["workloads"].items(), *summary["endpoints"].items()]
+    for label, stats in breakdowns:
+        for name, metric in (("time_to_first_token", "ttft (s)"), ("time_per_output_token", "tpot (s)"), ("request_latency", "latency (s)")):
+            if name in stats["latency_seconds"]:
+                lines.append(row(f"{label} {metric}", stats["latency_seconds"][name]))
+        if "prefill_tokens" in stats["tokens"]:
+            lines.append(row(f"{label} prefill_tokens", stats["tokens"]["prefill_tokens"]))
+    lines.append("-" * len(header))
+    requests = summary["requests"]
+    throughput = summary["throughput"]
+    lines.append(
+        f"duration {summary['duration_seconds']:.2f} s, completed {requests['completed']} requests, successful {requests['successful']}, "
+        f"error rate {requests['error_rate']:.2%}, slo attainment {requests['slo_attainment']:.2%}"
+    )
+    lines.append(f"response codes {requests['response_codes']}, cancelled at end of run {requests['cancelled']}")
+    for kind, group in (("workload", "workloads"), ("endpoint", "endpoints")):
+        for label, stats in summary[group].items():
+            lines.append(
+                f"{kind} {label} completed {stats['requests']['completed']} requests, error rate {stats['requests']['error_rate']:.2%}, "
+                f"slo attainment {stats['requests']['slo_attainment']:.2%}, {stats['throughput']['requests_per_second']:.3f} requests/s, "
+                f"{stats['throughput']['output_tokens_per_second']:.1f} output tokens/s"
+            )
+    lines.append(
+        f"throughput {throughput['requests_per_second']:.3f} requests/s, {throughput['output_tokens_per_second']:.1f} output tokens/s, "
+        f"goodput {throughput['goodput_requests_per_second']:.3f} requests/s, {throughput['goodput_tokens_per_second']:.1f} tokens/s"
+    )
+    lines.append(f"mean concurrency {throughput['concurrency']:.1f} requests in flight")
+    window = summary["window"]
+    if window["warmup_requests"] + window["cooldown_requests"] > 0:
+        lines.append(f"not measured {window['warmup_requests']} warmup requests and {window['cooldown_requests']} cooldown requests")
+    cache = summary["response_cache"]
+    if cache["hits"] + cache["misses"] > 0:
+        lines.append(f"response cache hits {cache['hits']}, misses {cache['misses']}, hit rate {cache['hits'] / (cache['hits'] + cache['misses']):.2%}")
+    client = summary["client"]
+    if not client["trustworthy"]:
+        lines.append(
+            f"WARNING event loop lag was above threshold {client['event_loop_lag_breaches']} times, client was saturated "
+            f"and latencies are not trustworthy"
+        )
+    return "\n".join(lines)
+
+
+def report_summary(recorder: Recorder, summary_path: Path | None) -> dict:
+    summary = recorder.summary()
+    print(format_summary(summary))
+    if summary_path is not None:
+        with open(summary_path, "w", encoding="utf-8") as file:
+            json.dump(summary, file, indent=4)
+    return summary
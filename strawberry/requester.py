@@ -1,29 +1,203 @@
 import time
 import json
+import asyncio
 import httpx
+import typing
 import openai
 from loguru import logger
 from strawberry.prometheus import Prometheus
 
 
+try:
+    import orjson
+    _json_loads = orjson.loads
+    _json_dumps = orjson.dumps
+except ImportError:
+    _json_loads = json.loads
+    _json_dumps = lambda obj: json.dumps(obj).encode("utf-8")
+
+
+# status of request cancelled by client in timeline, same as nginx uses for client closed request
+CANCELLED_STATUS_CODE = 499
+
+
+class RequestMetrics:
+    # metrics of single streamed chat completion request, shared by requesters so they report exactly same metrics
+    def __init__(
+        self,
+        prometheus: Prometheus,
+        start_time: float | None = None,
+        custom_id: typing.Any = None,
+        user_id: int | None = None,
+        turn: int | None = None,
+        workload: str | None = None,
+        cached: bool = False
+    ) -> None:
+        # start_time is intended start of request on time.perf_counter clock, when set queueing delay in client is
+        # counted in latencies. All durations are measured on this monotonic clock so wall clock adjustments do not skew them
+        # turn is index of request in multi turn session, its ttft and prefill tokens are also reported per turn
+        # workload is class of traffic in mix, all metrics of request get its label
+        # cached request was answered from response cache, it is counted in totals and tagged as cache hit
+        if workload is not None:
+            prometheus = prometheus.workload(workload)
+        # phase of measurement window request starts in, requests outside steady state are tagged and kept out of summary
+        self._window = prometheus.window
+        self._phase = None
+        if self._window is not None:
+            self._phase = self._window.phase()
+            # time in flight is recorded for part of request inside steady state even if it started in warmup
+            self._steady_prometheus = prometheus.phase("steady")
+            prometheus = prometheus.phase(self._phase)
+        self._prometheus = prometheus
+        self._turn = turn
+        self._prometheus.requests_count_metric()
+        if cached:
+            self._prometheus.response_cache_hit()
+        self._prometheus.increase_requests_in_flight()
+        now = time.perf_counter()
+        if start_time is None:
+            start_time = now
+        else:
+            self._prometheus.request_queue_delay_metric(max(0.0, now - start_time))
+        self._start_time = start_time
+        self._decode_start_time = None
+        self._previous_chunk_end_time = None
+        self._chunks = 0
+        self._completion_tokens = None
+        self._connection_time = None
+        self._connection_start_time = None
+
+        # row of per request timeline
+        self._timeline = prometheus.timeline
+        self._row = None
+        if self._timeline is not None:
+            self._row = {
+                "custom_id": custom_id,
+                "user_id": user_id,
+                "turn": turn,
+                "workload": workload,
+                "phase": self._phase,
+                "endpoint": prometheus.endpoint_name,
+                "status_code": None,
+                "cached": cached,
+                "start_time": start_time,
+                "first_token_time": None,
+                "end_time": None,
+                "prompt_tokens": None,
+                "completion_tokens": None,
+                "chunk_gaps": [] if self._timeline.include_gaps else None,
+            }
+
+    async def trace(self, event_name: str, info: dict) -> None:
+        # httpx trace hook, time spent on opening new connection is reported separately and excluded from prefill time
+        if event_name == "connection.connect_tcp.started":
+            self._connection_start_time = time.perf_counter()
+        elif event_name in ("connection.connect_tcp.complete", "connection.start_tls.complete") and self._connection_start_time is not None:
+            self._connection_time = time.perf_counter() - self._connection_start_time
+
+    def chunk(self) -> None:
+        now = time.perf_counter()
+        self._chunks += 1
+        if self._decode_start_time is None:
+            time_to_first_token = now - self._start_time
+            self._prometheus.request_time_to_first_token_latency_metric(time_to_first_token)
+            if self._turn is not None:
+                self._prometheus.turn_time_to_first_token_latency_metric(self._turn, time_to_first_token)
+            prefill_time = time_to_first_token
+            if self._connection_time is not None:
+                self._prometheus.connection_time_metric(self._connection_time)
+                prefill_time -= self._connection_time
+            self._prometheus.prefill_time_metric(prefill_time)
+            self._decode_start_time = now
+            if self._row is not None:
+                self._row["first_token_time"] = now
+        else:
+            gap = now - self._previous_chunk_end_time
+            self._prometheus.request_inter_chunk_latency_metric(gap)
+            if self._row is not None and self._row["chunk_gaps"] is not None:
+                self._row["chunk_gaps"].append(gap)
+        self._previous_chunk_end_time = now
+
+    def usage(self, prompt_tokens: int, completion_tokens: int) -> None:
+        self._prometheus.prefill_tokens(prompt_tokens)
+        self._prometheus.decode_tokens(completion_tokens)
+        if self._turn is not None:
+            self._prometheus.turn_prefill_tokens(self._turn, prompt_tokens)
+        if self._decode_start_time is not None:
+            self._prometheus.decode_time_metric(time.perf_counter() - self._decode_start_time)
+        self._completion_tokens = completion_tokens
+        if self._row is not None:
+            self._row["prompt_tokens"] = prompt_tokens
+            self._row["completion_tokens"] = completion_tokens
+
+    def finish(self) -> float:
+        # called once response is fully received, token level metrics and goodput need usage reported before it
+        total_latency = time.perf_counter() - self._start_time
+        self._prometheus.request_latency_metric(total_latency)
+        if self._decode_start_time is None:
+            return total_latency
+        # chunks approximate tokens when server does not report usage
+        completion_tokens = self._completion_tokens if self._completion_tokens is not None else self._chunks
+        time_to_first_token = self._decode_start_time - self._start_time
+        time_per_output_token = None
+        if completion_tokens > 1:
+            time_per_output_token = (total_latency - time_to_first_token) / (completion_tokens - 1)
+            self._prometheus.request_tpot_metric(time_per_output_token)
+        if total_latency > 0:
+            self._prometheus.request_output_tokens_per_second_metric(completion_tokens / total_latency)
+        if self._prometheus.meets_goodput_targets(time_to_first_token, time_per_output_token):
+            self._prometheus.goodput(completion_tokens)
+        return total_latency
+
+    def status_code(self, status_code: int) -> None:
+        # last call for request, completes its timeline row
+        self._prometheus.response_code_count_metric(code=str(status_code))
+        self._complete(status_code)
+
+    def cancel(self) -> None:
+        # request was cancelled by end of run, it is not response of server so it is counted apart from response codes
+        self._prometheus.request_cancelled()
+        self._complete(CANCELLED_STATUS_CODE)
+
+    def _complete(self, status_code: int) -> None:
+        self._prometheus.decrease_requests_in_flight()
+        now = time.perf_counter()
+        if self._window is None:
+            self._prometheus.request_in_flight_time(now - self._start_time)
+        else:
+            self._steady_prometheus.request_in_flight_time(self._window.steady_overlap(self._start_time, now))
+            if self._prometheus.window_progress:
+                self._window.complete(self._phase)
+        if self._row is not None:
+            self._row["status_code"] = status_code
+            self._row["end_time"] = time.perf_counter()
+            self._timeline.write(self._row)
+
+
 class Requester:
-    def __init__(self, prometheus: Prometheus, base_url: str, api_key: str, model_name: str) -> None:
-        self._client = openai.AsyncOpenAI(base_url=base_url, api_key=api_key)
+    def __init__(self, prometheus: Prometheus, base_url: str, api_key: str, model_name: str, http_client: httpx.AsyncClient | None = None) -> None:
+        self._client = openai.AsyncOpenAI(base_url=base_url, api_key=api_key, http_client=http_client)
         self._model_name = model_name
         self._prometheus = prometheus
 
-    async def request(self, request: dict) -> dict:
-        self._prometheus.requests_count_metric()
-        start_time = time.time()
-        prefill_start_time = start_time
-        decode_start_time = None
+    async def close(self) -> None:
+        await self._client.close()
+
+    async def request(self, request: dict, start_time: float | None = None, user_id: int | None = None, workload: str | None = None) -> dict:
+        metrics = RequestMetrics(
+            prometheus=self._prometheus,
+            start_time=start_time,
+            custom_id=request.get("custom_id"),
+            user_id=user_id,
+            turn=request.get("turn"),
+            workload=workload
+        )
         role = None
         output_text = None
         error = None
         status_code = 200
         chunks = []
         is_first_chunk = True
-        previous_chunk_end_time = None
 
         try:
             logger.debug("Start to send request for request {}", request)
@@ -36,33 +210,19 @@ class Requester:
 
             async for chunk in stream:
                 if len(chunk.choices) == 0:
-                    self._prometheus.prefill_tokens(chunk.usage.prompt_tokens)
-                    self._prometheus.decode_tokens(chunk.usage.completion_tokens)
-                    if decode_start_time is not None:
-                        decode_time = time.time() - decode_start_time
-                        self._prometheus.decode_time_metric(decode_time)
+                    metrics.usage(chunk.usage.prompt_tokens, chunk.usage.completion_tokens)
                     logger.debug("Get last chunk {} for request {}", chunk, request)
                 else:
+                    metrics.chunk()
                     if is_first_chunk:
                         logger.debug("Get first chunk {} for request {}", chunk, request)
                         role = chunk.choices[0].delta.role
-                        time_to_first_token = time.time() - start_time
-                        logger.debug("time_to_first_token={}", time_to_first_token)
-                        self._prometheus.request_time_to_first_token_latency_metric(time_to_first_token)
-                        prefill_time = time.time() - prefill_start_time
-                        self._prometheus.prefill_time_metric(prefill_time)
-                        decode_start_time = time.time()
                         is_first_chunk = False
                     else:
                         logger.debug("Get next chunk {} for request {}", chunk, request)
-                        time_per_output_token = time.time() - previous_chunk_end_time
-                        logger.debug("time_per_output_token={}", time_per_output_token)
-                        self._prometheus.request_time_per_output_token_latency_metric(time_per_output_token)
-                    previous_chunk_end_time = time.time()
                     chunks.append(chunk.choices[0].delta.content)
-            total_latency = time.time() - start_time
+            total_latency = metrics.finish()
             logger.debug("total_latency={}, output_text={}", total_latency, output_text)
-            self._prometheus.request_latency_metric(total_latency)
             output_text = "".join(chunks)
         except openai.APIConnectionError as e:
             logger.debug("The server could not be reached")
@@ -76,11 +236,14 @@ class Requester:
             logger.debug("Status code: {}", e.status_code)
             logger.debug("Response: {}", e.response)
             status_code = e.status_code
+        except asyncio.CancelledError:
+            metrics.cancel()
+            raise
         except Exception as e:
             logger.debug("Got exception {}, {}", type(e), e)
             status_code = 400
 
-        self._prometheus.response_code_count_metric(code=str(status_code))
+        metrics.status_code(status_code)
         response = {
             "custom_id": request["custom_id"],
             "status_code": status_code,
@@ -95,24 +258,163 @@ class Requester:
         return response
 
 
+class RawRequester:
+    # posts to /chat/completions of OpenAI compatible server and parses server sent events directly instead of
+    # building pydantic chunk objects of openai sdk for every token. Reports same metrics as Requester
+    def __init__(
+        self,
+        prometheus: Prometheus,
+        base_url: str,
+        api_key: str,
+        model_name: str,
+        max_connections: int = 1024,
+        max_keepalive_connections: int = 256,
+        keepalive_expiry: float = 60.0,
+        http2: bool = False,
+        measure_connection_time: bool = False,
+        http_client: httpx.AsyncClient | None = None
+    ) -> None:
+        self._model_name = model_name
+        self._prometheus = prometheus
+        self._measure_connection_time = measure_connection_time
+        self._url = f"{base_url.rstrip('/')}/chat/completions"
+        self._headers = {
+            "Authorization": f"Bearer {api_key}",
+            "Content-Type": "application/json"
+        }
+        self._client = http_client or httpx.AsyncClient(
+            timeout=httpx.Timeout(connect=10.0, read=300.0, write=300.0, pool=5.0),
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_keepalive_connections,
+                keepalive_expiry=keepalive_expiry
+            ),
+            http2=http2
+        )
+
+    async def close(self) -> None:
+        await self._client.aclose()
+
+    async def request(self, request: dict, start_time: float | None = None, user_id: int | None = None, workload: str | None = None) -> dict:
+        metrics = RequestMetrics(
+            prometheus=self._prometheus,
+            start_time=start_time,
+            custom_id=request.get("custom_id"),
+            user_id=user_id,
+            turn=request.get("turn"),
+            workload=workload
+        )
+        role = None
+        output_text = None
+        error = None
+        status_code = 200
+        chunks = []
+        is_first_chunk = True
+
+        try:
+            payload = {
+                "model": self._model_name,
+                "stream": True,
+                "stream_options": {"include_usage": True},
+                **request["body"]
+            }
+            extensions = {"trace": metrics.trace} if self._measure_connection_time else None
+            async with self._client.stream("POST", self._url, content=_json_dumps(payload), headers=self._headers, extensions=extensions) as response:
+                if response.status_code >= 400:
+                    await response.aread()
+                response.raise_for_status()
+                async for line in response.aiter_lines():
+                    if not line.startswith("data:"):
+                        continue
+                    data = line[5:].strip()
+                    if data == "[DONE]":
+                        break
+                    chunk = _json_loads(data)
+                    choices = chunk.get("choices")
+                    if choices:
+                        metrics.chunk()
+                        delta = choices[0].get("delta") or {}
+                        if is_first_chunk:
+                            role = delta.get("role")
+                            is_first_chunk = False
+                        chunks.append(delta.get("content") or "")
+                    elif chunk.get("usage") is not None:
+                        usage = chunk["usage"]
+                        metrics.usage(usage["prompt_tokens"], usage["completion_tokens"])
+            metrics.finish()
+            output_text = "".join(chunks)
+        except httpx.ConnectError as e:
+            logger.debug("The server could not be reached {}", e)
+            status_code = 503
+        except httpx.HTTPStatusError as e:
+            logger.debug("Non-200 status code {}", e)
+            status_code = e.response.status_code
+        except asyncio.CancelledError:
+            metrics.cancel()
+            raise
+        except Exception as e:
+            logger.debug("Got exception {}, {}", type(e), e)
+            status_code = 400
+
+        metrics.status_code(status_code)
+        return {
+            "custom_id": request["custom_id"],
+            "status_code": status_code,
+            "response": {
+                "role": role,
+                "content": output_text
+            },
+            "error": error
+        }
+
+
 class SglangRequester:
-    def __init__(self, prometheus: Prometheus, base_url: str, api_key: str, model_name: str) -> None:
+    def __init__(
+        self,
+        prometheus: Prometheus,
+        base_url: str,
+        api_key: str,
+        model_name: str,
+        max_connections: int = 1024,
+        max_keepalive_connections: int = 256,
+        keepalive_expiry: float = 60.0,
+        http2: bool = False,
+        measure_connection_time: bool = False
+    ) -> None:
         self._model_name = model_name
         self._prometheus = prometheus
         self._base_url = base_url
+        self._measure_connection_time = measure_connection_time
+        # one client for all requests so connections are reused instead of paying tcp and tls setup per request
+        self._client = httpx.AsyncClient(
+            timeout=httpx.Timeout(connect=10.0, read=300.0, write=300.0, pool=5.0),
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_keepalive_connections,
+                keepalive_expiry=keepalive_expiry
+            ),
+            http2=http2
+        )
 
-    async def request(self, request: dict) -> dict:
-        self._prometheus.requests_count_metric()
-        start_time = time.time()
-        prefill_start_time = start_time
-        decode_start_time = None
+    async def close(self) -> None:
+        await self._client.aclose()
+
+    async def request(self, request: dict, start_time: float | None = None, user_id: int | None = None, workload: str | None = None) -> dict:
+        metrics = RequestMetrics(
+            prometheus=self._prometheus,
+            start_time=start_time,
+            custom_id=request.get("custom_id"),
+            user_id=user_id,
+            turn=request.get("turn"),
+            workload=workload
+        )
 
         status_code = 200
         is_first_chunk = True
-        previous_chunk_end_time = None
         error = None
-        role = None
+        data = None
 
+        prompt_tokens = None
         completion_tokens = None # sglang streaming returns running completion tokens
 
         try:
@@ -124,57 +426,38 @@ class SglangRequester:
                 "Content-Type": "application/json"
             }
 
-            async with httpx.AsyncClient(timeout=httpx.Timeout(connect=10.0, read=300.0, write=300.0, pool=5.0)) as client:
-                url = f"{self._base_url}/generate"
-                #logger.info("Sending request to {} with payload {}", url, payload)
-                async with client.stream("POST", url, json=payload, headers=headers) as response:
-                    response.raise_for_status()
-                    async for line in response.aiter_lines():
-                        if line and line.startswith("data:"):
-                            data_str = line[5:].strip()
-                            if data_str == "[DONE]":
-                                break                            
-                            try:
-                                data = json.loads(data_str)
-                            except json.JSONDecodeError as e:
-                                logger.info("Skipping invalid JSON chunk: {}", e)
-                                continue
-
-                            #logger.info(f"\n\n{data['meta_info']['prompt_tokens']}, {type(data['meta_info'])}\n\n")
-                            chunk_text = data.get("text", "")
-                            
-                            if "meta_info" in data and "completion_tokens" in data["meta_info"]:
-                                completion_tokens = data["meta_info"]["completion_tokens"]
-
-                            if is_first_chunk:
-                                if "meta_info" in data:
-                                    prompt_tokens = data["meta_info"]["prompt_tokens"]
-                                    self._prometheus.prefill_tokens(prompt_tokens)
-                                    logger.debug(f"log prompt_tokens = {prompt_tokens}")
-
-                                time_to_first_token = time.time() - start_time
-                                self._prometheus.request_time_to_first_token_latency_metric(time_to_first_token)
-                                prefill_time = time.time() - prefill_start_time
-                                self._prometheus.prefill_time_metric(prefill_time)
-                                decode_start_time = time.time()
-                                is_first_chunk = False
-                            else:
-                                if previous_chunk_end_time is not None:
-                                    time_per_output_token = time.time() - previous_chunk_end_time
-                                    self._prometheus.request_time_per_output_token_latency_metric(time_per_output_token)
-
-                            previous_chunk_end_time = time.time()
-
-                if decode_start_time is not None:
-                    decode_time = time.time() - decode_start_time
-                    self._prometheus.decode_time_metric(decode_time)
-            
-            if completion_tokens is not None:
+            extensions = {"trace": metrics.trace} if self._measure_connection_time else None
+            url = f"{self._base_url}/generate"
+            #logger.info("Sending request to {} with payload {}", url, payload)
+            async with self._client.stream("POST", url, json=payload, headers=headers, extensions=extensions) as response:
+                response.raise_for_status()
+                async for line in response.aiter_lines():
+                    if line and line.startswith("data:"):
+                        data_str = line[5:].strip()
+                        if data_str == "[DONE]":
+                            break                            
+                        try:
+                            data = json.loads(data_str)
+                        except json.JSONDecodeError as e:
+                            logger.info("Skipping invalid JSON chunk: {}", e)
+                            continue
+
+                        if "meta_info" in data and "completion_tokens" in data["meta_info"]:
+                            completion_tokens = data["meta_info"]["completion_tokens"]
+
+                        if is_first_chunk:
+                            if "meta_info" in data:
+                                prompt_tokens = data["meta_info"]["prompt_tokens"]
+                                logger.debug(f"log prompt_tokens = {prompt_tokens}")
+                            is_first_chunk = False
+
+                        metrics.chunk()
+
+            if prompt_tokens is not None and completion_tokens is not None:
                 logger.debug(f"log decode_tokens = {completion_tokens}")
-                self._prometheus.decode_tokens(completion_tokens)
+                metrics.usage(prompt_tokens, completion_tokens)
 
-            total_latency = time.time() - start_time
-            self._prometheus.request_latency_metric(total_latency)
+            total_latency = metrics.finish()
             logger.info("total_latency={}", total_latency)
 
         except httpx.ConnectError as e:
@@ -183,11 +466,14 @@ class SglangRequester:
         except httpx.HTTPStatusError as e:
             logger.error("❌ Non-200 status code: {}", e)
             status_code = e.response.status_code
+        except asyncio.CancelledError:
+            metrics.cancel()
+            raise
         except Exception as e:
             logger.error("❌ Got exception {}, {}", type(e), e)
             status_code = 400
 
-        self._prometheus.response_code_count_metric(code=str(status_code))
+        metrics.status_code(status_code)
         response_data = {
             "custom_id": request.get("custom_id"),
             "status_code": status_code,
@@ -0,0 +1,111 @@
+import zlib
+import asyncio
+
+from strawberry.window import MeasurementWindow
+
+
+class Endpoint:
+    # one serving target, replica of same model or engine of A/B comparison. Name is endpoint label of its metrics
+    def __init__(
+        self,
+        name: str,
+        weight: float,
+        base_url: str,
+        api_key: str,
+        model_name: str,
+        requester_name: str,
+        requester_options: dict | None = None
+    ) -> None:
+        if weight <= 0:
+            raise ValueError("Endpoint weight must be positive")
+        self.name = name
+        self.weight = weight
+        self.base_url = base_url
+        self.api_key = api_key
+        self.model_name = model_name
+        self.requester_name = requester_name
+        self.requester_options = requester_options
+
+
+class Router:
+    # sends every request to one of endpoints. round_robin takes them in turn, least_outstanding takes endpoint with
+    # fewest requests in flight, weighted spreads requests in proportion to weights. split is A/B split, request goes
+    # to endpoint chosen by hash of its custom_id so same request always lands on same endpoint and every endpoint
+    # gets its weighted share of same sampled stream regardless of how fast endpoints answer
+    def __init__(self, endpoints: list[Endpoint], requesters: list, policy: str) -> None:
+        if policy not in ("round_robin", "least_outstanding", "weighted", "split"):
+            raise ValueError("Unknown routing, round_robin, least_outstanding, weighted, split are supported")
+        self._endpoints = endpoints
+        self._requesters = requesters
+        self._policy = policy
+        self._outstanding = [0] * len(endpoints)
+        self._next = 0
+        # smooth weighted round robin, endpoint with largest current weight is chosen and loses total weight
+        self._current_weights = [0.0] * len(endpoints)
+        self._total_weight = sum(endpoint.weight for endpoint in endpoints)
+
+    async def close(self) -> None:
+        await asyncio.gather(*(requester.close() for requester in self._requesters))
+
+    def _choose(self, request: dict) -> int:
+        if self._policy == "round_robin":
+            index = self._next
+            self._next = (self._next + 1) % len(self._endpoints)
+        elif self._policy == "least_outstanding":
+            # ties are broken in turn so idle endpoints share requests evenly
+            order = [(self._next + offset) % len(self._endpoints) for offset in range(len(self._endpoints))]
+            index = min(order, key=lambda i: self._outstanding[i])
+            self._next = (index + 1) % len(self._endpoints)
+        elif self._policy == "weighted":
+            for i, endpoint in enumerate(self._endpoints):
+                self._current_weights[i] += endpoint.weight
+            index = max(range(len(self._endpoints)), key=lambda i: self._current_weights[i])
+            self._current_weights[index] -= self._total_weight
+        else:
+            point = zlib.crc32(str(request["custom_id"]).encode("utf-8")) / 2 ** 32 * self._total_weight
+            index = len(self._endpoints) - 1
+            for i, endpoint in enumerate(self._endpoints):
+                point -= endpoint.weight
+                if point < 0:
+                    index = i
+                    break
+        return index
+
+    async def request(self, request: dict, start_time: float | None = None, user_id: int | None = None, workload: str | None = None) -> dict:
+        index = self._choose(request)
+        self._outstanding[index] += 1
+        try:
+            response = await self._requesters[index].request(request, start_time=start_time, user_id=user_id, workload=workload)
+        finally:
+            self._outstanding[index] -= 1
+        return {**response, "endpoint": self._endpoints[index].name}
+
+
+class MirrorRouter:
+    # A/B mirror, every request is sent to all endpoints at once so they get identical stream. Response of first
+    # endpoint is returned and written to output, responses of others are attached to it under mirrored. Sampled
+    # request completes in measurement window once, after all its copies are done
+    def __init__(self, endpoints: list[Endpoint], requesters: list, window: MeasurementWindow | None = None) -> None:
+        self._endpoints = endpoints
+        self._requesters = requesters
+        self._window = window
+
+    async def close(self) -> None:
+        await asyncio.gather(*(requester.close() for requester in self._requesters))
+
+    async def request(self, request: dict, start_time: float | None = None, user_id: int | None = None, workload: str | None = None) -> dict:
+        phase = self._window.phase() if self._window is not None else None
+        try:
+            # every endpoint gets its own copy of body, sglang requester sets stream in it
+            responses = await asyncio.gather(*(
+                requester.request({**request, "body": dict(request["body"])}, start_time=start_time, user_id=user_id, workload=workload)
+                for requester in self._requesters
+            ))
+        finally:
+            if self._window is not None:
+                self._window.complete(phase)
+        return {
+            **responses[0],
+            "endpoint": self._endpoints[0].name,
+            "mirrored": {endpoint.name: response for endpoint, response in zip(self._endpoints[1:], responses[1:])}
+        }
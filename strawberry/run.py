@@ -1,11 +1,18 @@
+import time
 import openai
 import typing
 import asyncio
 
 from loguru import logger
-from strawberry.user import User
+from strawberry.user import User, SessionUser
+from strawberry.monitor import Monitor
+from strawberry.workload import Workload
+from strawberry.cache import ResponseCache, CachingRequester
+from strawberry.router import Endpoint, Router, MirrorRouter
+from strawberry.arrival import Arrival
+from strawberry.controller import AimdController, RETRYABLE_CODES, backoff
 from strawberry.dataset import Sampler, OutputDataset
-from strawberry.requester import Requester, SglangRequester
+from strawberry.requester import Requester, RawRequester, SglangRequester
 from strawberry.prometheus import Prometheus
 
 
@@ -23,9 +30,22 @@ class Run:
         api_key: str,
         model_name: str,
         output_dataset: OutputDataset,
-        requester_name: str
+        requester_name: str,
+        requester_options: dict | None = None,
+        start_barrier: typing.Callable[[], typing.Awaitable[None]] | None = None,
+        monitor: Monitor | None = None,
+        session_options: dict | None = None,
+        workloads: list[Workload] | None = None,
+        response_cache: ResponseCache | None = None,
+        endpoints: list[Endpoint] | None = None,
+        routing: str = "round_robin"
     ) -> None:
         self._prometheus = prometheus
+        self._monitor = monitor
+        # when set users hold multi turn sessions, see SessionUser
+        self._session_options = session_options
+        # awaited after dataset is ready, lets distributed agents start sending load at same moment
+        self._start_barrier = start_barrier
         self._max_users = max_users
         self._wait = wait
         # use spawn_rate instead of users_per_second
@@ -36,51 +56,83 @@ class Run:
         self._api_key = api_key
         self._model_name = model_name
         self._output_dataset = output_dataset
+        self._recording = False
+        # mix of traffic classes, run without mix has one unnamed workload of dataset and wait
+        self._workloads = workloads if workloads is not None else [Workload(name=None, weight=1.0, dataset=dataset, wait=wait)]
 
-        if requester_name == "openai":
-            self._requester = Requester(
-                prometheus=self._prometheus,
-                base_url=self._base_url,
-                api_key=self._api_key,
-                model_name=self._model_name
-            )
-        elif requester_name == "sglang":
-            self._requester = SglangRequester(
+        # cache wraps requester of every endpoint, key has model of endpoint and hits get its label
+        self._response_cache = response_cache
+        if endpoints is None:
+            self._requester = self._cached(self._create_requester(
                 prometheus=self._prometheus,
+                requester_name=requester_name,
                 base_url=self._base_url,
                 api_key=self._api_key,
-                model_name=self._model_name
-            )
+                model_name=self._model_name,
+                requester_options=requester_options
+            ), prometheus=self._prometheus, model_name=self._model_name)
+        else:
+            # every endpoint has its own requester and endpoint label, router spreads requests between them. Mirror
+            # sends every request to all endpoints, only first one records totals and router moves window
+            mirror = routing == "mirror"
+            requesters = []
+            for i, endpoint in enumerate(endpoints):
+                prometheus = self._prometheus.endpoint(endpoint.name, totals=not mirror or i == 0, window_progress=not mirror)
+                requester = self._create_requester(
+                    prometheus=prometheus,
+                    requester_name=endpoint.requester_name,
+                    base_url=endpoint.base_url,
+                    api_key=endpoint.api_key,
+                    model_name=endpoint.model_name,
+                    requester_options=endpoint.requester_options
+                )
+                requesters.append(self._cached(requester, prometheus=prometheus, model_name=endpoint.model_name))
+            if mirror:
+                self._requester = MirrorRouter(endpoints, requesters, window=self._prometheus.window)
+            else:
+                self._requester = Router(endpoints, requesters, policy=routing)
 
     async def start(self) -> None:
-        logger.info("Start to load dataset")
-        
-        await self._dataset.prepare_data()
-        
-        logger.info("Dataset is ready")
-
         self._background_tasks = set()
+        try:
+            logger.info("Start to load dataset")
 
-        # keeps number of started users. only goes up
-        self.started_users = 0
-        
-        # keeps active number of users for log. Can go down or up
-        self.active_users_gauge = 0 
-
-        # keeps finished number of users for log. Only goes up
-        self._finished_users = 0
-
-        # loop until we reach max_users
-        while self.started_users < self._max_users:
-            self._create_user()
-            logger.info(f"Add user, currently active {self.active_users_gauge} / {self._max_users} users")
-            
-            # changed logic: spawn_rate of 0.1 => 1 user every 10s
-            # spawn_rate of 2.0 => 2 users per second => 1 user every 0.5s
-            if self._spawn_rate > 0:
-                await asyncio.sleep(1.0 / self._spawn_rate)
+            await self._prepare_data()
+
+            logger.info("Dataset is ready")
+
+            await self._wait_start()
+
+            self._start_recording()
+            if self._monitor is not None:
+                self._monitor.start()
+
+            # keeps number of started users. only goes up
+            self.started_users = 0
+
+            # keeps active number of users for log. Can go down or up
+            self.active_users_gauge = 0
+
+            # keeps finished number of users for log. Only goes up
+            self._finished_users = 0
+
+            # started users of every workload
+            self._workload_users = [0] * len(self._workloads)
+
+            # loop until we reach max_users
+            while self.started_users < self._max_users:
+                self._create_user()
+                logger.info(f"Add user, currently active {self.active_users_gauge} / {self._max_users} users")
+
+                # changed logic: spawn_rate of 0.1 => 1 user every 10s
+                # spawn_rate of 2.0 => 2 users per second => 1 user every 0.5s
+                if self._spawn_rate > 0:
+                    await asyncio.sleep(1.0 / self._spawn_rate)
+
+            # run time is counted after users are spawned
+            if self._prometheus.window is not None:
+                self._prometheus.window.set_deadline(self._run_time)
 
-        try:
             logger.info(f"All users are spawned. Start to wait untill all users will finish or timeout {self._run_time} seconds")
             done, pending = await asyncio.wait(
                 self._background_tasks, 
@@ -93,26 +145,331 @@ class Run:
             for t in self._background_tasks:
                 if not t.done():
                     t.cancel()
-    
+            # users have to stop before requester is closed, otherwise they fail on closed client
+            await asyncio.gather(*self._background_tasks, return_exceptions=True)
+            await self._close()
+
+    async def _close(self) -> None:
+        # closes everything run opened, also when dataset or start barrier failed before load was sent
+        if self._monitor is not None:
+            await self._monitor.stop()
+        if self._recording:
+            self._stop_recording()
+        await self._requester.close()
+        if self._response_cache is not None:
+            await self._response_cache.close()
+        await self._output_dataset.close()
+
+    def _cached(self, requester, prometheus: Prometheus, model_name: str):
+        if self._response_cache is None:
+            return requester
+        return CachingRequester(requester, self._response_cache, model_name=model_name, prometheus=prometheus)
+
+    @staticmethod
+    def _create_requester(prometheus: Prometheus, requester_name: str, base_url: str, api_key: str, model_name: str, requester_options: dict | None):
+        if requester_name == "openai":
+            return Requester(
+                prometheus=prometheus,
+                base_url=base_url,
+                api_key=api_key,
+                model_name=model_name
+            )
+        elif requester_name == "openai_raw":
+            return RawRequester(
+                prometheus=prometheus,
+                base_url=base_url,
+                api_key=api_key,
+                model_name=model_name,
+                **(requester_options or {})
+            )
+        elif requester_name == "sglang":
+            return SglangRequester(
+                prometheus=prometheus,
+                base_url=base_url,
+                api_key=api_key,
+                model_name=model_name,
+                **(requester_options or {})
+            )
+        else:
+            raise ValueError("Unknown requester, openai, openai_raw, sglang are supported")
+
+    async def _prepare_data(self) -> None:
+        for workload in self._workloads:
+            await workload.dataset.prepare_data()
+
+    def _start_recording(self, deadline: float | None = None) -> None:
+        # with measurement window recorder covers steady state only, window starts and stops it
+        self._recording = True
+        window = self._prometheus.window
+        if window is None:
+            self._prometheus.recorder.start()
+            return
+        window.start(self._prometheus.recorder)
+        if deadline is not None:
+            window.set_deadline(deadline)
+
+    def _stop_recording(self) -> None:
+        self._recording = False
+        if self._prometheus.window is None:
+            self._prometheus.recorder.stop()
+        else:
+            self._prometheus.window.stop()
+
+    def _workload_prometheus(self, workload: str | None) -> Prometheus:
+        return self._prometheus.workload(workload) if workload is not None else self._prometheus
+
+    async def _wait_start(self) -> None:
+        if self._start_barrier is not None:
+            logger.info("Wait for start of other agents")
+            await self._start_barrier()
+
     def _create_user(self) -> None:
-        user = User(
+        # users are split between workloads by weight, next user joins workload that is furthest below its share
+        total_weight = sum(workload.weight for workload in self._workloads)
+        index = max(
+            range(len(self._workloads)),
+            key=lambda i: self._workloads[i].weight / total_weight * (self.started_users + 1) - self._workload_users[i]
+        )
+        workload = self._workloads[index]
+        self._workload_users[index] += 1
+        prometheus = self._workload_prometheus(workload.name)
+
+        user_arguments = dict(
             requester=self._requester,
-            wait=self._wait,
-            dataset=self._dataset,
-            output_dataset_writer=self._output_dataset
+            wait=workload.wait,
+            dataset=workload.dataset,
+            output_dataset_writer=self._output_dataset,
+            user_id=self.started_users,
+            prometheus=prometheus,
+            workload=workload.name
         )
-        self._prometheus.increase_users_count()
+        if self._session_options is not None:
+            user = SessionUser(**self._session_options, **user_arguments)
+        else:
+            user = User(**user_arguments)
+        prometheus.increase_users_count()
         task = asyncio.create_task(user.start())
         self._background_tasks.add(task)
-        task.add_done_callback(self._on_user_finish)
+        task.add_done_callback(lambda task: self._on_user_finish(task, prometheus))
         self.started_users += 1
         self.active_users_gauge += 1
     
-    def _on_user_finish(self, task) -> None:
-        self._prometheus.decrease_users_count()
+    def _on_user_finish(self, task, prometheus: Prometheus) -> None:
+        prometheus.decrease_users_count()
         self.active_users_gauge -= 1
         self._finished_users += 1
         logger.info(
             f"Remove user, currently active {self.active_users_gauge} / {self._max_users} users. "
             f"Finished users {self._finished_users} / {self._max_users}"
         )
+
+
+class OpenLoopRun(Run):
+    # issues requests on arrival schedule independent of responses so slow server does not lower offered load.
+    # max_users bounds number of requests in flight, requests waiting for free slot keep their intended start time
+    def __init__(self, arrival: Arrival, **kwargs) -> None:
+        super().__init__(**kwargs)
+        self._arrival = arrival
+
+    async def start(self) -> None:
+        self._background_tasks = set()
+        self._sent_requests = 0
+        dispatchers = []
+        try:
+            logger.info("Start to load dataset")
+
+            await self._prepare_data()
+
+            logger.info("Dataset is ready")
+
+            await self._wait_start()
+
+            self._start_recording(deadline=self._run_time)
+            if self._monitor is not None:
+                self._monitor.start()
+            self._in_flight = asyncio.Semaphore(self._max_users)
+            self._start_time = time.perf_counter()
+
+            # every workload has its own arrival schedule, all of them share limit of requests in flight
+            dispatchers = [asyncio.create_task(self._dispatch(workload)) for workload in self._workloads]
+            logger.info(f"Start to send requests on arrival schedule for {self._run_time} seconds with at most {self._max_users} in flight")
+            done, pending = await asyncio.wait(dispatchers, timeout=self._run_time)
+            if not pending and self._background_tasks:
+                logger.info("All requests are sent. Wait for requests in flight")
+                remaining_time = max(0.0, self._run_time - (time.perf_counter() - self._start_time))
+                await asyncio.wait(self._background_tasks, timeout=remaining_time)
+        except asyncio.CancelledError:
+            pass
+        finally:
+            for dispatcher in dispatchers:
+                dispatcher.cancel()
+            for t in list(self._background_tasks):
+                if not t.done():
+                    t.cancel()
+            await asyncio.gather(*self._background_tasks, return_exceptions=True)
+            await self._close()
+        logger.info(f"Sent {self._sent_requests} requests")
+
+    async def _dispatch(self, workload: Workload) -> None:
+        arrival = workload.arrival or self._arrival
+        offset = arrival.next_time(0.0)
+        async for request, is_last in workload.dataset:
+            if offset >= self._run_time:
+                break
+            await self._dispatch_at(request, offset, workload.name)
+            offset = arrival.next_time(offset)
+
+    async def _dispatch_at(self, request: dict, offset: float, workload: str | None = None) -> None:
+        intended_start_time = self._start_time + offset
+        delay = intended_start_time - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        # how late dispatcher itself is, schedule is not followed when it keeps growing
+        self._workload_prometheus(workload).dispatch_lag_metric(max(0.0, time.perf_counter() - intended_start_time))
+        task = asyncio.create_task(self._send(request, intended_start_time=intended_start_time, workload=workload))
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_tasks.discard)
+        self._sent_requests += 1
+
+    async def _send(self, request: dict, intended_start_time: float, workload: str | None = None) -> None:
+        prometheus = self._workload_prometheus(workload)
+        async with self._in_flight:
+            prometheus.increase_users_count()
+            try:
+                response = await self._requester.request(request, start_time=intended_start_time, workload=workload)
+                write_start_time = time.perf_counter()
+                await self._output_dataset.write_single_response(response)
+                prometheus.output_write_latency_metric(time.perf_counter() - write_start_time)
+            finally:
+                prometheus.decrease_users_count()
+
+
+class TraceRun(OpenLoopRun):
+    # replays timestamped trace, every request is sent at its offset in trace divided by speedup so bursts and
+    # correlation between time and prompts of production are kept
+    def __init__(self, speedup: float, **kwargs) -> None:
+        super().__init__(arrival=None, **kwargs)
+        if speedup <= 0:
+            raise ValueError("Trace speedup must be positive")
+        self._speedup = speedup
+
+    async def _dispatch(self, workload: Workload) -> None:
+        # rows after end of run time are counted so cut replay is not mistaken for whole trace
+        dropped = 0
+        try:
+            async for request, is_last in workload.dataset:
+                offset = workload.dataset.offset(request) / self._speedup
+                if offset >= self._run_time:
+                    dropped += 1
+                    continue
+                await self._dispatch_at(request, offset, workload.name)
+        finally:
+            if dropped > 0:
+                logger.warning(
+                    f"Run time {self._run_time} seconds ended before trace, {dropped} requests of trace were not sent. "
+                    f"Raise --run_time or --trace_speedup to replay whole trace"
+                )
+
+
+class BatchRun(Run):
+    # processes finite dataset with as many requests in flight as server handles. Controller moves limit between
+    # min_users and max_users, requests failed with retryable code go back to sampler with backoff
+    def __init__(self, controller: AimdController, control_interval: float, max_retries: int, retry_backoff: float, **kwargs) -> None:
+        super().__init__(**kwargs)
+        self._controller = controller
+        self._control_interval = control_interval
+        self._max_retries = max_retries
+        self._retry_backoff = retry_backoff
+
+    async def start(self) -> None:
+        self._background_tasks = set()
+        self._retried_requests = 0
+        tasks = []
+        try:
+            logger.info("Start to load dataset")
+
+            await self._prepare_data()
+
+            logger.info("Dataset is ready")
+
+            await self._wait_start()
+
+            self._start_recording(deadline=self._run_time)
+            if self._monitor is not None:
+                self._monitor.start()
+            self._slots = asyncio.Condition()
+            self._in_flight = 0
+            # whether limit was reached since last control step, limit is increased only when it is what holds load back
+            self._saturated = False
+            self._attempts = {}
+            self._prometheus.users_limit(self._controller.limit)
+
+            dispatcher = asyncio.create_task(self._dispatch())
+            tasks = [dispatcher, asyncio.create_task(self._control())]
+            logger.info(f"Start to process dataset with adaptive limit of requests in flight, starting at {self._controller.limit}")
+            await asyncio.wait([dispatcher], timeout=self._run_time)
+            if not dispatcher.done():
+                logger.info(f"Run time {self._run_time} seconds is over")
+            elif dispatcher.exception() is not None:
+                raise dispatcher.exception()
+        except asyncio.CancelledError:
+            pass
+        finally:
+            for task in tasks:
+                task.cancel()
+            for t in list(self._background_tasks):
+                if not t.done():
+                    t.cancel()
+            await asyncio.gather(*tasks, *self._background_tasks, return_exceptions=True)
+            await self._close()
+        logger.info(f"Retried {self._retried_requests} requests, final limit of requests in flight {self._controller.limit}")
+
+    async def _dispatch(self) -> None:
+        while True:
+            async for request, is_last in self._dataset:
+                async with self._slots:
+                    if self._in_flight >= self._controller.limit:
+                        self._saturated = True
+                        await self._slots.wait_for(lambda: self._in_flight < self._controller.limit)
+                    self._in_flight += 1
+                task = asyncio.create_task(self._send(request))
+                self._background_tasks.add(task)
+                task.add_done_callback(self._background_tasks.discard)
+            # requests in flight may still fail and come back to sampler
+            if self._background_tasks:
+                await asyncio.wait(list(self._background_tasks))
+            if self._dataset.retries == 0:
+                break
+        logger.info("Dataset is processed")
+
+    async def _send(self, request: dict) -> None:
+        self._prometheus.increase_users_count()
+        try:
+            response = await self._requester.request(request)
+            attempt = self._attempts.get(request["custom_id"], 0)
+            if response["status_code"] in RETRYABLE_CODES and attempt < self._max_retries:
+                self._attempts[request["custom_id"]] = attempt + 1
+                self._retried_requests += 1
+                self._dataset.requeue(request, delay=backoff(attempt, self._retry_backoff))
+            else:
+                self._attempts.pop(request["custom_id"], None)
+                write_start_time = time.perf_counter()
+                await self._output_dataset.write_single_response(response)
+                self._prometheus.output_write_latency_metric(time.perf_counter() - write_start_time)
+        finally:
+            self._prometheus.decrease_users_count()
+            async with self._slots:
+                self._in_flight -= 1
+                self._slots.notify_all()
+
+    async def _control(self) -> None:
+        while True:
+            await asyncio.sleep(self._control_interval)
+            previous_limit = self._controller.limit
+            reason = self._controller.update(saturated=self._saturated)
+            self._saturated = self._in_flight >= self._controller.limit
+            if self._controller.limit != previous_limit:
+                logger.info(f"Limit of requests in flight {previous_limit} -> {self._controller.limit}" + (f", {reason}" if reason else ""))
+                self._prometheus.users_limit(self._controller.limit)
+                async with self._slots:
+                    self._slots.notify_all()
@@ -0,0 +1,141 @@
+import json
+import argparse
+
+from pathlib import Path
+from loguru import logger
+from strawberry.prometheus import Prometheus
+from strawberry.recorder import format_summary
+from strawberry.factory import local_input_output_factory, run_factory
+
+
+class Slo:
+    # limits that load level has to meet, None means limit is not checked
+    def __init__(self, ttft_p99: float | None, tpot_p99: float | None, error_rate: float | None) -> None:
+        self.ttft_p99 = ttft_p99
+        self.tpot_p99 = tpot_p99
+        self.error_rate = error_rate
+
+    def breaches(self, summary: dict) -> list[str]:
+        latency = summary["latency_seconds"]
+        if summary["requests"]["successful"] == 0:
+            return ["no successful requests"]
+        breaches = []
+        for name, metric, limit in (
+            ("p99 TTFT", "time_to_first_token", self.ttft_p99),
+            ("p99 TPOT", "time_per_output_token", self.tpot_p99),
+        ):
+            if limit is not None and metric in latency and latency[metric]["p99"] > limit:
+                breaches.append(f"{name} {latency[metric]['p99']:.4f} s > {limit} s")
+        if self.error_rate is not None and summary["requests"]["error_rate"] > self.error_rate:
+            breaches.append(f"error rate {summary['requests']['error_rate']:.2%} > {self.error_rate:.2%}")
+        return breaches
+
+    def to_dict(self) -> dict:
+        return {"ttft_p99": self.ttft_p99, "tpot_p99": self.tpot_p99, "error_rate": self.error_rate}
+
+
+class Sweep:
+    # runs same benchmark at several load levels, max_users in closed mode and arrival_rate in open mode, until
+    # slo is breached. Every level is separate Run with its own run label so steps are distinct series in Grafana
+    def __init__(self, arguments: argparse.Namespace, prometheus: Prometheus, run_name: str, slo: Slo) -> None:
+        self._arguments = arguments
+        self._prometheus = prometheus
+        self._run_name = run_name
+        self._slo = slo
+        self._parameter = "max_users" if arguments.mode == "closed" else "arrival_rate"
+        self._steps = []
+
+    async def start(self) -> dict:
+        start, stop, step = self._arguments.sweep_start, self._arguments.sweep_stop, self._arguments.sweep_step
+        if start is None or stop is None or step is None:
+            raise ValueError("Sweep needs --sweep_start, --sweep_stop and --sweep_step")
+        if step <= 0 or stop < start:
+            raise ValueError("Sweep needs positive --sweep_step and --sweep_stop not below --sweep_start")
+        if self._arguments.mode not in ("closed", "open"):
+            raise ValueError("Sweep supports closed and open modes")
+        if self._arguments.mode == "open" and self._arguments.arrival == "curve":
+            raise ValueError("Sweep of open mode changes --arrival_rate, use constant or poisson arrival")
+
+        max_load = None
+        if self._arguments.sweep == "step":
+            load = self._level(start)
+            while load <= stop:
+                if not await self._measure(load):
+                    break
+                max_load = load
+                load = self._level(load + step)
+        elif self._arguments.sweep == "bisect":
+            # step is resolution of search, low always meets slo and high always breaches it
+            low, high = self._level(start), self._level(stop)
+            if await self._measure(low):
+                max_load = low
+                if await self._measure(high):
+                    max_load = high
+                else:
+                    while high - low > step:
+                        load = self._level((low + high) / 2)
+                        if load in (low, high):
+                            break
+                        if await self._measure(load):
+                            low = max_load = load
+                        else:
+                            high = load
+        else:
+            raise ValueError("Unknown type for sweep, step, bisect are supported")
+
+        result = {
+            "parameter": self._parameter,
+            "slo": self._slo.to_dict(),
+            "max_load": max_load,
+            "steps": sorted(self._steps, key=lambda s: s["load"]),
+        }
+        logger.info(f"Highest {self._parameter} that meets slo is {max_load}")
+        return result
+
+    def _level(self, load: float) -> float:
+        return int(load) if self._parameter == "max_users" else load
+
+    async def _measure(self, load: float) -> bool:
+        load = self._level(load)
+        run_name = f"{self._run_name}_{self._parameter}_{load:g}"
+        logger.info(f"Start sweep step {run_name}")
+        self._prometheus.set_run(run_name)
+
+        arguments = argparse.Namespace(**vars(self._arguments))
+        setattr(arguments, self._parameter, load)
+        input_dataset, output_dataset, sampler = local_input_output_factory(arguments)
+        run = run_factory(arguments, self._prometheus, sampler, output_dataset)
+        await run.start()
+
+        summary = self._prometheus.recorder.summary()
+        breaches = self._slo.breaches(summary)
+        print(format_summary(summary))
+        if breaches:
+            logger.info(f"Step {run_name} breaches slo: {', '.join(breaches)}")
+        self._steps.append({"run": run_name, "load": load, "meets_slo": not breaches, "breaches": breaches, "summary": summary})
+        return not breaches
+
+
+def format_sweep(result: dict) -> str:
+    header = f"{result['parameter']:>14}{'requests/s':>14}{'goodput':>14}{'tokens/s':>14}{'p99 TTFT':>12}{'p99 TPOT':>12}{'errors':>10}  slo"
+    lines = [header, "-" * len(header)]
+    for step in result["steps"]:
+        summary = step["summary"]
+        latency = summary["latency_seconds"]
+        ttft = latency.get("time_to_first_token", {}).get("p99", float("nan"))
+        tpot = latency.get("time_per_output_token", {}).get("p99", float("nan"))
+        lines.append(
+            f"{step['load']:>14g}{summary['throughput']['requests_per_second']:>14.3f}"
+            f"{summary['throughput']['goodput_requests_per_second']:>14.3f}{summary['throughput']['output_tokens_per_second']:>14.1f}"
+            f"{ttft:>12.4f}{tpot:>12.4f}{summary['requests']['error_rate']:>10.2%}  {'ok' if step['meets_slo'] else 'breach'}"
+        )
+    lines.append("-" * len(header))
+    lines.append(f"highest {result['parameter']} that meets slo is {result['max_load']}")
+    return "\n".join(lines)
+
+
+def report_sweep(result: dict, sweep_path: Path | None) -> None:
+    print(format_sweep(result))
+    if sweep_path is not None:
+        with open(sweep_path, "w", encoding="utf-8") as file:
+            json.dump(result, file, indent=4)
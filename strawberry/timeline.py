@@ -0,0 +1,120 @@
+import csv
+import asyncio
+import concurrent.futures
+
+from pathlib import Path
+from loguru import logger
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+
+# timestamps are time.perf_counter seconds, monotonic and comparable between processes of one machine
+COLUMNS = [
+    "custom_id",
+    "user_id",
+    "turn",
+    "workload",
+    "phase",
+    "endpoint",
+    "status_code",
+    "cached",
+    "start_time",
+    "first_token_time",
+    "end_time",
+    "prompt_tokens",
+    "completion_tokens",
+    "chunk_gaps",
+]
+
+
+class TimelineWriter:
+    # one row per request. Rows are appended to in memory buffer on request path, full buffers are written in
+    # background thread as parquet row groups, or as csv when pyarrow is not installed
+    def __init__(self, path: Path, include_gaps: bool = False, flush_rows: int = 8192) -> None:
+        self._include_gaps = include_gaps
+        self._flush_rows = flush_rows
+        self._rows = []
+        self._file = None
+        self._writer = None
+        # single thread keeps buffers in order they were filled
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="strawberry-timeline")
+        if pyarrow is not None:
+            self._path = path
+            self._schema = pyarrow.schema([
+                ("custom_id", pyarrow.string()),
+                ("user_id", pyarrow.int64()),
+                ("turn", pyarrow.int64()),
+                ("workload", pyarrow.string()),
+                ("phase", pyarrow.string()),
+                ("endpoint", pyarrow.string()),
+                ("status_code", pyarrow.int64()),
+                ("cached", pyarrow.bool_()),
+                ("start_time", pyarrow.float64()),
+                ("first_token_time", pyarrow.float64()),
+                ("end_time", pyarrow.float64()),
+                ("prompt_tokens", pyarrow.int64()),
+                ("completion_tokens", pyarrow.int64()),
+                ("chunk_gaps", pyarrow.list_(pyarrow.float64())),
+            ])
+        else:
+            self._path = path.with_suffix(".csv")
+            logger.warning(f"pyarrow is not installed, timeline is written as csv to {self._path}")
+
+    @property
+    def include_gaps(self) -> bool:
+        return self._include_gaps
+
+    @property
+    def path(self) -> Path:
+        return self._path
+
+    def write(self, row: dict) -> None:
+        self._rows.append(row)
+        if len(self._rows) >= self._flush_rows:
+            self._flush()
+
+    async def close(self) -> None:
+        self._flush()
+        self._executor.submit(self._close_file).add_done_callback(self._on_done)
+        await asyncio.to_thread(self._executor.shutdown, wait=True)
+        logger.info(f"Timeline is written to {self._path}")
+
+    def _flush(self) -> None:
+        if len(self._rows) == 0:
+            return
+        rows, self._rows = self._rows, []
+        self._executor.submit(self._write_rows, rows).add_done_callback(self._on_done)
+
+    def _on_done(self, future: concurrent.futures.Future) -> None:
+        if future.exception() is not None:
+            logger.error(f"Could not write timeline to {self._path}: {future.exception()}")
+
+    def _write_rows(self, rows: list[dict]) -> None:
+        for row in rows:
+            if row["custom_id"] is not None:
+                row["custom_id"] = str(row["custom_id"])
+        if pyarrow is not None:
+            table = pyarrow.Table.from_pylist(rows, schema=self._schema)
+            if self._writer is None:
+                self._writer = pyarrow.parquet.ParquetWriter(self._path, self._schema)
+            self._writer.write_table(table)
+            return
+
+        if self._writer is None:
+            self._file = open(self._path, "w", encoding="utf-8", newline="")
+            self._writer = csv.writer(self._file)
+            self._writer.writerow(COLUMNS)
+        for row in rows:
+            gaps = row["chunk_gaps"]
+            row["chunk_gaps"] = " ".join(map(repr, gaps)) if gaps is not None else None
+            self._writer.writerow([row[column] for column in COLUMNS])
+
+    def _close_file(self) -> None:
+        if pyarrow is not None and self._writer is not None:
+            self._writer.close()
+        if self._file is not None:
+            self._file.close()
@@ -4,11 +4,24 @@ import asyncio
 
 from loguru import logger
 from strawberry.requester import Requester
+from strawberry.prometheus import Prometheus
 from strawberry.dataset import Sampler, OutputDataset
 
 
 class User:
-    def __init__(self, requester: Requester, wait: typing.Callable, dataset: Sampler, output_dataset_writer: OutputDataset) -> None:
+    def __init__(
+        self,
+        requester: Requester,
+        wait: typing.Callable,
+        dataset: Sampler,
+        output_dataset_writer: OutputDataset,
+        user_id: int | None = None,
+        prometheus: Prometheus | None = None,
+        workload: str | None = None
+    ) -> None:
+        self._prometheus = prometheus
+        self._user_id = user_id
+        self._workload = workload
         self._wait = wait
         self._dataset = dataset
         self._requester = requester
@@ -16,9 +29,54 @@ class User:
 
     async def start(self) -> None:
         async for request, is_last in self._dataset:
-            res = await self._requester.request(request)            
+            res = await self._requester.request(request, user_id=self._user_id, workload=self._workload)            
+            write_start_time = time.perf_counter()
             await self._output_dataset_writer.write_single_response(res)
+            if self._prometheus is not None:
+                self._prometheus.output_write_latency_metric(time.perf_counter() - write_start_time)
             if not is_last:
                 await asyncio.sleep(self._wait())
         
         logger.info("User finished processing")
+
+
+class SessionUser(User):
+    # every sampled row starts conversation of several turns. Reply of model is appended to history and next user
+    # message is sent with whole history, so server can reuse cached prefix of previous turns. Next user messages
+    # are taken from "turns" list of row and follow_up message is used when row has no more of them
+    def __init__(self, turns: int, think_time: typing.Callable, follow_up: str, **kwargs) -> None:
+        super().__init__(**kwargs)
+        self._turns = turns
+        self._think_time = think_time
+        self._follow_up = follow_up
+
+    async def start(self) -> None:
+        async for request, is_last in self._dataset:
+            response = await self._session(request)
+            write_start_time = time.perf_counter()
+            await self._output_dataset_writer.write_single_response(response)
+            if self._prometheus is not None:
+                self._prometheus.output_write_latency_metric(time.perf_counter() - write_start_time)
+            if not is_last:
+                await asyncio.sleep(self._wait())
+
+        logger.info("User finished processing")
+
+    async def _session(self, request: dict) -> dict:
+        messages = list(request["body"]["messages"])
+        next_messages = list(request.get("turns", []))
+        for turn in range(self._turns):
+            if turn > 0:
+                messages.append({"role": "user", "content": next_messages.pop(0) if next_messages else self._follow_up})
+                await asyncio.sleep(self._think_time())
+            turn_request = {
+                "custom_id": request["custom_id"],
+                "turn": turn,
+                "body": {**request["body"], "messages": list(messages)}
+            }
+            response = await self._requester.request(turn_request, user_id=self._user_id, workload=self._workload)
+            if response["status_code"] != 200:
+                break
+            messages.append({"role": response["response"]["role"] or "assistant", "content": response["response"]["content"]})
+        # last response of session is saved under id of row
+        return response
@@ -0,0 +1,94 @@
+import time
+
+from loguru import logger
+from strawberry.recorder import Recorder
+
+
+class MeasurementWindow:
+    # splits run into warmup, steady and cooldown phases, every request belongs to phase it starts in. Recorder is
+    # started when steady state begins and stopped when it ends so summary and its throughput cover steady state only.
+    # Warmup lasts warmup_time seconds and until warmup_requests requests completed. Steady state ends cooldown_time
+    # seconds before deadline of run or after steady_requests steady requests completed, whichever comes first
+    def __init__(self, warmup_time: float = 0.0, warmup_requests: int = 0, cooldown_time: float = 0.0, steady_requests: int | None = None) -> None:
+        self._warmup_time = warmup_time
+        self._warmup_requests = warmup_requests
+        self._cooldown_time = cooldown_time
+        self._steady_requests = steady_requests
+        self._recorder = None
+        self._phase = "warmup"
+
+    def start(self, recorder: Recorder) -> None:
+        self._recorder = recorder
+        self._start_time = time.perf_counter()
+        # recorder keeps wall clock so recorders of agents can be merged
+        self._wall_start_time = time.time()
+        self._deadline = None
+        self._phase = "warmup"
+        self._steady_start_time = None
+        self._steady_end_time = None
+        # completed requests of current phase and moment when enough of them completed
+        self._completed = 0
+        self._requests_done_time = self._start_time if self._warmup_requests <= 0 else None
+        self._update(self._start_time)
+
+    def set_deadline(self, seconds: float) -> None:
+        # closed mode knows its end only after all users are spawned
+        self._deadline = time.perf_counter() + seconds
+
+    def phase(self) -> str:
+        self._update(time.perf_counter())
+        return self._phase
+
+    def complete(self, phase: str) -> None:
+        now = time.perf_counter()
+        if phase == self._phase:
+            self._completed += 1
+            limit = self._warmup_requests if phase == "warmup" else self._steady_requests
+            if self._requests_done_time is None and limit is not None and self._completed >= limit:
+                self._requests_done_time = now
+        self._update(now)
+
+    def steady_overlap(self, start: float, end: float) -> float:
+        # seconds of interval inside steady state, time in flight of request is clipped to it whatever phase request
+        # started in, so requests crossing bounds of window do not inflate concurrency
+        self._update(end)
+        if self._steady_start_time is None:
+            return 0.0
+        steady_end_time = self._steady_end_time if self._steady_end_time is not None else end
+        return max(0.0, min(end, steady_end_time) - max(start, self._steady_start_time))
+
+    def stop(self) -> None:
+        now = time.perf_counter()
+        self._update(now)
+        if self._phase == "warmup":
+            logger.warning("Run ended before warmup was over, no request was measured")
+        elif self._phase == "steady":
+            self._begin_cooldown(now)
+
+    def _update(self, now: float) -> None:
+        if self._phase == "warmup" and self._requests_done_time is not None:
+            begin = max(self._start_time + self._warmup_time, self._requests_done_time)
+            if now >= begin:
+                self._begin_steady(begin)
+        if self._phase == "steady":
+            ends = []
+            if self._deadline is not None and self._cooldown_time > 0:
+                ends.append(self._deadline - self._cooldown_time)
+            if self._requests_done_time is not None:
+                ends.append(self._requests_done_time)
+            if ends and now >= min(ends):
+                self._begin_cooldown(min(ends))
+
+    def _begin_steady(self, at: float) -> None:
+        self._phase = "steady"
+        self._steady_start_time = at
+        self._completed = 0
+        self._requests_done_time = None
+        self._recorder.start(start_time=self._wall_start_time + (at - self._start_time))
+        logger.info(f"Warmup is over after {at - self._start_time:.1f} seconds, steady state is measured")
+
+    def _begin_cooldown(self, at: float) -> None:
+        self._phase = "cooldown"
+        self._steady_end_time = at
+        self._recorder.stop(end_time=self._wall_start_time + (at - self._start_time))
+        logger.info(f"Steady state is over after {at - self._start_time:.1f} seconds, following requests are not measured")
@@ -0,0 +1,90 @@
+import os
+import queue
+import shutil
+import asyncio
+import argparse
+import tempfile
+import multiprocessing
+import prometheus_client.multiprocess
+
+from loguru import logger
+from strawberry.recorder import Recorder
+from strawberry.prometheus import Prometheus, multiprocess_registry
+from strawberry.factory import local_input_output_factory, run_factory, timeline_factory, pusher_factory
+
+
+def _run_worker(arguments: argparse.Namespace, run_name: str, index: int, count: int, recorders: multiprocessing.Queue) -> None:
+    # worker process inherits PROMETHEUS_MULTIPROC_DIR from parent so its metrics are written to shared directory
+    timeline = timeline_factory(arguments, partition=(index, count))
+    prometheus = Prometheus(run=run_name, prometheus_port=None, timeline=timeline)
+
+    async def program() -> None:
+        input_dataset, output_dataset, sampler = local_input_output_factory(arguments, partition=(index, count))
+        run = run_factory(arguments, prometheus, sampler, output_dataset, partition=(index, count))
+        await run.start()
+        if timeline is not None:
+            await timeline.close()
+
+    logger.info(f"Start worker {index} / {count}")
+    asyncio.run(program())
+    # exact observations are sent to parent which merges them into one summary
+    recorders.put(prometheus.recorder)
+    logger.info(f"Worker {index} / {count} finished")
+
+
+class WorkerPool:
+    # runs same run in several processes each with its own event loop. Every worker gets its own partition of dataset
+    # and share of users, metrics of all workers are merged with prometheus_client multiprocess mode and served by parent
+    def __init__(self, arguments: argparse.Namespace, run_name: str, workers: int) -> None:
+        self._arguments = arguments
+        self._run_name = run_name
+        self._workers = workers
+
+    def start(self) -> Recorder:
+        multiprocess_dir = tempfile.mkdtemp(prefix="strawberry_prometheus_")
+        os.environ["PROMETHEUS_MULTIPROC_DIR"] = multiprocess_dir
+        registry = multiprocess_registry()
+        prometheus_client.start_http_server(self._arguments.prometheus_port, registry=registry)
+        # parent pushes merged metrics of all workers
+        pusher = pusher_factory(self._arguments, registry=registry)
+
+        # spawn instead of fork so workers do not inherit parent event loop and prometheus state
+        context = multiprocessing.get_context("spawn")
+        recorders = context.Queue()
+        processes = [
+            context.Process(
+                target=_run_worker,
+                args=(self._arguments, self._run_name, index, self._workers, recorders),
+                name=f"strawberry-worker-{index}"
+            )
+            for index in range(self._workers)
+        ]
+        for process in processes:
+            process.start()
+        logger.info(f"Started {self._workers} workers")
+
+        recorder = Recorder()
+        try:
+            # recorders are received before join, process that put large object in queue does not exit until it is read
+            received = 0
+            while received < len(processes):
+                try:
+                    recorder.merge(recorders.get(timeout=1.0))
+                    received += 1
+                except queue.Empty:
+                    if not any(process.is_alive() for process in processes) and recorders.empty():
+                        break
+            for process in processes:
+                process.join()
+                prometheus_client.multiprocess.mark_process_dead(process.pid)
+                if process.exitcode != 0:
+                    logger.error(f"Worker {process.name} exited with code {process.exitcode}")
+        finally:
+            for process in processes:
+                if process.is_alive():
+                    process.terminate()
+                    process.join()
+            if pusher is not None:
+                pusher.stop()
+            shutil.rmtree(multiprocess_dir, ignore_errors=True)
+        return recorder
@@ -0,0 +1,17 @@
+import typing
+
+from strawberry.arrival import Arrival
+from strawberry.dataset import Sampler
+
+
+class Workload:
+    # one class of traffic in mix, has its own dataset and waits of its users in closed mode or arrival schedule in
+    # open mode. Weight is its share of users in closed mode, name is workload label of its metrics
+    def __init__(self, name: str | None, weight: float, dataset: Sampler, wait: typing.Callable, arrival: Arrival | None = None) -> None:
+        if weight <= 0:
+            raise ValueError("Workload weight must be positive")
+        self.name = name
+        self.weight = weight
+        self.dataset = dataset
+        self.wait = wait
+        self.arrival = arrival
@@ -0,0 +1,102 @@
+import re
+import json
+import socket
+import asyncio
+import threading
+
+import boto3
+import pytest
+import prometheus_client
+
+from aiohttp import web
+from moto.server import ThreadedMotoServer
+from strawberry.prometheus import Prometheus
+from strawberry.mock_server import MockServer
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@pytest.fixture(scope="session")
+def s3_server():
+    # aioboto3 talks to moto over http like to real s3 so whole client stack is exercised
+    port = free_port()
+    server = ThreadedMotoServer(ip_address="127.0.0.1", port=port)
+    server.start()
+    yield f"http://127.0.0.1:{port}"
+    server.stop()
+
+
+@pytest.fixture
+def s3_bucket(s3_server, request):
+    bucket = re.sub(r"[^a-z0-9]+", "-", request.node.name.lower()).strip("-")[:63]
+    client = boto3.client(
+        "s3",
+        endpoint_url=s3_server,
+        aws_access_key_id="test",
+        aws_secret_access_key="test",
+        region_name="us-east-1"
+    )
+    client.create_bucket(Bucket=bucket)
+    return client, bucket
+
+
+@pytest.fixture
+def s3_arguments(s3_server, s3_bucket):
+    return dict(
+        aws_access_key="test",
+        aws_secret_key="test",
+        bucket=s3_bucket[1],
+        address=s3_server,
+        output_s3_region_name="us-east-1"
+    )
+
+
+@pytest.fixture
+def prometheus():
+    # metrics are registered in global registry, they are removed after test so next test can register them again
+    before = set(prometheus_client.REGISTRY._collector_to_names)
+    yield Prometheus(run="test", prometheus_port=None)
+    for collector in set(prometheus_client.REGISTRY._collector_to_names) - before:
+        prometheus_client.REGISTRY.unregister(collector)
+
+
+@pytest.fixture
+def mock_server():
+    # starts mock servers with given options in background thread, returns their openai base url
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    runners = []
+
+    def start(**options) -> str:
+        async def serve() -> int:
+            runner = web.AppRunner(MockServer(**options).app())
+            await runner.setup()
+            site = web.TCPSite(runner, "127.0.0.1", 0)
+            await site.start()
+            runners.append(runner)
+            return runner.addresses[0][1]
+        port = asyncio.run_coroutine_threadsafe(serve(), loop).result()
+        return f"http://127.0.0.1:{port}/v1"
+
+    yield start
+    for runner in runners:
+        asyncio.run_coroutine_threadsafe(runner.cleanup(), loop).result()
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join()
+    loop.close()
+
+
+@pytest.fixture
+def chat_dataset(tmp_path):
+    def write(rows: int, max_tokens: int = 8):
+        path = tmp_path / "dataset.jsonl"
+        with open(path, "w") as file:
+            for i in range(rows):
+                file.write(json.dumps({"custom_id": i, "body": {"messages": [{"role": "user", "content": "hi"}], "max_tokens": max_tokens}}) + "\n")
+        return path
+    return write
@@ -0,0 +1,73 @@
+import json
+import asyncio
+
+import pytest
+
+from strawberry.arguments import parse_arguments
+from strawberry.factory import local_input_output_factory, run_factory
+
+
+def batch_arguments(base_url: str, dataset, output, *extra: str):
+    return parse_arguments([
+        "--run_name_prefix", "test",
+        "--prometheus_port", "0",
+        "--openai_base_url", base_url,
+        "--model_name", "mock",
+        "--mode", "batch",
+        "--run_time", "60",
+        "--input", "local",
+        "--input_local_path", str(dataset),
+        "--output", "local",
+        "--output_local_path", str(output),
+        "--sampler", "finite",
+        *extra
+    ])
+
+
+def run_batch(arguments, prometheus):
+    _, output_dataset, sampler = local_input_output_factory(arguments)
+    run = run_factory(arguments, prometheus, sampler, output_dataset)
+    asyncio.run(run.start())
+    return run
+
+
+def test_limit_grows_above_default_users(mock_server, chat_dataset, tmp_path, prometheus):
+    base_url = mock_server(prefill_delay=0.02, token_delay=0.001)
+    arguments = batch_arguments(base_url, chat_dataset(600), tmp_path / "output", "--batch_control_interval", "0.02")
+    run = run_batch(arguments, prometheus)
+
+    # --max_users of closed mode is 8 by default, it must not cap adaptive limit
+    assert run._controller.limit > arguments.max_users
+    assert len(list((tmp_path / "output").iterdir())) == 600
+
+
+def test_retryable_errors_are_sent_again(mock_server, chat_dataset, tmp_path, prometheus):
+    base_url = mock_server(prefill_delay=0.01, token_delay=0.001, error_rate=0.3, error_code=503)
+    arguments = batch_arguments(base_url, chat_dataset(50), tmp_path / "output", "--max_retries", "100", "--retry_backoff", "0.01")
+    run_batch(arguments, prometheus)
+
+    responses = [json.loads(path.read_text()) for path in (tmp_path / "output").iterdir()]
+    assert len(responses) == 50
+    assert all(response["status_code"] == 200 for response in responses)
+
+
+def test_batch_mode_rejects_sampler_without_retries(chat_dataset, tmp_path, prometheus):
+    arguments = batch_arguments("http://127.0.0.1:1/v1", chat_dataset(1), tmp_path / "output")
+    arguments.sampler = "infinite"
+    _, output_dataset, sampler = local_input_output_factory(arguments)
+    with pytest.raises(ValueError, match="Batch mode needs finite sampler"):
+        run_factory(arguments, prometheus, sampler, output_dataset)
+
+
+def test_controller_backs_off_outside_steady_state(mock_server, chat_dataset, tmp_path, prometheus):
+    base_url = mock_server(prefill_delay=0.01, token_delay=0.001, error_rate=0.5, error_code=503)
+    # whole run is warmup so summary records nothing, controller still has to see overload
+    arguments = batch_arguments(
+        base_url, chat_dataset(100), tmp_path / "output",
+        "--warmup_time", "600", "--batch_control_interval", "0.05", "--max_retries", "100", "--retry_backoff", "0.01"
+    )
+    run = run_batch(arguments, prometheus)
+
+    assert prometheus.recorder.summary()["requests"]["completed"] == 0
+    assert run._controller.limit < arguments.batch_initial_users
+    assert len(list((tmp_path / "output").iterdir())) == 100
@@ -0,0 +1,70 @@
+import json
+import asyncio
+
+from strawberry.arguments import parse_arguments
+from strawberry.factory import local_input_output_factory, run_factory
+
+
+def greedy_dataset(tmp_path, rows: int):
+    path = tmp_path / "dataset.jsonl"
+    with open(path, "w") as file:
+        for i in range(rows):
+            file.write(json.dumps({"custom_id": i, "body": {"messages": [{"role": "user", "content": "hi"}], "max_tokens": 8, "temperature": 0}}) + "\n")
+    return path
+
+
+def run_with_cache(prometheus, base_url: str, tmp_path, *extra: str) -> dict:
+    arguments = parse_arguments([
+        "--run_name_prefix", "test",
+        "--prometheus_port", "0",
+        "--openai_base_url", base_url,
+        "--model_name", "mock",
+        "--max_users", "1",
+        "--spawn_rate", "0",
+        "--wait_start", "0",
+        "--wait_end", "0",
+        "--run_time", "30",
+        "--input", "local",
+        "--input_local_path", str(greedy_dataset(tmp_path, 10)),
+        "--output", "local",
+        "--output_local_path", str(tmp_path / "output"),
+        "--sampler", "finite",
+        "--response_cache_path", str(tmp_path / "cache.sqlite"),
+        "--timeline_path", str(tmp_path / "timeline.parquet"),
+        *extra
+    ])
+    _, output_dataset, sampler = local_input_output_factory(arguments)
+    asyncio.run(run_factory(arguments, prometheus, sampler, output_dataset).start())
+    return prometheus.recorder.summary()
+
+
+def test_cache_hits_are_counted_in_request_totals(mock_server, tmp_path, prometheus):
+    summary = run_with_cache(prometheus, mock_server(prefill_delay=0.01, token_delay=0.001), tmp_path)
+
+    assert summary["response_cache"] == {"hits": 9, "misses": 1}
+    assert summary["requests"]["completed"] == 10
+    assert summary["requests"]["response_codes"] == {"200": 10}
+    # only response of server has latency
+    assert summary["latency_seconds"]["request_latency"]["count"] == 1
+    assert len(list((tmp_path / "output").iterdir())) == 10
+
+
+def test_cache_key_has_model_of_endpoint(mock_server, tmp_path, prometheus):
+    base_url = mock_server(prefill_delay=0.01, token_delay=0.001)
+    endpoints = [
+        {"name": "a", "openai_base_url": base_url, "model_name": "mock-a"},
+        {"name": "b", "openai_base_url": base_url, "model_name": "mock-b"},
+    ]
+    (tmp_path / "endpoints.json").write_text(json.dumps(endpoints))
+    summary = run_with_cache(prometheus, base_url, tmp_path, "--endpoints", str(tmp_path / "endpoints.json"), "--routing", "round_robin")
+
+    # same body sent to other model is not answered with response of first one
+    assert summary["response_cache"] == {"hits": 8, "misses": 2}
+    assert summary["requests"]["completed"] == 10
+    assert summary["endpoints"]["a"]["requests"]["completed"] == 5
+    assert summary["endpoints"]["b"]["requests"]["completed"] == 5
+    if (tmp_path / "timeline.parquet").exists():
+        import pandas
+        timeline = pandas.read_parquet(tmp_path / "timeline.parquet")
+        assert timeline["cached"].sum() == 8
+        assert set(timeline[~timeline["cached"]]["endpoint"]) == {"a", "b"}
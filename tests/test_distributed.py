@@ -0,0 +1,108 @@
+import sys
+import time
+import socket
+import asyncio
+import subprocess
+from pathlib import Path
+
+import pytest
+
+from conftest import free_port
+from strawberry.arguments import parse_arguments
+from strawberry.distributed import Coordinator
+from strawberry.factory import local_input_output_factory, run_factory
+
+
+@pytest.fixture
+def agents():
+    # agents are separate processes like on real machines, every one registers its own metrics
+    processes, addresses = [], []
+    for _ in range(2):
+        port = free_port()
+        processes.append(subprocess.Popen(
+            [sys.executable, "-m", "strawberry.distributed", "--host", "127.0.0.1", "--port", str(port), "--prometheus_port", str(free_port())],
+            cwd=Path(__file__).parent.parent
+        ))
+        addresses.append(f"127.0.0.1:{port}")
+    for address in addresses:
+        wait_for_port(address)
+    yield addresses
+    for process in processes:
+        process.terminate()
+        process.wait()
+
+
+def wait_for_port(address: str, timeout: float = 30.0) -> None:
+    host, port = address.rsplit(":", 1)
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection((host, int(port)), timeout=0.1).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise TimeoutError(f"Agent {address} did not start")
+
+
+def agent_argv(base_url: str, dataset, output, *extra: str) -> list[str]:
+    return [
+        "--run_name_prefix", "test",
+        "--prometheus_port", "0",
+        "--openai_base_url", base_url,
+        "--model_name", "mock",
+        "--max_users", "4",
+        "--spawn_rate", "100",
+        "--wait_start", "0",
+        "--wait_end", "0",
+        "--run_time", "30",
+        "--input", "local",
+        "--input_local_path", str(dataset),
+        "--output", "local",
+        "--output_local_path", str(output),
+        "--sampler", "finite",
+        *extra
+    ]
+
+
+def test_agents_split_dataset_and_results_are_merged(agents, mock_server, chat_dataset, tmp_path):
+    base_url = mock_server(prefill_delay=0.01, token_delay=0.001)
+    argv = agent_argv(base_url, chat_dataset(40), tmp_path / "output")
+    recorder = asyncio.run(Coordinator(agents, argv, run_name="test", start_delay=0.5).start())
+
+    summary = recorder.summary()
+    # every agent processed its own partition, together they cover dataset once
+    assert summary["requests"]["completed"] == 40
+    assert summary["requests"]["response_codes"] == {"200": 40}
+    assert sorted(int(path.stem) for path in (tmp_path / "output").iterdir()) == list(range(40))
+
+
+def test_agent_failure_is_reported_before_start(agents, chat_dataset, tmp_path):
+    argv = agent_argv("http://127.0.0.1:1/v1", chat_dataset(4), tmp_path / "output", "--mode", "trace")
+    with pytest.raises(RuntimeError, match="Trace mode needs trace sampler"):
+        asyncio.run(Coordinator(agents, argv, run_name="test", start_delay=0.5).start())
+
+
+@pytest.mark.parametrize("mode", [[], ["--mode", "open", "--arrival_rate", "10"], ["--mode", "batch"]])
+def test_failed_start_barrier_closes_run(mode, chat_dataset, tmp_path, prometheus):
+    arguments = parse_arguments(agent_argv("http://127.0.0.1:1/v1", chat_dataset(4), tmp_path / "output", *mode))
+    _, output_dataset, sampler = local_input_output_factory(arguments)
+    closed = []
+
+    async def close_output() -> None:
+        closed.append("output")
+
+    async def start_barrier() -> None:
+        raise ConnectionError("coordinator is gone")
+
+    output_dataset.close = close_output
+    run = run_factory(arguments, prometheus, sampler, output_dataset, start_barrier=start_barrier)
+    close_requester = run._requester.close
+
+    async def close_requester_once() -> None:
+        closed.append("requester")
+        await close_requester()
+
+    run._requester.close = close_requester_once
+    with pytest.raises(ConnectionError):
+        asyncio.run(run.start())
+    assert closed == ["requester", "output"]
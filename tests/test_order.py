@@ -0,0 +1,53 @@
+import array
+import random
+import asyncio
+import tracemalloc
+
+from strawberry.dataset import FiniteSampler, DummyOutputDataset, IndexedInputDataset, prefix_order
+
+
+def reference_order(groups: list[int], expected: list[int]) -> list[int]:
+    longest = {}
+    for group, tokens in zip(groups, expected):
+        longest[group] = max(longest.get(group, 0), tokens)
+    return sorted(range(len(groups)), key=lambda i: (-longest[groups[i]], groups[i], -expected[i]))
+
+
+def test_prefix_order_groups_rows_and_puts_long_outputs_first():
+    rng = random.Random(0)
+    groups = [rng.randrange(50) * 7919 for _ in range(5000)]
+    expected = [rng.choice([0, 16, 128, 4096]) for _ in range(5000)]
+    order = prefix_order(array.array("Q", groups), array.array("Q", expected))
+    assert list(order) == reference_order(groups, expected)
+    assert list(prefix_order(array.array("Q"), array.array("Q"))) == []
+
+
+class GeneratedDataset(IndexedInputDataset):
+    # rows are made on read like rows of memory mapped file, only sampler keeps state
+    def __init__(self, rows: int) -> None:
+        self._rows = rows
+
+    async def build_index(self) -> int:
+        return self._rows
+
+    def read_row(self, index: int) -> dict:
+        return {
+            "custom_id": index,
+            "body": {"messages": [{"role": "system", "content": f"prompt {index % 1000}"}, {"role": "user", "content": "hi"}], "max_tokens": index % 4096}
+        }
+
+
+def test_prefix_order_of_huge_input_keeps_few_bytes_per_row():
+    rows = 50000
+    sampler = FiniteSampler(input_dataset=GeneratedDataset(rows), output_dataset=DummyOutputDataset(), overwrite=True, order="prefix")
+    tracemalloc.start()
+    try:
+        asyncio.run(sampler.prepare_data())
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    # keys of rows as python tuples took more than 250 bytes per row
+    assert peak / rows < 100
+    assert sorted(sampler._order) == list(range(rows))
+    first = sampler._next
+    assert first["body"]["max_tokens"] == 4095
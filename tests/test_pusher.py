@@ -0,0 +1,88 @@
+import os
+import time
+import socket
+import threading
+import http.server
+import urllib.parse
+
+import pytest
+import prometheus_client
+
+from strawberry.prometheus import MetricsPusher
+
+
+class Receiver(http.server.BaseHTTPRequestHandler):
+    def do_PUT(self):
+        body = self.rfile.read(int(self.headers["Content-Length"])).decode("utf-8")
+        self.server.pushes.append((self.command, self.path, body))
+        self.send_response(self.server.status)
+        self.end_headers()
+
+    do_POST = do_PUT
+
+    def log_message(self, *args):
+        ...
+
+
+@pytest.fixture
+def gateway():
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Receiver)
+    server.pushes = []
+    server.status = 200
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    thread.join()
+
+
+def counter_value(body: str) -> float:
+    for line in body.splitlines():
+        if line.startswith("test_requests_total"):
+            return float(line.split()[-1])
+    return None
+
+
+def test_metrics_are_pushed_periodically_and_on_stop(gateway):
+    registry = prometheus_client.CollectorRegistry()
+    counter = prometheus_client.Counter("test_requests", "Requests", registry=registry)
+    pusher = MetricsPusher(f"127.0.0.1:{gateway.server_port}", interval=0.05, registry=registry)
+    pusher.start()
+    time.sleep(0.3)
+    counter.inc(3)
+    pusher.stop()
+
+    assert len(gateway.pushes) >= 3
+    method, path, body = gateway.pushes[-1]
+    # every process pushes its own group and replaces it
+    assert method == "PUT"
+    assert urllib.parse.unquote(path) == f"/metrics/job/strawberry/instance/{socket.gethostname()}:{os.getpid()}"
+    # final push is made after last observation
+    assert counter_value(body) == 3.0
+    assert counter_value(gateway.pushes[0][2]) == 0.0
+
+
+def test_failing_gateway_does_not_stop_pushes(gateway):
+    gateway.status = 500
+    registry = prometheus_client.CollectorRegistry()
+    counter = prometheus_client.Counter("test_requests", "Requests", registry=registry)
+    pusher = MetricsPusher(f"127.0.0.1:{gateway.server_port}", interval=0.05, registry=registry)
+    pusher.start()
+    time.sleep(0.2)
+    failed = len(gateway.pushes)
+    gateway.status = 200
+    counter.inc()
+    pusher.stop()
+
+    assert failed >= 2
+    assert len(gateway.pushes) > failed
+    assert counter_value(gateway.pushes[-1][2]) == 1.0
+
+
+def test_unreachable_gateway_is_not_fatal():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    pusher = MetricsPusher(f"127.0.0.1:{port}", interval=60.0, registry=prometheus_client.CollectorRegistry())
+    pusher.start()
+    pusher.stop()
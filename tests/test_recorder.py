@@ -0,0 +1,100 @@
+import json
+import random
+
+import pytest
+import prometheus_client
+
+from strawberry.recorder import Recorder, LogLinearHistogram, WorkloadRecorder, percentile
+from strawberry.requester import RequestMetrics
+
+
+def test_histogram_percentiles_are_within_relative_error():
+    rng = random.Random(0)
+    values = [rng.lognormvariate(-4, 1.5) for _ in range(100000)]
+    histogram = LogLinearHistogram()
+    for value in values:
+        histogram.observe(value)
+
+    values.sort()
+    stats = histogram.statistics()
+    assert stats["count"] == len(values)
+    assert stats["mean"] == pytest.approx(sum(values) / len(values))
+    assert stats["min"] == values[0] and stats["max"] == values[-1]
+    for q in (50, 90, 99, 99.9):
+        assert stats[f"p{q:g}"] == pytest.approx(percentile(values, q), rel=1 / LogLinearHistogram.SUB_BUCKETS)
+    # memory depends on range of values, not on number of observations
+    assert len(histogram._counts) < 3000
+
+
+def test_histogram_keeps_zeros():
+    histogram = LogLinearHistogram()
+    for value in (0.0, 0.0, 0.0, 1.0):
+        histogram.observe(value)
+    assert histogram.percentile(50) == 0.0
+    assert histogram.percentile(99.9) == 1.0
+
+
+def test_chunk_series_are_bounded_and_request_series_exact():
+    recorder = Recorder()
+    workload = WorkloadRecorder(recorder, "chat")
+    for i in range(10000):
+        workload.observe("inter_chunk_latency", 0.01 + (i % 100) * 0.0001)
+    for value in (0.1, 0.2, 0.3):
+        workload.observe("request_latency", value)
+
+    assert "inter_chunk_latency" not in recorder._samples
+    assert len(recorder.samples("request_latency")) == 3
+    summary = recorder.summary()
+    assert summary["latency_seconds"]["inter_chunk_latency"]["count"] == 10000
+    assert summary["latency_seconds"]["request_latency"]["p50"] == 0.2
+    assert summary["workloads"]["chat"]["latency_seconds"]["inter_chunk_latency"]["count"] == 10000
+
+
+def test_merge_and_serialization_keep_histograms():
+    first, second = Recorder(), Recorder()
+    for i in range(100):
+        first.observe("inter_chunk_latency", 0.01)
+        first.observe("inter_chunk_latency", 0.01)
+        second.observe("inter_chunk_latency", 0.02)
+        second.observe("request_latency", 1.0)
+
+    # agents send recorders to coordinator as json
+    merged = Recorder.from_dict(json.loads(json.dumps(first.to_dict())))
+    merged.merge(Recorder.from_dict(json.loads(json.dumps(second.to_dict()))))
+    stats = merged.summary()["latency_seconds"]["inter_chunk_latency"]
+    assert stats["count"] == 300
+    assert stats["min"] == 0.01 and stats["max"] == 0.02
+    assert stats["p50"] == pytest.approx(0.01, rel=0.01)
+    assert stats["p99"] == pytest.approx(0.02, rel=0.01)
+    assert len(merged.samples("request_latency")) == 100
+
+
+def test_client_self_metrics_are_bounded():
+    recorder = Recorder()
+    for i in range(36000):
+        recorder.observe("event_loop_lag", 0.001 + (i % 50) * 0.0001)
+        recorder.observe("process_cpu_utilization", (i % 90) / 100)
+
+    assert "event_loop_lag" not in recorder._samples
+    assert "process_cpu_utilization" not in recorder._samples
+    summary = Recorder.from_dict(json.loads(json.dumps(recorder.to_dict()))).summary()
+    assert summary["latency_seconds"]["event_loop_lag"]["count"] == 36000
+    assert summary["client"]["max_cpu_utilization"] == 0.89
+    assert Recorder().summary()["client"]["max_cpu_utilization"] is None
+
+
+def test_tpot_of_request_and_chunk_gaps_are_exported_apart(prometheus):
+    metrics = RequestMetrics(prometheus)
+    for _ in range(5):
+        metrics.chunk()
+    metrics.usage(prompt_tokens=10, completion_tokens=20)
+    metrics.finish()
+    metrics.status_code(200)
+
+    labels = {"run": "test", "workload": "", "phase": "", "endpoint": ""}
+    # one tpot per request, one gap per chunk after first under new and original name
+    assert prometheus_client.REGISTRY.get_sample_value("request_tpot_seconds_count", labels) == 1
+    assert prometheus_client.REGISTRY.get_sample_value("request_inter_chunk_latency_seconds_count", labels) == 4
+    assert prometheus_client.REGISTRY.get_sample_value("request_time_per_output_token_latency_seconds_count", labels) == 4
+    # original buckets of deprecated metric are kept
+    assert prometheus_client.REGISTRY.get_sample_value("request_time_per_output_token_latency_seconds_bucket", {**labels, "le": "640.0"}) == 4
@@ -0,0 +1,59 @@
+import json
+import asyncio
+
+from strawberry.arguments import parse_arguments
+from strawberry.factory import local_input_output_factory, run_factory
+
+
+def run_with_endpoints(prometheus, endpoints: list[dict], dataset, tmp_path, *extra: str) -> dict:
+    endpoints_path = tmp_path / "endpoints.json"
+    endpoints_path.write_text(json.dumps(endpoints))
+    arguments = parse_arguments([
+        "--run_name_prefix", "test",
+        "--prometheus_port", "0",
+        "--openai_base_url", endpoints[0]["openai_base_url"],
+        "--model_name", "mock",
+        "--max_users", "1",
+        "--spawn_rate", "0",
+        "--wait_start", "0",
+        "--wait_end", "0",
+        "--run_time", "30",
+        "--input", "local",
+        "--input_local_path", str(dataset),
+        "--output", "local",
+        "--output_local_path", str(tmp_path / "output"),
+        "--sampler", "finite",
+        "--endpoints", str(endpoints_path),
+        *extra
+    ])
+    _, output_dataset, sampler = local_input_output_factory(arguments)
+    asyncio.run(run_factory(arguments, prometheus, sampler, output_dataset).start())
+    return prometheus.recorder.summary()
+
+
+def test_mirror_counts_every_sampled_request_once(mock_server, chat_dataset, tmp_path, prometheus):
+    endpoints = [
+        {"name": "a", "openai_base_url": mock_server(prefill_delay=0.01, token_delay=0.001)},
+        {"name": "b", "openai_base_url": mock_server(prefill_delay=0.02, token_delay=0.002)},
+    ]
+    summary = run_with_endpoints(prometheus, endpoints, chat_dataset(20), tmp_path, "--routing", "mirror", "--steady_requests", "10")
+
+    # window ends after 10 sampled requests, not after 10 copies of 5 of them
+    assert summary["requests"]["completed"] == 10
+    assert summary["window"]["cooldown_requests"] == 10
+    assert summary["latency_seconds"]["request_latency"]["count"] == 10
+    # every endpoint got every steady request
+    assert summary["endpoints"]["a"]["requests"]["completed"] == 10
+    assert summary["endpoints"]["b"]["requests"]["completed"] == 10
+    assert len(list((tmp_path / "output").iterdir())) == 20
+
+
+def test_routing_counts_requests_of_all_endpoints(mock_server, chat_dataset, tmp_path, prometheus):
+    base_url = mock_server(prefill_delay=0.01, token_delay=0.001)
+    endpoints = [{"name": "a", "openai_base_url": base_url}, {"name": "b", "openai_base_url": base_url}]
+    summary = run_with_endpoints(prometheus, endpoints, chat_dataset(20), tmp_path, "--routing", "round_robin", "--steady_requests", "10")
+
+    assert summary["requests"]["completed"] == 10
+    assert summary["window"]["cooldown_requests"] == 10
+    assert summary["endpoints"]["a"]["requests"]["completed"] == 5
+    assert summary["endpoints"]["b"]["requests"]["completed"] == 5
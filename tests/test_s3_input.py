@@ -0,0 +1,62 @@
+import gzip
+import json
+import asyncio
+
+import pytest
+import zstandard
+
+from strawberry.dataset import S3InputDataset
+
+
+def rows(start: int, count: int) -> list[dict]:
+    return [{"custom_id": i, "body": {"messages": [{"role": "user", "content": f"question {i} " * (i % 7)}]}} for i in range(start, start + count)]
+
+
+def jsonl(data: list[dict]) -> bytes:
+    return "".join(json.dumps(row) + "\n" for row in data).encode("utf-8")
+
+
+def read(s3_server, bucket: str, path: str, chunk_size: int = 64, prefetch: int = 3) -> list[dict]:
+    dataset = S3InputDataset(
+        aws_access_key="test",
+        aws_secret_key="test",
+        bucket=bucket,
+        address=s3_server,
+        path=path,
+        input_s3_region_name="us-east-1",
+        chunk_size=chunk_size,
+        prefetch=prefetch
+    )
+    return asyncio.run(dataset.read_all_data())
+
+
+def test_single_object_is_read_in_ranges(s3_server, s3_bucket):
+    client, bucket = s3_bucket
+    data = rows(0, 200)
+    # last row has no trailing newline
+    client.put_object(Bucket=bucket, Key="input/dataset.jsonl", Body=jsonl(data)[:-1])
+    assert read(s3_server, bucket, "input/dataset.jsonl") == data
+
+
+def test_prefix_is_read_in_key_order_with_codecs(s3_server, s3_bucket):
+    client, bucket = s3_bucket
+    plain, gzipped, zstd = rows(0, 50), rows(50, 50), rows(100, 50)
+    client.put_object(Bucket=bucket, Key="input/part-2.jsonl.zst", Body=zstandard.ZstdCompressor().compress(jsonl(zstd)))
+    client.put_object(Bucket=bucket, Key="input/part-0.jsonl", Body=jsonl(plain))
+    # gzip of two concatenated members
+    client.put_object(Bucket=bucket, Key="input/part-1.jsonl.gz", Body=gzip.compress(jsonl(gzipped[:20])) + gzip.compress(jsonl(gzipped[20:])))
+    client.put_object(Bucket=bucket, Key="input/empty.jsonl", Body=b"")
+    assert read(s3_server, bucket, "input/") == plain + gzipped + zstd
+
+
+def test_large_chunks_and_prefetch(s3_server, s3_bucket):
+    client, bucket = s3_bucket
+    data = rows(0, 1000)
+    client.put_object(Bucket=bucket, Key="input/dataset.jsonl", Body=jsonl(data))
+    assert read(s3_server, bucket, "input/dataset.jsonl", chunk_size=4096, prefetch=1) == data
+
+
+def test_missing_prefix_fails(s3_server, s3_bucket):
+    _, bucket = s3_bucket
+    with pytest.raises(ValueError, match="No objects found"):
+        read(s3_server, bucket, "missing/")
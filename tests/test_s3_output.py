@@ -0,0 +1,141 @@
+import os
+import gzip
+import json
+import asyncio
+
+import pytest
+import zstandard
+
+from strawberry.dataset import ShardedS3OutputDataset
+
+
+def responses(count: int, size: int = 64) -> list[dict]:
+    # random hex content does not compress so shard sizes stay predictable
+    return [{"custom_id": f"id-{i}", "content": os.urandom(size // 2).hex()} for i in range(count)]
+
+
+def write_all(output: ShardedS3OutputDataset, rows: list[dict]) -> None:
+    async def run() -> None:
+        for row in rows:
+            await output.write_single_response(row)
+        await output.close()
+    asyncio.run(run())
+
+
+def read_shards(client, bucket: str, codec: str | None) -> list[dict]:
+    rows = []
+    for obj in client.list_objects_v2(Bucket=bucket, Prefix="run/shards/").get("Contents", []):
+        content = client.get_object(Bucket=bucket, Key=obj["Key"])["Body"].read()
+        if codec == "gzip":
+            content = gzip.decompress(content)
+        elif codec == "zstd":
+            content = zstandard.ZstdDecompressor().decompress(content)
+        rows.extend(json.loads(line) for line in content.decode("utf-8").splitlines())
+    return rows
+
+
+def test_large_shard_is_uploaded_in_parts(s3_bucket, s3_arguments):
+    client, bucket = s3_bucket
+    rows = responses(12, size=1024 * 1024)
+    output = ShardedS3OutputDataset(base_path="run", shard_size=64 * 1024 * 1024, part_size=5 * 1024 * 1024, **s3_arguments)
+    write_all(output, rows)
+
+    keys = [obj["Key"] for obj in client.list_objects_v2(Bucket=bucket, Prefix="run/shards/")["Contents"]]
+    assert len(keys) == 1
+    # etag of multipart object ends with number of parts
+    assert client.head_object(Bucket=bucket, Key=keys[0])["ETag"].strip('"').endswith("-3")
+    assert read_shards(client, bucket, None) == rows
+
+
+@pytest.mark.parametrize("codec", [None, "gzip", "zstd"])
+def test_codec_round_trip(s3_bucket, s3_arguments, codec):
+    client, bucket = s3_bucket
+    rows = responses(100)
+    output = ShardedS3OutputDataset(base_path="run", shard_size=1024, codec=codec, **s3_arguments)
+    write_all(output, rows)
+
+    keys = [obj["Key"] for obj in client.list_objects_v2(Bucket=bucket, Prefix="run/shards/")["Contents"]]
+    extension = {None: ".jsonl", "gzip": ".jsonl.gz", "zstd": ".jsonl.zst"}[codec]
+    assert len(keys) > 1
+    assert all(key.endswith(extension) for key in keys)
+    assert sorted(read_shards(client, bucket, codec), key=lambda row: int(row["custom_id"][3:])) == rows
+
+
+def test_resume_reads_ids_from_manifests(s3_bucket, s3_arguments):
+    rows = responses(50)
+    write_all(ShardedS3OutputDataset(base_path="run", shard_size=512, **s3_arguments), rows[:30])
+
+    async def processed_ids() -> set:
+        output = ShardedS3OutputDataset(base_path="run", shard_size=512, **s3_arguments)
+        try:
+            return await output.get_processed_ids()
+        finally:
+            await output.close()
+
+    assert asyncio.run(processed_ids()) == {row["custom_id"] for row in rows[:30]}
+    write_all(ShardedS3OutputDataset(base_path="run", shard_size=512, **s3_arguments), rows[30:])
+    assert asyncio.run(processed_ids()) == {row["custom_id"] for row in rows}
+
+
+def test_permanent_error_fails_run_without_retries(s3_server, s3_arguments):
+    output = ShardedS3OutputDataset(
+        base_path="run",
+        shard_size=1,
+        upload_backoff=60.0,
+        **{**s3_arguments, "bucket": "missing-bucket"}
+    )
+
+    async def run() -> None:
+        await output.write_single_response({"custom_id": "id-0"})
+        # missing bucket is not retried so upload fails long before first backoff would end
+        await asyncio.wait_for(asyncio.gather(*output._uploads, return_exceptions=True), timeout=30)
+        await output.write_single_response({"custom_id": "id-1"})
+
+    with pytest.raises(RuntimeError, match="NoSuchBucket"):
+        asyncio.run(run())
+
+
+def test_transient_error_is_retried(s3_bucket, s3_arguments):
+    client, bucket = s3_bucket
+    output = ShardedS3OutputDataset(base_path="run", shard_size=1, upload_backoff=0.01, **s3_arguments)
+    failures = []
+
+    async def run() -> None:
+        s3_client = await output._get_client()
+        put_object = s3_client.put_object
+
+        async def flaky_put_object(**kwargs):
+            if len(failures) < 2:
+                failures.append(kwargs["Key"])
+                raise ConnectionError("connection reset")
+            return await put_object(**kwargs)
+
+        s3_client.put_object = flaky_put_object
+        await output.write_single_response({"custom_id": "id-0"})
+        await output.close()
+
+    asyncio.run(run())
+    assert len(failures) == 2
+    assert read_shards(client, bucket, None) == [{"custom_id": "id-0"}]
+
+
+def test_uploads_are_bounded(s3_bucket, s3_arguments):
+    output = ShardedS3OutputDataset(base_path="run", shard_size=1, upload_concurrency=2, **s3_arguments)
+    in_flight = []
+
+    async def run() -> None:
+        upload_shard = output._upload_shard
+
+        async def slow_upload_shard(*args):
+            in_flight.append(len(output._uploads))
+            await asyncio.sleep(0.05)
+            await upload_shard(*args)
+
+        output._upload_shard = slow_upload_shard
+        for row in responses(10):
+            await output.write_single_response(row)
+        await output.close()
+
+    asyncio.run(run())
+    assert len(in_flight) == 10
+    assert max(in_flight) <= 2
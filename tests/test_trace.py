@@ -0,0 +1,39 @@
+import json
+import asyncio
+
+from loguru import logger
+
+from strawberry.arguments import parse_arguments
+from strawberry.factory import local_input_output_factory, run_factory
+
+
+def test_trace_cut_by_run_time_reports_dropped_requests(mock_server, tmp_path, prometheus):
+    path = tmp_path / "trace.jsonl"
+    with open(path, "w") as file:
+        for i in range(10):
+            file.write(json.dumps({"timestamp": i * 0.5, "custom_id": i, "body": {"messages": [{"role": "user", "content": "hi"}], "max_tokens": 8}}) + "\n")
+    arguments = parse_arguments([
+        "--run_name_prefix", "test",
+        "--prometheus_port", "0",
+        "--openai_base_url", mock_server(prefill_delay=0.01, token_delay=0.001),
+        "--model_name", "mock",
+        "--max_users", "4",
+        "--run_time", "1",
+        "--mode", "trace",
+        "--input", "local_stream",
+        "--input_local_path", str(path),
+        "--output", "local",
+        "--output_local_path", str(tmp_path / "output"),
+        "--sampler", "trace",
+    ])
+    _, output_dataset, sampler = local_input_output_factory(arguments)
+    warnings = []
+    sink = logger.add(warnings.append, level="WARNING", format="{message}")
+    try:
+        asyncio.run(run_factory(arguments, prometheus, sampler, output_dataset).start())
+    finally:
+        logger.remove(sink)
+
+    # rows at 0 and 0.5 seconds fit in run time, other 8 are dropped
+    assert prometheus.recorder.summary()["requests"]["completed"] == 2
+    assert any("8 requests of trace were not sent" in message for message in warnings)
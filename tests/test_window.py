@@ -0,0 +1,92 @@
+import asyncio
+
+import pytest
+
+from strawberry.window import MeasurementWindow
+from strawberry.recorder import Recorder
+from strawberry.requester import RequestMetrics
+from strawberry.arguments import parse_arguments
+from strawberry.factory import local_input_output_factory, run_factory
+
+
+class Clock:
+    def __init__(self) -> None:
+        self.now = 100.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr("strawberry.window.time.perf_counter", clock)
+    monkeypatch.setattr("strawberry.requester.time.perf_counter", clock)
+    return clock
+
+
+def test_steady_overlap_clips_intervals_to_window(clock):
+    window = MeasurementWindow(warmup_time=10.0, cooldown_time=10.0)
+    window.start(Recorder())
+    window.set_deadline(30.0)
+    # steady state is [110, 120]
+    assert window.steady_overlap(100.0, 105.0) == 0.0
+    clock.now = 115.0
+    assert window.phase() == "steady"
+    assert window.steady_overlap(105.0, 115.0) == pytest.approx(5.0)
+    assert window.steady_overlap(111.0, 115.0) == pytest.approx(4.0)
+    clock.now = 125.0
+    assert window.phase() == "cooldown"
+    assert window.steady_overlap(105.0, 125.0) == pytest.approx(10.0)
+    assert window.steady_overlap(118.0, 125.0) == pytest.approx(2.0)
+    assert window.steady_overlap(121.0, 125.0) == 0.0
+
+
+def test_time_in_flight_is_clipped_to_steady_state(clock, prometheus):
+    window = MeasurementWindow(warmup_time=10.0, cooldown_time=10.0)
+    prometheus.set_window(window)
+    window.start(prometheus.recorder)
+    window.set_deadline(30.0)
+
+    clock.now = 105.0
+    started_in_warmup = RequestMetrics(prometheus)
+    clock.now = 115.0
+    started_in_warmup.status_code(200)
+    clock.now = 119.0
+    ends_in_cooldown = RequestMetrics(prometheus)
+    clock.now = 126.0
+    ends_in_cooldown.status_code(200)
+    window.stop()
+
+    # 5 seconds of first request and 1 second of second one are inside steady state [110, 120]
+    assert prometheus.recorder.counter("in_flight_seconds") == pytest.approx(6.0)
+    assert prometheus.recorder.summary()["throughput"]["concurrency"] == pytest.approx(0.6)
+
+
+def test_steady_concurrency_is_not_overcounted(mock_server, chat_dataset, tmp_path, prometheus):
+    base_url = mock_server(prefill_delay=0.05, token_delay=0.01)
+    arguments = parse_arguments([
+        "--run_name_prefix", "test",
+        "--prometheus_port", "0",
+        "--openai_base_url", base_url,
+        "--model_name", "mock",
+        "--max_users", "4",
+        "--spawn_rate", "0",
+        "--wait_start", "0",
+        "--wait_end", "0",
+        "--run_time", "3",
+        "--warmup_time", "0.5",
+        "--cooldown_time", "0.5",
+        "--input", "local",
+        "--input_local_path", str(chat_dataset(10, max_tokens=32)),
+        "--output", "local",
+        "--output_local_path", str(tmp_path / "output"),
+        "--overwrite",
+        "--sampler", "infinite",
+    ])
+    _, output_dataset, sampler = local_input_output_factory(arguments)
+    asyncio.run(run_factory(arguments, prometheus, sampler, output_dataset).start())
+
+    # users send back to back so there are always 4 requests in flight, but never more
+    concurrency = prometheus.recorder.summary()["throughput"]["concurrency"]
+    assert 3.5 < concurrency <= 4.0 + 1e-6
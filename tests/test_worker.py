@@ -0,0 +1,60 @@
+import shutil
+import urllib.request
+
+from prometheus_client.parser import text_string_to_metric_families
+
+from conftest import free_port
+from strawberry.arguments import parse_arguments
+from strawberry.worker import WorkerPool
+
+
+def scrape(port: int) -> dict:
+    # value of every sample summed over label sets
+    with urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics") as response:
+        text = response.read().decode("utf-8")
+    values = {}
+    for family in text_string_to_metric_families(text):
+        for sample in family.samples:
+            values[sample.name] = values.get(sample.name, 0.0) + sample.value
+    return values
+
+
+def test_workers_split_dataset_and_metrics_are_merged(mock_server, chat_dataset, tmp_path, monkeypatch):
+    # pool sets multiprocess directory of this process, it is restored after test
+    monkeypatch.setenv("PROMETHEUS_MULTIPROC_DIR", "")
+    # directory is kept until metrics of finished workers are scraped
+    directories, rmtree = [], shutil.rmtree
+    monkeypatch.setattr("strawberry.worker.shutil.rmtree", lambda path, ignore_errors=False: directories.append(path))
+    port = free_port()
+    arguments = parse_arguments([
+        "--run_name_prefix", "test",
+        "--prometheus_port", str(port),
+        "--openai_base_url", mock_server(prefill_delay=0.01, token_delay=0.001),
+        "--model_name", "mock",
+        "--max_users", "4",
+        "--spawn_rate", "0",
+        "--wait_start", "0",
+        "--wait_end", "0",
+        "--run_time", "30",
+        "--input", "local",
+        "--input_local_path", str(chat_dataset(20)),
+        "--output", "local",
+        "--output_local_path", str(tmp_path / "output"),
+        "--sampler", "finite",
+        "--workers", "2",
+    ])
+    try:
+        recorder = WorkerPool(arguments, run_name="test", workers=2).start()
+        metrics = scrape(port)
+    finally:
+        for directory in directories:
+            rmtree(directory, ignore_errors=True)
+
+    # recorders of both workers are merged, together they cover dataset once
+    summary = recorder.summary()
+    assert summary["requests"]["completed"] == 20
+    assert summary["requests"]["response_codes"] == {"200": 20}
+    assert sorted(int(path.stem) for path in (tmp_path / "output").iterdir()) == list(range(20))
+    # parent serves counters of all worker processes summed
+    assert metrics["requests_count_total"] == 20
+    assert metrics["response_code_total"] == 20